@@ -0,0 +1,90 @@
+"""Throughput of ZmfSession against a local stub server
+
+Compares kept alive pooled connections with a new connection per request,
+for a number of concurrent workers. The stub answers like ZMF without any
+processing time, so the difference is the cost of opening connections.
+
+    python benchmarks/connection_pool.py --requests 2000
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from zmfcli.session import ZmfSession
+
+RESPONSE = json.dumps(
+    {
+        "returnCode": "00",
+        "message": "CMN8700I - LIST service completed",
+        "reasonCode": "8700",
+        "result": [],
+    }
+).encode()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        length = int(self.headers.get("content-length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(RESPONSE)))
+        if self.close_connection:
+            self.send_header("connection", "close")
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def run(url: str, n: int, workers: int, keep_alive: bool) -> float:
+    session = ZmfSession(url, pool_maxsize=workers, keep_alive=keep_alive)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(
+            lambda _: session.result_get("component", data={"package": "X"}),
+            range(n),
+        ):
+            pass
+    return n / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/zmfrest/".format(server.server_address[1])
+
+    print("{:>8} {:>14} {:>14}".format("workers", "keep-alive", "close"))
+    for workers in args.workers:
+        print(
+            "{:>8} {:>10.0f} r/s {:>10.0f} r/s".format(
+                workers,
+                run(url, args.requests, workers, keep_alive=True),
+                run(url, args.requests, workers, keep_alive=False),
+            )
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
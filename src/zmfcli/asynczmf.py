@@ -0,0 +1,621 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+
+from types import TracebackType
+from typing import (
+    Any,
+    Awaitable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+from urllib.parse import urljoin
+
+import aiohttp
+
+from .constants import (
+    ZmfResult,
+    EXIT_CODE_REQUEST_NOK,
+    EXIT_CODE_ZMF_NOK,
+)
+from .params import (
+    browse_params,
+    build_chunks,
+    build_params,
+    checkin_chunks,
+    component_params,
+    create_params,
+    delete_chunks,
+    delete_package_params,
+    load_component_params,
+    package_job_params,
+    package_list_params,
+    promotion_params,
+    revert_params,
+    scratch_chunks,
+    search_params,
+    search_terms,
+    select_package,
+    str_or_none,
+)
+from .session import check_payload
+from .zmf import prepare_bools, to_path
+
+T = TypeVar("T")
+
+
+class ZmfError(Exception):
+    """Failed ZMF request, `code` is the exit code the cli would use"""
+
+    def __init__(self, code: Union[str, int, None]) -> None:
+        super().__init__(code)
+        self.code = code
+
+
+class AsyncZmfSession:
+    def __init__(
+        self, prefix_url: str, auth: Tuple[str, str], limit: int = 10
+    ) -> None:
+        self.prefix_url = prefix_url
+        self.logger = logging.getLogger(__name__)
+        self.limit = limit
+        self._headers = {
+            "Authorization": "Basic "
+            + base64.b64encode(":".join(auth).encode("latin-1")).decode()
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def client(self) -> Tuple[aiohttp.ClientSession, asyncio.Semaphore]:
+        # created lazily, both need to be bound to the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self._headers,
+                connector=aiohttp.TCPConnector(limit=self.limit),
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._session, self._semaphore
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
+
+    async def request_result(
+        self, method: str, url: str, data: Dict[str, Any]
+    ) -> Optional[ZmfResult]:
+        session, semaphore = self.client()
+        req_url = urljoin(self.prefix_url, url)
+        async with semaphore:
+            self.logger.info("%s %s", method, req_url)
+            self.logger.info(data)
+            async with session.request(
+                method, req_url, data=form_fields(data)
+            ) as resp:
+                return await unpack_response(resp, self.logger)
+
+    async def result_get(
+        self, url: str, data: Dict[str, Any]
+    ) -> Optional[ZmfResult]:
+        return await self.request_result("GET", url, data)
+
+    async def result_post(
+        self, url: str, data: Dict[str, Any]
+    ) -> Optional[ZmfResult]:
+        return await self.request_result("POST", url, data)
+
+    async def result_put(
+        self, url: str, data: Dict[str, Any]
+    ) -> Optional[ZmfResult]:
+        return await self.request_result("PUT", url, data)
+
+    async def result_delete(
+        self, url: str, data: Dict[str, Any]
+    ) -> Optional[ZmfResult]:
+        return await self.request_result("DELETE", url, data)
+
+
+async def unpack_response(
+    resp: aiohttp.ClientResponse, logger: logging.Logger
+) -> Optional[ZmfResult]:
+    if not resp.ok:
+        logger.info(await resp.text())
+        logger.error("{} {}".format(resp.status, resp.reason))
+        raise ZmfError(EXIT_CODE_REQUEST_NOK)
+    t = resp.headers.get("content-type", "")
+    if not t.startswith("application/json"):
+        logger.error(
+            "Expected content-type 'application/json' actual '{}'".format(t)
+        )
+        raise ZmfError(EXIT_CODE_ZMF_NOK)
+    payload = await resp.json(content_type=None)
+    try:
+        return check_payload(payload, logger)
+    except SystemExit as e:
+        raise ZmfError(e.code) from None
+
+
+class AsyncChangemanZmf:
+    """
+    asyncio client for ZMF REST API
+
+    Provides the commands of `ChangemanZmf` as coroutines. Up to `limit`
+    requests are in flight at the same time, failed requests raise
+    `ZmfError` instead of exiting.
+
+        async with AsyncChangemanZmf(limit=20) as zmf:
+            await asyncio.gather(zmf.audit(pkg1), zmf.audit(pkg2))
+    """
+
+    def __init__(
+        self,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        url: Optional[str] = None,
+        limit: int = 10,
+    ) -> None:
+        self.url: str = url if url else os.environ["ZMF_REST_URL"]
+        self.__user: str = user if user else os.environ["ZMF_REST_USER"]
+        self.__password: str = (
+            password if password else os.environ["ZMF_REST_PWD"]
+        )
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.__session = AsyncZmfSession(
+            self.url, (self.__user, self.__password), limit
+        )
+
+    async def __aenter__(self) -> "AsyncChangemanZmf":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.__session.close()
+
+    async def _get(
+        self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Optional[ZmfResult]:
+        return await self.__session.result_get(
+            to_path(path_name), prepare_bools(params)
+        )
+
+    async def _post(
+        self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Optional[ZmfResult]:
+        return await self.__session.result_post(
+            to_path(path_name), prepare_bools(params)
+        )
+
+    async def _put(
+        self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Optional[ZmfResult]:
+        return await self.__session.result_put(
+            to_path(path_name), prepare_bools(params)
+        )
+
+    async def _delete(
+        self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Optional[ZmfResult]:
+        return await self.__session.result_delete(
+            to_path(path_name), prepare_bools(params)
+        )
+
+    async def checkin(
+        self,
+        package: str,
+        pds: str,
+        components: Optional[Iterable[str]] = None,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+    ) -> None:
+        """Checkin components to Changeman from a partitioned dataset (PDS)"""
+        selected = await self._select(components, since, range)
+        await gather_ordered(
+            [
+                (chunk.label, self._put("component_checkin", **chunk.params))
+                for chunk in checkin_chunks(package, pds, selected)
+            ],
+            self.logger,
+        )
+
+    async def delete(
+        self,
+        package: str,
+        component: Union[str, Iterable[str]],
+        componentType: Optional[str] = None,
+    ) -> None:
+        """Delete components, names of `componentType` or typed paths"""
+        components = [component] if isinstance(component, str) else component
+        await gather_ordered(
+            [
+                (chunk.label, self._delete("component", **chunk.params))
+                for chunk in delete_chunks(package, components, componentType)
+            ],
+            self.logger,
+        )
+
+    async def build(
+        self,
+        package: str,
+        components: Optional[Iterable[str]] = None,
+        procedure: Optional[str] = None,
+        language: Optional[str] = None,
+        db2Precompile: Optional[bool] = None,
+        useHistory: Optional[bool] = None,
+        params: Optional[Dict[str, str]] = None,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+    ) -> None:
+        """Build source like components"""
+        selected = await self._select(components, since, range)
+        options = build_params(
+            self.__user, procedure, language, db2Precompile, useHistory, params
+        )
+        await gather_ordered(
+            [
+                (chunk.label, self._put("component_build", **chunk.params))
+                for chunk in build_chunks(
+                    package, selected, options, chunk_size
+                )
+            ],
+            self.logger,
+        )
+
+    async def scratch(
+        self,
+        package: str,
+        components: Optional[Iterable[str]] = None,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+    ) -> None:
+        """Scratch components, with `since`/`range` files deleted in git"""
+        selected = await self._select(components, since, range, deleted=True)
+        await gather_ordered(
+            [
+                (chunk.label, self._put("component_scratch", **chunk.params))
+                for chunk in scratch_chunks(package, selected)
+            ],
+            self.logger,
+        )
+
+    async def _select(
+        self,
+        components: Optional[Iterable[str]],
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+        deleted: bool = False,
+    ) -> List[str]:
+        """Given components and those changed, or deleted, in git"""
+        selected = list(components or [])
+        if since is None and range is None:
+            return selected
+        from .gitdiff import EXIT_CODE_GIT_NOK, GitError, git_changes
+
+        loop = asyncio.get_running_loop()
+        try:
+            changed, removed = await loop.run_in_executor(
+                None, git_changes, since, range
+            )
+        except GitError as e:
+            self.logger.error(e)
+            raise ZmfError(EXIT_CODE_GIT_NOK) from None
+        selected.extend(removed if deleted else changed)
+        return selected
+
+    async def audit(self, package: str) -> None:
+        await self._put(
+            "package_audit",
+            **package_job_params(self.__user, "audit", package),
+        )
+
+    async def promote(
+        self,
+        package: str,
+        promSiteName: str,
+        promLevel: int,
+        promName: str,
+        overlay: Optional[bool] = None,
+    ) -> None:
+        """Promote a package"""
+        await self._put(
+            "package_promote",
+            **promotion_params(
+                self.__user,
+                "promote",
+                package,
+                promSiteName,
+                promLevel,
+                promName,
+                overlay,
+            ),
+        )
+
+    async def demote(
+        self,
+        package: str,
+        promSiteName: str,
+        promLevel: int,
+        promName: str,
+    ) -> None:
+        """Demote a package"""
+        await self._put(
+            "package_demote",
+            **promotion_params(
+                self.__user,
+                "demote",
+                package,
+                promSiteName,
+                promLevel,
+                promName,
+            ),
+        )
+
+    async def freeze(self, package: str) -> None:
+        await self._put(
+            "package_freeze",
+            **package_job_params(self.__user, "freeze", package),
+        )
+
+    async def revert(
+        self, package: str, revertReason: Optional[str] = None
+    ) -> None:
+        await self._put(
+            "package_revert",
+            **revert_params(self.__user, package, revertReason),
+        )
+
+    async def search_package(
+        self,
+        applName: str,
+        packageTitle: str,
+        workChangeRequest: Optional[str] = None,
+    ) -> Optional[str]:
+        result = await self._get(
+            "package_search",
+            **search_params(applName, packageTitle, workChangeRequest),
+        )
+        return select_package(result, packageTitle)
+
+    async def create_package(
+        self,
+        applName: Optional[str] = None,
+        packageTitle: Optional[str] = None,
+        workChangeRequest: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        result = await self._post(
+            "package",
+            **create_params(applName, packageTitle, workChangeRequest, params),
+        )
+        self.logger.info(result)
+        return str_or_none(result[0].get("package")) if result else None
+
+    async def delete_package(self, package: str) -> None:
+        await self._delete("package", **delete_package_params(package))
+
+    async def get_package(
+        self,
+        applName: Optional[str] = None,
+        packageTitle: Optional[str] = None,
+        workChangeRequest: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        """Search a package by title, create it if it does not exist"""
+        if params is not None and params.get("package"):
+            return params["package"]
+        pkg_id = None
+        search_app, search_title, search_request = search_terms(
+            applName, packageTitle, workChangeRequest, params
+        )
+        if search_app is not None and search_title is not None:
+            try:
+                pkg_id = await self.search_package(
+                    applName=search_app,
+                    packageTitle=search_title,
+                    workChangeRequest=search_request,
+                )
+            except ZmfError as e:
+                if e.code != EXIT_CODE_ZMF_NOK:
+                    raise
+        if not pkg_id:
+            pkg_id = await self.create_package(
+                applName=applName,
+                packageTitle=packageTitle,
+                workChangeRequest=workChangeRequest,
+                params=params,
+            )
+        return pkg_id
+
+    async def get_components(
+        self,
+        package: str,
+        componentType: Optional[str] = None,
+        component: Optional[str] = None,
+        targetComponent: Optional[str] = None,
+        filterActive: Optional[bool] = None,
+        filterIncomplete: Optional[bool] = None,
+        filterInactive: Optional[bool] = None,
+    ) -> Optional[ZmfResult]:
+        return await self._get(
+            "component",
+            **component_params(
+                package,
+                componentType,
+                component,
+                targetComponent,
+                filterActive,
+                filterIncomplete,
+                filterInactive,
+            ),
+        )
+
+    async def get_load_components(
+        self,
+        package: str,
+        sourceType: Optional[str] = None,
+        sourceComponent: Optional[str] = None,
+        targetType: Optional[str] = None,
+        targetComponent: Optional[str] = None,
+    ) -> Optional[ZmfResult]:
+        return await self._get(
+            "component_load",
+            **load_component_params(
+                package,
+                sourceType,
+                sourceComponent,
+                targetType,
+                targetComponent,
+            ),
+        )
+
+    async def get_package_list(
+        self,
+        package: str,
+        componentType: Optional[str] = None,
+        component: Optional[str] = None,
+        targetComponent: Optional[str] = None,
+    ) -> Optional[ZmfResult]:
+        return await self._get(
+            "component_packagelist",
+            **package_list_params(
+                package, componentType, component, targetComponent
+            ),
+        )
+
+    async def browse_component(
+        self,
+        package: str,
+        component: str,
+        componentType: str,
+        dest: Optional[str] = None,
+    ) -> Union[str, Dict[str, Any], None]:
+        """Browse a component, the attachment is returned or saved to `dest`
+
+        `dest` is a file, or a directory for a file named after the
+        content-disposition of the attachment.
+        """
+        session, semaphore = self.__session.client()
+        async with semaphore, session.get(
+            urljoin(self.url, "component/browse"),
+            data=browse_params(package, component, componentType),
+        ) as resp:
+            if not resp.ok:
+                self.logger.info(await resp.text())
+                self.logger.error("{} {}".format(resp.status, resp.reason))
+                raise ZmfError(EXIT_CODE_REQUEST_NOK)
+            self.logger.info(
+                {
+                    key: resp.headers.get(key)
+                    for key in ["content-type", "content-disposition"]
+                }
+            )
+            content_type = resp.headers.get("content-type", "")
+            content_disp = resp.headers.get("content-disposition", "")
+            if content_type.startswith("application/json"):
+                self.logger.warning(await resp.json(content_type=None))
+            elif content_type.startswith(
+                "text/plain"
+            ) and content_disp.startswith("attachment"):
+                if dest is None:
+                    return await resp.text()
+                return await self._save_attachment(
+                    resp, content_disp, dest, component
+                )
+            else:
+                self.logger.error(
+                    "Unexpected content-type '{}'".format(content_type)
+                )
+                raise ZmfError(EXIT_CODE_ZMF_NOK)
+        return None
+
+    async def _save_attachment(
+        self,
+        resp: aiohttp.ClientResponse,
+        content_disp: str,
+        dest: str,
+        default_name: str,
+    ) -> Dict[str, Any]:
+        """Stream the attachment to a file like `save_chunks`, through a
+        temporary file which replaces it once complete"""
+        from .download import DOWNLOAD_CHUNK_SIZE, attachment_name
+
+        path = dest
+        if os.path.isdir(dest):
+            path = os.path.join(
+                dest, attachment_name(content_disp) or default_name
+            )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + ".part"
+        size = 0
+        digest = hashlib.sha256()
+        loop = asyncio.get_running_loop()
+        try:
+            with open(tmp, "wb") as f:
+                async for chunk in resp.content.iter_chunked(
+                    DOWNLOAD_CHUNK_SIZE
+                ):
+                    await loop.run_in_executor(None, f.write, chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.logger.info("Saved %s, %d bytes", path, size)
+        return {"path": path, "bytes": size, "sha256": digest.hexdigest()}
+
+
+def form_fields(params: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Encode list values as repeated fields, like requests does"""
+    fields: List[Tuple[str, str]] = []
+    for key, value in params.items():
+        if isinstance(value, (list, tuple)):
+            fields.extend((key, str(v)) for v in value)
+        else:
+            fields.append((key, str(value)))
+    return fields
+
+
+async def gather_ordered(
+    aws: Sequence[Tuple[str, Awaitable[T]]], logger: logging.Logger
+) -> List[Optional[T]]:
+    """Await labelled awaitables concurrently, like `run_parallel`"""
+    results = await asyncio.gather(
+        *(aw for _, aw in aws), return_exceptions=True
+    )
+    values: List[Optional[T]] = []
+    failure: Optional[BaseException] = None
+    for (label, _), result in zip(aws, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, ZmfError):
+                logger.error("%s failed with exit code %s", label, result.code)
+            else:
+                logger.error("%s failed: %r", label, result)
+            if failure is None:
+                failure = result
+            values.append(None)
+        else:
+            values.append(result)
+    if failure is not None:
+        raise failure
+    return values
@@ -0,0 +1,127 @@
+import json
+import logging
+
+from typing import Any, Dict, IO, Iterator, List, Optional, Union
+
+EXIT_CODE_BATCH_NOK = 1
+NOT_BATCHABLE = ("batch", "daemon")
+BATCH_FORMATS = ("json", "yaml")
+
+BatchCommand = Dict[str, Any]
+
+
+class InvalidCommand:
+    """Input which can not be read as command, reported as failed"""
+
+    def __init__(self, error: str) -> None:
+        self.error = error
+
+
+def read_commands(
+    stream: IO[str], name: str = "-", format: Optional[str] = None
+) -> Iterator[Union[BatchCommand, InvalidCommand]]:
+    """Read commands from JSON lines, or from YAML for .yml/.yaml files
+
+    `format` "json" or "yaml" overrides the extension of `name`. JSON
+    lines are read one at a time, so commands can be piped in while the
+    batch is running. YAML needs PyYAML and is read at once, either as a
+    list of commands or as a stream of documents.
+    """
+    if format is None:
+        format = "yaml" if name.endswith((".yml", ".yaml")) else "json"
+    if format == "yaml":
+        import yaml  # type: ignore
+
+        try:
+            for doc in yaml.safe_load_all(stream):
+                if isinstance(doc, list):
+                    yield from doc
+                elif doc is not None:
+                    yield doc
+        except yaml.YAMLError as e:
+            yield InvalidCommand("Invalid YAML: {}".format(e))
+        return
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield InvalidCommand("Invalid JSON: {}".format(e))
+
+
+def run_command(
+    zmf: Any, command: Union[BatchCommand, InvalidCommand]
+) -> Dict[str, Any]:
+    if isinstance(command, InvalidCommand) or not isinstance(command, dict):
+        return {
+            "cmd": None,
+            "ok": False,
+            "exitCode": EXIT_CODE_BATCH_NOK,
+            "error": (
+                command.error
+                if isinstance(command, InvalidCommand)
+                else "Command is not an object: {!r}".format(command)
+            ),
+        }
+    record: Dict[str, Any] = {"cmd": command.get("cmd")}
+    if "id" in command:
+        record["id"] = command["id"]
+    name = str(command.get("cmd", "")).replace("-", "_")
+    args: Union[List[Any], Dict[str, Any]] = command.get("args", {})
+    if name.startswith("_") or name in NOT_BATCHABLE:
+        func = None
+    else:
+        func = getattr(zmf, name, None)
+    if not callable(func):
+        record.update(
+            ok=False,
+            exitCode=EXIT_CODE_BATCH_NOK,
+            error="Unknown command '{}'".format(command.get("cmd")),
+        )
+        return record
+    try:
+        if isinstance(args, list):
+            result = func(*args)
+        else:
+            result = func(**args)
+        if isinstance(result, Iterator):
+            # streamed records
+            result = list(result)
+    except SystemExit as e:
+        record.update(ok=False, exitCode=e.code)
+    except Exception as e:
+        record.update(ok=False, exitCode=EXIT_CODE_BATCH_NOK, error=repr(e))
+    else:
+        record.update(ok=True, result=result)
+    return record
+
+
+def run_batch(
+    zmf: Any,
+    commands: Iterator[Union[BatchCommand, InvalidCommand]],
+    out: IO[str],
+    logger: logging.Logger,
+    keep_going: bool = False,
+) -> Optional[Union[str, int]]:
+    """Run commands one after another, write one result line per command
+
+    Returns the exit code of the first failed command, remaining commands
+    are skipped unless `keep_going`.
+    """
+    exit_code = None
+    for command in commands:
+        record = run_command(zmf, command)
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        if not record["ok"]:
+            logger.error(
+                "%s failed with exit code %s",
+                record["cmd"],
+                record["exitCode"],
+            )
+            if exit_code is None:
+                exit_code = record["exitCode"]
+            if not keep_going:
+                break
+    return exit_code
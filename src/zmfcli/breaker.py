@@ -0,0 +1,109 @@
+"""Circuit breaker failing fast while the ZMF server is down"""
+
+import json
+import os
+import threading
+import time
+
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Optional
+
+from .singleflight import file_lock
+
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+BreakerState = Dict[str, Any]
+
+
+class CircuitBreaker:
+    """Open after `threshold` consecutive failures, for `cooldown` seconds
+
+    Once the cool-down is over one probe request is let through (half
+    open). Its success closes the circuit, its failure opens it again. If
+    the probe gets no outcome within the cool-down, another one is let
+    through. With `path` the state is kept in a file shared by processes.
+    """
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_BREAKER_THRESHOLD,
+        cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state: BreakerState = closed()
+
+    def check(self) -> float:
+        """0 if a request may be sent, else the seconds it stays open"""
+        with self.lock, self._shared():
+            state = self._load()
+            now = self.clock()
+            if now < state["openUntil"]:
+                return float(state["openUntil"] - now)
+            if state["failures"] < self.threshold:
+                return 0.0
+            if now < state["probeUntil"]:
+                return float(state["probeUntil"] - now)
+            state["probeUntil"] = now + self.cooldown
+            self._save(state)
+            return 0.0
+
+    def record(self, ok: bool) -> None:
+        with self.lock, self._shared():
+            state = self._load()
+            if ok:
+                if state != closed():
+                    self._save(closed())
+                return
+            state["failures"] += 1
+            if state["failures"] >= self.threshold:
+                state["openUntil"] = self.clock() + self.cooldown
+                state["probeUntil"] = 0
+            self._save(state)
+
+    @property
+    def failures(self) -> int:
+        with self.lock, self._shared():
+            return int(self._load()["failures"])
+
+    def _shared(self) -> ContextManager[Any]:
+        if self.path is None:
+            return nullcontext()
+        return file_lock(self.path + ".lock")
+
+    def _load(self) -> BreakerState:
+        if self.path is None:
+            return dict(self.state)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state: BreakerState = {**closed(), **json.load(f)}
+                return state
+        except (OSError, ValueError, TypeError):
+            return closed()
+
+    def _save(self, state: BreakerState) -> None:
+        if self.path is None:
+            self.state = state
+            return
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            # without a writable state file it is kept in the process
+            self.path = None
+            self.state = state
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+def closed() -> BreakerState:
+    return {"failures": 0, "openUntil": 0, "probeUntil": 0}
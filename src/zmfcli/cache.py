@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import quote, unquote
+
+from .constants import ZmfResult
+
+DEFAULT_CACHE_SIZE = 256
+
+CacheEntry = Tuple[float, str, Optional[ZmfResult]]
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "zmfcli")
+
+
+def normalize(params: Dict[str, Any]) -> Dict[str, Union[str, Iterable[str]]]:
+    return {
+        key: (
+            sorted(str(v) for v in value)
+            if isinstance(value, (list, tuple))
+            else str(value)
+        )
+        for key, value in params.items()
+    }
+
+
+class ResponseCache:
+    """TTL cache for results of read requests, in memory and on disk
+
+    Entries are keyed by namespace (url and user), endpoint and normalized
+    params, and tagged with the package they belong to. Both stores keep at
+    most `max_entries` and evict the least recently used ones. On disk the
+    tag is part of the file name, so entries of a package are invalidated
+    without reading them. If the directory can not be used, entries are
+    only kept in memory.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float,
+        directory: Optional[str] = None,
+        max_entries: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        self.namespace = namespace
+        self.ttl = ttl
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.logger = logging.getLogger(__name__)
+        if directory is not None:
+            try:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            except OSError as e:
+                self._memory_only(e)
+
+    def _memory_only(self, e: OSError) -> None:
+        self.logger.warning("Response cache kept in memory only: %s", e)
+        self.directory = None
+
+    def key(self, endpoint: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps(
+            [self.namespace, endpoint, normalize(params)], sort_keys=True
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(
+        self, endpoint: str, params: Dict[str, Any]
+    ) -> Tuple[bool, Optional[ZmfResult]]:
+        """Cached result, the flag tells a hit from a cached None"""
+        key = self.key(endpoint, params)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    return True, entry[2]
+                del self.entries[key]
+        entry = self._read(key, now)
+        if entry is None:
+            return False, None
+        with self.lock:
+            self._remember(key, entry)
+        return True, entry[2]
+
+    def put(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        result: Optional[ZmfResult],
+    ) -> None:
+        key = self.key(endpoint, params)
+        entry = (
+            time.time() + self.ttl,
+            str(params.get("package", "")),
+            result,
+        )
+        with self.lock:
+            self._remember(key, entry)
+        self._write(key, entry)
+
+    def invalidate(self, package: str) -> None:
+        """Drop entries of a package, and of searches which may match it"""
+        with self.lock:
+            for key in [
+                k for k, e in self.entries.items() if matches(e[1], package)
+            ]:
+                del self.entries[key]
+        if self.directory is None:
+            return
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            self._memory_only(e)
+            return
+        for name in names:
+            tag, sep, _ = name.rpartition("~")
+            if sep and matches(unquote(tag), package):
+                remove(os.path.join(self.directory, name))
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _path(self, key: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return None
+        for name in names:
+            if name.endswith("~" + key + ".json"):
+                return os.path.join(self.directory, name)
+        return None
+
+    def _read(self, key: str, now: float) -> Optional[CacheEntry]:
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data["expires"] <= now:
+            remove(path)
+            return None
+        # mtime is the last use for the LRU eviction on disk
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return data["expires"], data["tag"], data["result"]
+
+    def _write(self, key: str, entry: CacheEntry) -> None:
+        if self.directory is None:
+            return
+        expires, tag, result = entry
+        name = "{}~{}.json".format(quote(tag, safe=""), key)
+        path = os.path.join(self.directory, name)
+        tmp = os.path.join(
+            self.directory,
+            ".{}.{}.{}.tmp".format(key, os.getpid(), threading.get_ident()),
+        )
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"expires": expires, "tag": tag, "result": result}, f
+                )
+            os.replace(tmp, path)
+            now = time.time()
+            os.utime(path, (now, now))
+            self._evict()
+        except OSError as e:
+            # the request succeeded, its result is still cached in memory
+            remove(tmp)
+            self._memory_only(e)
+
+    def _evict(self) -> None:
+        assert self.directory is not None
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        files.sort()
+        for _, path in files[: max(0, len(files) - self.max_entries)]:
+            remove(path)
+
+
+def matches(tag: str, package: str) -> bool:
+    return tag == package or ("*" in tag and fnmatchcase(package, tag))
+
+
+def remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
@@ -0,0 +1,48 @@
+"""Constants and types shared by all modules
+
+Kept free of third party imports, so the cli can start without loading
+requests.
+"""
+
+from typing import Dict, List, TypedDict, Union
+
+EXIT_CODE_REQUEST_NOK = 2
+EXIT_CODE_ZMF_NOK = 3
+ZMF_STATUS_OK = "00"
+ZMF_STATUS_INFO = "04"
+ZMF_STATUS_FAILURE = "08"
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+# POST creates packages, retrying it could create duplicates
+MUTATING_METHODS = ("PUT", "DELETE")
+
+# codes of componentStatus, e.g. "0 - Active"
+COMP_STATUS = {
+    "Active": "0",
+    "Approved": "1",
+    "Checkout": "2",
+    "Demoted": "3",
+    "Frozen": "4",
+    "Inactive": "5",
+    "Incomplete": "6",
+    "Promoted": "7",
+    "Refrozen": "8",
+    "Rejected": "9",
+    "Remote promoted": "A",
+    "Submitted for approval": "B",
+    "Unfrozen": "C",
+}
+
+ZmfRequest = Dict[str, Union[str, List[str]]]
+ZmfRecord = Dict[str, Union[str, int]]
+ZmfResult = List[ZmfRecord]
+
+
+class ZmfResponse(TypedDict, total=False):
+    returnCode: str
+    message: str
+    reasonCode: str
+    result: ZmfResult
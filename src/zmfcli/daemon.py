@@ -0,0 +1,333 @@
+"""Warm zmf process serving cli invocations over a unix socket
+
+The daemon keeps a `ChangemanZmf` instance with its pooled connections and
+runs forwarded command lines with fire. Output of a command, printed result
+and log records, is captured per connection and sent back to the client.
+
+Protocol: one JSON request line, answered with one JSON response line.
+    {"op": "run", "argv": [...], "url": ..., "user": ..., "cwd": ...}
+    {"op": "stats"}
+    {"op": "stop"}
+"""
+
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from contextvars import ContextVar
+from inspect import Parameter, signature
+from typing import Any, Dict, List, Optional, TextIO, cast
+
+EXIT_CODE_DAEMON_NOK = 1
+# commands which read the client's stdin or manage the daemon itself
+LOCAL_COMMANDS = ("batch", "daemon")
+
+DaemonMessage = Dict[str, Any]
+
+
+def socket_path() -> str:
+    path = os.environ.get("ZMF_DAEMON_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        import tempfile
+
+        runtime_dir = tempfile.gettempdir()
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(runtime_dir, "zmfcli-{}".format(uid), "daemon.sock")
+
+
+def trusted(path: str) -> bool:
+    """Socket owned by the user and not accessible by group or others
+
+    Another user could listen on a predictable path and answer with forged
+    results.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def request(
+    message: DaemonMessage, path: Optional[str] = None
+) -> Optional[DaemonMessage]:
+    """Send a message to the daemon, None if no daemon is listening"""
+    path = path or socket_path()
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    if not trusted(path):
+        logging.getLogger(__name__).warning(
+            "Daemon socket %s not private to the user, ignored", path
+        )
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        try:
+            sock.connect(path)
+        except OSError:
+            return None
+        sock.settimeout(None)
+        with sock.makefile("rwb") as stream:
+            stream.write(json.dumps(message).encode() + b"\n")
+            stream.flush()
+            line = stream.readline()
+    return json.loads(line) if line else None
+
+
+def forward(argv: List[str], path: Optional[str] = None) -> Optional[int]:
+    """Run a command line in the daemon, None to execute it directly
+
+    Command lines with options before the command are not forwarded, as
+    they configure a new `ChangemanZmf` instance. The daemon falls back
+    for such options after the command, see `constructor_flag`.
+    """
+    if not argv or argv[0].startswith("-") or argv[0] in LOCAL_COMMANDS:
+        return None
+    response = request(
+        {
+            "op": "run",
+            "argv": argv,
+            "url": os.environ.get("ZMF_REST_URL"),
+            "user": os.environ.get("ZMF_REST_USER"),
+            "cwd": os.getcwd(),
+        },
+        path,
+    )
+    if response is None or "fallback" in response:
+        return None
+    sys.stdout.write(response.get("stdout", ""))
+    sys.stderr.write(response.get("stderr", ""))
+    return int(response.get("exitCode", EXIT_CODE_DAEMON_NOK))
+
+
+class ContextCapture(io.TextIOBase):
+    """Stream writing to a per context buffer while capturing, else through
+
+    Tasks of `run_parallel` and hedged requests run in a copy of the
+    context of the command, their output is captured with it.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.buffer: ContextVar[Optional[io.StringIO]] = ContextVar(
+            "zmf_capture", default=None
+        )
+
+    def start(self) -> None:
+        self.buffer.set(io.StringIO())
+
+    def stop(self) -> str:
+        buffer = self.buffer.get()
+        self.buffer.set(None)
+        return buffer.getvalue() if buffer is not None else ""
+
+    def write(self, s: str) -> int:
+        return (self.buffer.get() or self.stream).write(s)
+
+    def flush(self) -> None:
+        if self.buffer.get() is None:
+            self.stream.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+class DaemonStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.active = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self.seconds = 0.0
+        self.commands: Dict[str, int] = {}
+
+    def begin(self, command: str) -> float:
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.commands[command] = self.commands.get(command, 0) + 1
+        return time.perf_counter()
+
+    def end(self, start: float, exit_code: int) -> None:
+        with self.lock:
+            self.active -= 1
+            self.seconds += time.perf_counter() - start
+            if exit_code != 0:
+                self.failed += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            done = self.requests - self.active
+            return {
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started, 3),
+                "requests": self.requests,
+                "active": self.active,
+                "failed": self.failed,
+                "fallbacks": self.fallbacks,
+                "meanSeconds": round(self.seconds / done, 6) if done else 0,
+                "commands": dict(self.commands),
+            }
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    server: "ZmfDaemon"
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.dispatch(json.loads(line))
+        except Exception:
+            response = {"error": traceback.format_exc()}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class ZmfDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, zmf: Any, url: str, user: str) -> None:
+        self.zmf = zmf
+        self.url = url
+        self.user = user
+        self.cwd = os.getcwd()
+        self.stats = DaemonStats()
+        self.stdout = ContextCapture(sys.stdout)
+        self.stderr = ContextCapture(sys.stderr)
+        self.logger = logging.getLogger(__name__)
+        super().__init__(path, DaemonHandler)
+
+    def server_bind(self) -> None:
+        # private from its creation on, not only after a chmod
+        umask = os.umask(0o077)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def dispatch(self, message: DaemonMessage) -> DaemonMessage:
+        op = message.get("op")
+        if op == "stats":
+            return self.stats.as_dict()
+        if op == "stop":
+            threading.Thread(target=self.shutdown).start()
+            return {"stopping": True}
+        if op == "run":
+            return self.run(message)
+        return {"error": "Unknown op '{}'".format(op)}
+
+    def run(self, message: DaemonMessage) -> DaemonMessage:
+        reason = None
+        if message.get("url") not in (None, self.url):
+            reason = "url differs"
+        elif message.get("user") not in (None, self.user):
+            reason = "user differs"
+        elif message.get("cwd") != self.cwd:
+            # arguments may be paths relative to the client's directory
+            reason = "working directory differs"
+        else:
+            flag = constructor_flag(message["argv"], type(self.zmf))
+            if flag is not None:
+                # would fail in fire only after the command has run
+                reason = "{} configures a new instance".format(flag)
+        if reason is not None:
+            with self.stats.lock:
+                self.stats.fallbacks += 1
+            return {"fallback": reason}
+        argv: List[str] = message["argv"]
+        start = self.stats.begin(argv[0])
+        exit_code = self.execute(argv)
+        self.stats.end(start, exit_code)
+        return {
+            "exitCode": exit_code,
+            "stdout": self.stdout.stop(),
+            "stderr": self.stderr.stop(),
+        }
+
+    def execute(self, argv: List[str]) -> int:
+        import fire  # type: ignore
+
+        self.stdout.start()
+        self.stderr.start()
+        try:
+            fire.Fire(self.zmf, command=argv, name="zmf")
+        except SystemExit as e:
+            return exit_code_of(e)
+        except Exception:
+            traceback.print_exc(file=self.stderr)
+            return EXIT_CODE_DAEMON_NOK
+        return 0
+
+
+def constructor_flag(argv: List[str], cls: type) -> Optional[str]:
+    """First option of a command line naming an argument of `cls`
+
+    Such options configure a new instance, also after the command.
+    """
+    names = {
+        name
+        for name, p in signature(cls).parameters.items()
+        if p.kind not in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD)
+    }
+    for arg in argv:
+        if arg == "--":
+            # arguments of fire itself follow
+            return None
+        if not arg.startswith("--"):
+            continue
+        name = arg[2:].split("=", 1)[0].replace("-", "_")
+        if name in names or (name.startswith("no") and name[2:] in names):
+            return arg
+    return None
+
+
+def exit_code_of(e: SystemExit) -> int:
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return EXIT_CODE_DAEMON_NOK
+
+
+def serve(zmf: Any, url: str, user: str, path: Optional[str] = None) -> None:
+    """Serve until stopped, stdout, stderr and logging are redirected"""
+    path = path or socket_path()
+    if request({"op": "stats"}, path) is not None:
+        raise RuntimeError("A daemon is already listening on " + path)
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    server = ZmfDaemon(path, zmf, url, user)
+    redirect_streams(cast(TextIO, server.stdout), cast(TextIO, server.stderr))
+    server.logger.warning("Listening on %s, pid %d", path, os.getpid())
+    try:
+        server.serve_forever()
+    finally:
+        redirect_streams(server.stdout.stream, server.stderr.stream)
+        server.server_close()
+        os.unlink(path)
+
+
+def redirect_streams(stdout: TextIO, stderr: TextIO) -> None:
+    """Replace sys.stdout/err, also in log handlers writing to stderr"""
+    for handler in logging.getLogger().handlers:
+        if (
+            isinstance(handler, logging.StreamHandler)
+            and handler.stream is sys.stderr
+        ):
+            handler.setStream(stderr)
+    sys.stdout, sys.stderr = stdout, stderr
@@ -0,0 +1,82 @@
+"""Wall clock budget of a command, shared by all requests it sends
+
+The deadline is kept in a context variable, tasks of `run_parallel` run in
+a copy of the context of the command and share its deadline.
+"""
+
+import re
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple, Union
+
+RequestTimeout = Union[None, float, Tuple[Optional[float], Optional[float]]]
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+@dataclass(frozen=True)
+class Deadline:
+    budget: float
+    end: float
+
+    def remaining(self) -> float:
+        return self.end - time.monotonic()
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "zmf_deadline", default=None
+)
+
+
+@contextmanager
+def command_deadline(budget: Optional[float]) -> Iterator[None]:
+    """Deadline of a command, unless it runs within another command
+
+    Commands called by a command, e.g. checkin by delta, share its
+    deadline.
+    """
+    if not budget or _deadline.get() is not None:
+        yield
+        return
+    token = _deadline.set(Deadline(budget, time.monotonic() + budget))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left of the current deadline, None without one"""
+    deadline = _deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def cap_timeout(
+    timeout: RequestTimeout, remaining: float
+) -> Tuple[float, float]:
+    """Connect and read timeout of a request, at most `remaining`"""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+    return (
+        remaining if connect is None else min(connect, remaining),
+        remaining if read is None else min(read, remaining),
+    )
+
+
+def to_duration(x: Union[str, float]) -> float:
+    """Seconds of a duration like 300, 300s, 5m, 1h or 500ms"""
+    if isinstance(x, (int, float)):
+        return float(x)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d*)?)\s*(ms|s|m|h)?\s*", x)
+    if match is None:
+        raise ValueError("Invalid duration '{}'".format(x))
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
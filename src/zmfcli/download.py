@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+from email.message import Message
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MANIFEST_NAME = ".zmf-manifest.json"
+# fields of a component record which change with a new version
+VERSION_FIELDS = ("setssi", "dateLastModified", "timeLastModified")
+
+ManifestEntry = Dict[str, Any]
+
+
+def attachment_name(content_disposition: str) -> Optional[str]:
+    """File name of a content-disposition header, without directories"""
+    msg = Message()
+    msg["content-disposition"] = content_disposition
+    name = msg.get_filename()
+    if not name:
+        return None
+    name = os.path.basename(name.replace("\\", "/"))
+    return name if name not in ("", ".", "..") else None
+
+
+def save_chunks(chunks: Iterable[bytes], path: str) -> Tuple[int, str]:
+    """Write chunks to a file, returns its size and sha256
+
+    The chunks are written to a temporary file which replaces `path` once
+    complete, an interrupted download leaves no truncated file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".part"
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return size, digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, ManifestEntry]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries: Dict[str, ManifestEntry] = json.load(f)
+            return entries
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, entries: Dict[str, ManifestEntry]) -> None:
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def fingerprint(path: str) -> Optional[ManifestEntry]:
+    """sha256, size and mtime of a file, None if it does not exist"""
+    try:
+        st = os.stat(path)
+        sha256 = file_sha256(path)
+    except OSError:
+        return None
+    return {"sha256": sha256, "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def is_unchanged(path: str, entry: Optional[ManifestEntry]) -> bool:
+    """Whether the file still has the content recorded in the manifest
+
+    The content is only hashed if the size matches but the mtime does not.
+    """
+    if entry is None:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != entry.get("size"):
+        return False
+    if st.st_mtime_ns == entry.get("mtime"):
+        return True
+    return file_sha256(path) == entry.get("sha256")
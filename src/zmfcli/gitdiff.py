@@ -0,0 +1,71 @@
+import subprocess
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+EXIT_CODE_GIT_NOK = 1
+CHANGED_STATUSES = ("A", "M", "T")
+DELETED_STATUSES = ("D",)
+
+
+class GitError(Exception):
+    pass
+
+
+def revision_range(
+    since: Optional[str] = None, range: Optional[str] = None
+) -> str:
+    """Range for git diff, `since` compares a revision to HEAD"""
+    if (since is None) == (range is None):
+        raise GitError("Give either a revision since or a range")
+    return range if range is not None else "{}..HEAD".format(since)
+
+
+def git_changes(
+    since: Optional[str] = None,
+    range: Optional[str] = None,
+    cwd: Optional[str] = None,
+) -> Tuple[List[str], List[str]]:
+    """Changed and deleted source files between two revisions
+
+    Paths are relative to the working directory, only files below it laid
+    out as <TYPE>/<NAME>.<ext> with TYPE matching ext are returned. Renames
+    are reported as deleted and added files.
+    """
+    try:
+        proc = subprocess.run(
+            [
+                "git",
+                "diff",
+                "--name-status",
+                "--no-renames",
+                "--relative",
+                "-z",
+                revision_range(since, range),
+                "--",
+            ],
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    except OSError as e:
+        raise GitError("Failed to run git: {}".format(e)) from e
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.decode(errors="replace").strip()) from e
+    fields = proc.stdout.decode().split("\0")
+    changed = []
+    deleted = []
+    for status, path in zip(fields[0::2], fields[1::2]):
+        if not is_source(path):
+            continue
+        if status in CHANGED_STATUSES:
+            changed.append(path)
+        elif status in DELETED_STATUSES:
+            deleted.append(path)
+    return changed, deleted
+
+
+def is_source(path: str) -> bool:
+    p = Path(path)
+    return bool(p.suffix) and p.parent.name == p.suffix[1:].upper()
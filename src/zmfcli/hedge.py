@@ -0,0 +1,157 @@
+"""Hedged requests, sent again if the first response is late"""
+
+import logging
+import queue
+import re
+import threading
+
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar, cast
+
+from .deadline import to_duration
+from .metrics import Metrics
+
+DEFAULT_HEDGE_RATE = 0.05
+# latencies observed for an endpoint before its percentile is trusted
+MIN_SAMPLES = 20
+
+R = TypeVar("R")
+Outcome = Tuple[Optional[R], Optional[BaseException]]
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a second request for a late response
+
+    After `delay` seconds, or without it after the `percentile` of the
+    latencies observed for the endpoint. At most `rate` hedges are sent
+    per request on average.
+    """
+
+    delay: Optional[float] = None
+    percentile: float = 95
+    rate: float = DEFAULT_HEDGE_RATE
+    tokens: float = 1.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def delay_for(self, metrics: Metrics, endpoint: str) -> Optional[float]:
+        """Delay of the hedge of a GET request, None for no hedge"""
+        with self.lock:
+            self.tokens = min(1.0, self.tokens + self.rate)
+        if self.delay is not None:
+            return self.delay
+        count, latency = metrics.latency("GET", endpoint, self.percentile)
+        return latency if count >= MIN_SAMPLES else None
+
+    def allow(self) -> bool:
+        """Take from the budget of hedges"""
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def to_hedge(x: str, rate: float = DEFAULT_HEDGE_RATE) -> HedgePolicy:
+    """Policy of a hedge option, a percentile like p95 or a duration"""
+    match = re.fullmatch(r"\s*p(\d+(?:\.\d*)?)\s*", x)
+    if match is not None:
+        return HedgePolicy(percentile=float(match.group(1)), rate=rate)
+    return HedgePolicy(delay=to_duration(x), rate=rate)
+
+
+class Race(Generic[R]):
+    """Attempts run in threads, the first outcome without error wins
+
+    Responses of losers are closed once they arrive. An attempt blocked on
+    a stalled connection cannot be interrupted, its daemon thread does not
+    delay the exit of the process.
+    """
+
+    def __init__(self, close: Callable[[R], None]) -> None:
+        self.close = close
+        self.outcomes: "queue.Queue[Outcome[R]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.decided = False
+        self.pending = 0
+
+    def start(self, attempt: Callable[[], R]) -> None:
+        self.pending += 1
+        # the deadline and other context of the caller
+        context = copy_context()
+        threading.Thread(
+            target=self._run, args=(context.run, attempt), daemon=True
+        ).start()
+
+    def _run(
+        self, run: Callable[[Callable[[], R]], R], attempt: Callable[[], R]
+    ) -> None:
+        outcome: Outcome[R]
+        try:
+            outcome = (run(attempt), None)
+        except BaseException as e:
+            outcome = (None, e)
+        with self.lock:
+            if not self.decided:
+                self.outcomes.put(outcome)
+                return
+        if outcome[0] is not None:
+            self.close(outcome[0])
+
+    def first(self, timeout: float) -> Optional[Outcome[R]]:
+        """Next outcome, None if there is none within `timeout`"""
+        try:
+            outcome = self.outcomes.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.pending -= 1
+        return outcome
+
+    def next(self) -> Outcome[R]:
+        outcome = self.outcomes.get()
+        self.pending -= 1
+        return outcome
+
+    def decide(self) -> None:
+        """Stop taking outcomes, close responses which arrived meanwhile"""
+        with self.lock:
+            self.decided = True
+        while True:
+            try:
+                result, _ = self.outcomes.get_nowait()
+            except queue.Empty:
+                return
+            if result is not None:
+                self.close(result)
+
+
+def hedged(
+    attempt: Callable[[], R],
+    delay: float,
+    policy: HedgePolicy,
+    close: Callable[[R], None],
+    logger: logging.Logger,
+) -> R:
+    """Result of `attempt`, started again if it takes longer than `delay`
+
+    The first result wins. An error only counts if all attempts fail, the
+    first one is raised then.
+    """
+    race: Race[R] = Race(close)
+    race.start(attempt)
+    outcome = race.first(delay)
+    if outcome is None:
+        if policy.allow():
+            logger.info("No response after %.3fs, hedging", delay)
+            race.start(attempt)
+        outcome = race.next()
+    errors: List[BaseException] = []
+    while outcome[1] is not None:
+        errors.append(outcome[1])
+        if race.pending == 0:
+            race.decide()
+            raise errors[0]
+        outcome = race.next()
+    race.decide()
+    return cast(R, outcome[0])
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from typing import Dict, Iterable, Optional, TypedDict
+
+from .cache import remove
+from .constants import ZmfResult
+
+DEFAULT_INDEX_TTL = 3600.0
+
+
+def index_path(directory: str, url: str) -> str:
+    """One index per ZMF instance"""
+    name = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return os.path.join(directory, "packages", name + ".json")
+
+
+class IndexEntry(TypedDict):
+    package: str
+    packageId: int
+    applName: str
+    packageTitle: str
+    workChangeRequest: Optional[str]
+    verified: float
+
+
+class PackageIndex:
+    """Persistent map of application, title and work request to package
+
+    Filled from package searches and creates. Entries verified within `ttl`
+    seconds are trusted, older ones need to be verified again by the caller.
+    The file is read before and written after every change, so processes
+    sharing it see each other's entries. If the file can not be written,
+    the index is disabled, it knows no packages then.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_INDEX_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.logger = logging.getLogger(__name__)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        except OSError as e:
+            self._disable(e)
+
+    def _disable(self, e: OSError) -> None:
+        self.logger.warning("Package index disabled: %s", e)
+        self.enabled = False
+
+    def lookup(
+        self,
+        applName: str,
+        packageTitle: str,
+        workChangeRequest: Optional[str] = None,
+    ) -> Optional[IndexEntry]:
+        """Youngest package with exactly this title"""
+        if not self.enabled:
+            return None
+        candidates = [
+            e
+            for e in self._load().values()
+            if e["applName"] == applName
+            and e["packageTitle"] == packageTitle
+            and (
+                workChangeRequest is None
+                or e["workChangeRequest"] == workChangeRequest
+            )
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda e: e["packageId"])
+
+    def is_fresh(self, entry: IndexEntry) -> bool:
+        return entry["verified"] + self.ttl > time.time()
+
+    def add(
+        self,
+        applName: str,
+        result: Optional[ZmfResult],
+        workChangeRequest: Optional[str] = None,
+    ) -> None:
+        """Add packages of a search or create result"""
+        now = time.time()
+        entries = []
+        for pkg in result or []:
+            package = pkg.get("package")
+            title = pkg.get("packageTitle")
+            if isinstance(package, str) and isinstance(title, str):
+                entries.append(
+                    IndexEntry(
+                        package=package,
+                        packageId=to_int(pkg.get("packageId")),
+                        applName=applName,
+                        packageTitle=title,
+                        workChangeRequest=workChangeRequest,
+                        verified=now,
+                    )
+                )
+        if entries:
+            self._update(entries)
+
+    def verify(self, entry: IndexEntry) -> None:
+        updated = entry.copy()
+        updated["verified"] = time.time()
+        self._update([updated])
+
+    def remove(self, package: str) -> None:
+        with self.lock:
+            entries = self._load()
+            if entries.pop(package, None) is not None:
+                self._save(entries)
+
+    def _update(self, updates: Iterable[IndexEntry]) -> None:
+        with self.lock:
+            entries = self._load()
+            for entry in updates:
+                old = entries.get(entry["package"])
+                # a search without work request does not know it
+                if old is not None and entry["workChangeRequest"] is None:
+                    entry["workChangeRequest"] = old["workChangeRequest"]
+                entries[entry["package"]] = entry
+            self._save(entries)
+
+    def _load(self) -> Dict[str, IndexEntry]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries: Dict[str, IndexEntry] = json.load(f)
+                return entries
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: Dict[str, IndexEntry]) -> None:
+        if not self.enabled:
+            return
+        tmp = "{}.{}.{}.tmp".format(
+            self.path, os.getpid(), threading.get_ident()
+        )
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self._disable(e)
+        finally:
+            remove(tmp)
+
+
+def to_int(a: object) -> int:
+    if isinstance(a, int):
+        return a
+    if isinstance(a, str) and a.isdigit():
+        return int(a)
+    return 0
@@ -0,0 +1,106 @@
+"""Incremental decoding of a JSON object with one large array
+
+ZMF answers with an object like {"returnCode": ..., "result": [...]}. The
+records of the array are decoded one at a time while the body is read, the
+other members are collected into a dict. Only the undecoded rest of the
+body is buffered, so memory does not grow with the number of records.
+"""
+
+import codecs
+import json
+
+from typing import Any, Dict, Iterable, Iterator
+
+DECODER = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+
+
+class StreamParser:
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer, False at the end"""
+        if self.eof:
+            return False
+        self.buf = self.buf[self.pos :]
+        self.pos = 0
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        self.buf += self.decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Next character which is not whitespace, empty at the end"""
+        while True:
+            while (
+                self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE
+            ):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(
+                "Expected one of '{}' at {}, got '{}'".format(
+                    chars, self.pos, c
+                )
+            )
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number at the end of the buffer may go on in the next chunk
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array(
+    chunks: Iterable[bytes], members: Dict[str, Any], key: str = "result"
+) -> Iterator[Any]:
+    """Yield the items of array `key`, other members are added to `members`
+
+    Members after the array are only available once all items are yielded.
+    """
+    parser = StreamParser(chunks)
+    parser.expect("{")
+    if parser.peek() == "}":
+        return
+    while True:
+        name = parser.value()
+        parser.expect(":")
+        if name == key and parser.peek() == "[":
+            parser.expect("[")
+            if parser.peek() == "]":
+                parser.expect("]")
+            else:
+                while True:
+                    yield parser.value()
+                    if parser.expect(",]") == "]":
+                        break
+        else:
+            members[name] = parser.value()
+        if parser.expect(",}") == "}":
+            return
@@ -0,0 +1,135 @@
+"""Client side limit of concurrent requests, adapted to the server load"""
+
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+DEFAULT_INITIAL_LIMIT = 4
+# statuses of an overloaded server, besides connection errors and timeouts
+OVERLOAD_STATUSES = (429, 502, 503, 504)
+
+
+class TokenBucket:
+    """Caps the rate of requests per second, `burst` may be sent at once"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returns the seconds to wait until it is available"""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+@dataclass(frozen=True)
+class Ticket:
+    start: float
+    # whether all slots were taken, only then the limit is worth raising
+    saturated: bool
+
+
+class AdaptiveLimiter:
+    """Limit concurrent requests with additive increase and multiplicative
+    decrease (AIMD)
+
+    The limit grows by one per round of successful requests as long as all
+    slots are in use and the latency stays below `tolerance` times the
+    lowest latency seen for the endpoint. It is halved on overload, that is
+    on connection errors, timeouts and OVERLOAD_STATUSES, and cut by 10% on
+    rising latency. Requests sent before the last cut do not cut it again.
+    With `rate` the requests per second are capped by a token bucket.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: int = DEFAULT_INITIAL_LIMIT,
+        min_limit: int = 1,
+        tolerance: float = 2.0,
+        rate: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(
+            min(self.max_limit, max(self.min_limit, initial_limit))
+        )
+        self.tolerance = tolerance
+        self.bucket = TokenBucket(rate, clock=clock) if rate else None
+        self.clock = clock
+        self.inflight = 0
+        self.last_decrease = float("-inf")
+        self.baseline: Dict[str, float] = {}
+        self.cond = threading.Condition()
+
+    def acquire(self) -> Ticket:
+        """Block until the rate and the limit allow another request"""
+        if self.bucket is not None:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                time.sleep(delay)
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+            return Ticket(self.clock(), self.inflight >= int(self.limit))
+
+    def release(
+        self, ticket: Ticket, endpoint: str, status: Optional[int]
+    ) -> None:
+        """Adapt the limit to the outcome of a request
+
+        `status` is None if the request failed without a response.
+        """
+        latency = self.clock() - ticket.start
+        with self.cond:
+            self.inflight -= 1
+            if status is None or status in OVERLOAD_STATUSES:
+                self._decrease(ticket, 0.5)
+            elif status < 400:
+                if self._is_slow(endpoint, latency):
+                    self._decrease(ticket, 0.9)
+                elif ticket.saturated:
+                    self.limit = min(
+                        float(self.max_limit), self.limit + 1 / self.limit
+                    )
+            self.cond.notify_all()
+
+    def cancel(self, ticket: Ticket) -> None:
+        """Release a slot without adapting the limit"""
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify_all()
+
+    def _is_slow(self, endpoint: str, latency: float) -> bool:
+        base = self.baseline.get(endpoint)
+        if base is None or latency < base:
+            self.baseline[endpoint] = latency
+            return False
+        # follow a server which got slower for good
+        self.baseline[endpoint] = base + (latency - base) * 0.01
+        return latency > self.tolerance * max(base, 0.01)
+
+    def _decrease(self, ticket: Ticket, factor: float) -> None:
+        if ticket.start < self.last_decrease:
+            return
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self.last_decrease = self.clock()
@@ -0,0 +1,220 @@
+"""Request metrics per endpoint, exported as JSON or Prometheus textfile"""
+
+import json
+import math
+import os
+import threading
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# upper bounds in seconds of the latency histogram
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+PERCENTILES = (50, 95, 99)
+
+EndpointKey = Tuple[str, str]
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses: Dict[str, int] = {}
+        self.return_codes: Dict[str, int] = {}
+
+    def percentile(self, p: float) -> float:
+        """Estimated from the histogram, interpolated within a bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(LATENCY_BUCKETS, self.buckets):
+            if n and seen + n >= rank:
+                if math.isinf(upper):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return lower
+
+    def as_dict(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            "count": self.count,
+            "errors": self.errors,
+            "meanSeconds": (
+                round(self.seconds / self.count, 6) if self.count else 0
+            ),
+        }
+        for p in PERCENTILES:
+            summary["p{}".format(p)] = round(self.percentile(p), 6)
+        summary.update(
+            requestBytes=self.request_bytes,
+            responseBytes=self.response_bytes,
+            statuses=dict(self.statuses),
+            returnCodes=dict(self.return_codes),
+        )
+        return summary
+
+
+class Metrics:
+    """Thread safe collection of request metrics per method and endpoint"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.endpoints: Dict[EndpointKey, EndpointStats] = {}
+
+    def _stats(self, method: str, endpoint: str) -> EndpointStats:
+        key = (method.upper(), endpoint)
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats()
+        return stats
+
+    def observe(
+        self,
+        method: str,
+        endpoint: str,
+        seconds: float,
+        status: Optional[int],
+        request_bytes: int = 0,
+        response_bytes: int = 0,
+    ) -> None:
+        """Record a request, `status` is None if no response was received"""
+        with self.lock:
+            stats = self._stats(method, endpoint)
+            stats.count += 1
+            stats.seconds += seconds
+            for i, upper in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper:
+                    stats.buckets[i] += 1
+                    break
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            label = "error" if status is None else str(status)
+            stats.statuses[label] = stats.statuses.get(label, 0) + 1
+            if status is None or status >= 400:
+                stats.errors += 1
+
+    def return_code(self, method: str, endpoint: str, code: str) -> None:
+        with self.lock:
+            codes = self._stats(method, endpoint).return_codes
+            codes[code] = codes.get(code, 0) + 1
+
+    def latency(
+        self, method: str, endpoint: str, p: float
+    ) -> Tuple[int, float]:
+        """Number of requests and their latency percentile `p`"""
+        with self.lock:
+            stats = self.endpoints.get((method.upper(), endpoint))
+            if stats is None:
+                return 0, 0.0
+            return stats.count, stats.percentile(p)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Summary per endpoint, keyed by method and endpoint"""
+        with self.lock:
+            return {
+                "{} {}".format(*key): stats.as_dict()
+                for key, stats in sorted(self.endpoints.items())
+            }
+
+    def to_prometheus(self) -> str:
+        """Text exposition format, each metric family in one block"""
+        families: Dict[str, List[str]] = {
+            "zmf_requests_total counter": [],
+            "zmf_request_duration_seconds histogram": [],
+            "zmf_request_bytes_total counter": [],
+            "zmf_response_bytes_total counter": [],
+            "zmf_return_codes_total counter": [],
+        }
+        requests, duration, request_bytes, response_bytes, return_codes = (
+            families.values()
+        )
+        with self.lock:
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                labels = 'method="{}",endpoint="{}"'.format(
+                    method, escape(endpoint)
+                )
+                for status, n in sorted(stats.statuses.items()):
+                    requests.append(
+                        'zmf_requests_total{{{},status="{}"}} {}'.format(
+                            labels, status, n
+                        )
+                    )
+                cumulative = 0
+                for upper, n in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += n
+                    le = "+Inf" if math.isinf(upper) else repr(upper)
+                    duration.append(
+                        "zmf_request_duration_seconds_bucket"
+                        '{{{},le="{}"}} {}'.format(labels, le, cumulative)
+                    )
+                duration.append(
+                    "zmf_request_duration_seconds_sum{{{}}} {}".format(
+                        labels, stats.seconds
+                    )
+                )
+                duration.append(
+                    "zmf_request_duration_seconds_count{{{}}} {}".format(
+                        labels, stats.count
+                    )
+                )
+                request_bytes.append(
+                    "zmf_request_bytes_total{{{}}} {}".format(
+                        labels, stats.request_bytes
+                    )
+                )
+                response_bytes.append(
+                    "zmf_response_bytes_total{{{}}} {}".format(
+                        labels, stats.response_bytes
+                    )
+                )
+                for code, n in sorted(stats.return_codes.items()):
+                    return_codes.append(
+                        'zmf_return_codes_total{{{},code="{}"}} {}'.format(
+                            labels, escape(code), n
+                        )
+                    )
+        lines: List[str] = []
+        for family, samples in families.items():
+            lines.append("# TYPE " + family)
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """JSON summary for .json files, else Prometheus text format
+
+        Written to a temporary file first, so a textfile collector never
+        reads a partial file.
+        """
+        if path.endswith(".json"):
+            text = json.dumps(self.snapshot(), indent=2) + "\n"
+        else:
+            text = self.to_prometheus()
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
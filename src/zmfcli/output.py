@@ -0,0 +1,67 @@
+import csv
+import json
+
+from typing import Any, Callable, IO, Iterable, List, Optional
+
+from .constants import ZmfRecord
+
+EXIT_CODE_OUTPUT_NOK = 1
+OUTPUT_FORMATS = ("ndjson", "csv", "json")
+
+
+def json_encoder() -> Callable[[Any], str]:
+    """orjson if it is installed, else the json module"""
+    try:
+        import orjson
+    except ImportError:
+        return to_json
+    return lambda obj: orjson.dumps(obj).decode()
+
+
+def to_json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def write_records(
+    records: Iterable[ZmfRecord],
+    fmt: str,
+    out: IO[str],
+    dumps: Optional[Callable[[Any], str]] = None,
+) -> int:
+    """Write records as they are produced, returns the number of records
+
+    ndjson  one JSON object per line
+    json    a JSON array, with one record per line
+    csv     header with the fields of the first record
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(
+            "Unknown output '{}', expected one of {}".format(
+                fmt, ", ".join(OUTPUT_FORMATS)
+            )
+        )
+    dumps = dumps or json_encoder()
+    count = 0
+    if fmt == "ndjson":
+        for record in records:
+            out.write(dumps(record) + "\n")
+            count += 1
+    elif fmt == "json":
+        out.write("[")
+        for record in records:
+            out.write(("," if count else "") + "\n" + dumps(record))
+            count += 1
+        out.write("\n]\n" if count else "]\n")
+    else:
+        writer: Optional["csv.DictWriter[str]"] = None
+        for record in records:
+            if writer is None:
+                fields: List[str] = list(record)
+                writer = csv.DictWriter(
+                    out, fields, extrasaction="ignore", lineterminator="\n"
+                )
+                writer.writeheader()
+            writer.writerow(record)
+            count += 1
+    out.flush()
+    return count
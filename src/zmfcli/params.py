@@ -0,0 +1,402 @@
+"""Parameters of ZMF requests, shared by `ChangemanZmf` and the asyncio client
+
+The functions only build parameters, sending them is up to the client.
+"""
+
+from itertools import groupby, islice
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from .constants import ZmfResult
+
+Params = Dict[str, Union[int, str, bool, Iterable[str]]]
+
+# components per checkin and delete request
+CHUNK_SIZE = 64
+PROCESSING_OPTION = {"delete": 1, "undelete": 2}
+SOURCE_LOCATION: Dict[str, Union[str, int]] = {
+    "development dataset": 1,
+    "package": 5,
+    "temp sequential dataset": 7,
+    "edit from package lib": "E",
+}
+SOURCE_STORAGE: Dict[str, Union[str, int]] = {
+    "pds": 6,
+    "sequential dataset": 8,
+    "pds/extended": 9,
+    "hfs": "H",
+}
+
+T = TypeVar("T")
+
+
+class Chunk(NamedTuple):
+    """Request for some components, `label` names it in the log"""
+
+    label: str
+    components: List[str]
+    params: Params
+
+
+def checkin_chunks(
+    package: str, pds: str, components: Iterable[str]
+) -> List[Chunk]:
+    """Checkin from a PDS by type, in chunks of CHUNK_SIZE"""
+    return [
+        Chunk(
+            "checkin {} chunk {}".format(comp_type, i),
+            comp_chunk,
+            {
+                "package": package,
+                "chkInSourceLocation": SOURCE_LOCATION["development dataset"],
+                "sourceStorageMeans": SOURCE_STORAGE["pds"],
+                "componentType": comp_type,
+                "sourceLib": pds + "." + comp_type,
+                "targetComponent": [Path(c).stem for c in comp_chunk],
+            },
+        )
+        for comp_type, i, comp_chunk in typed_chunks(
+            components, upper_extension, CHUNK_SIZE
+        )
+    ]
+
+
+def delete_chunks(
+    package: str,
+    components: Iterable[str],
+    componentType: Optional[str] = None,
+) -> List[Chunk]:
+    """Delete names of `componentType`, or paths typed by their extension,
+    by type in chunks of CHUNK_SIZE"""
+
+    def component_type(comp: str) -> str:
+        return (componentType or extension(comp)).upper()
+
+    return [
+        Chunk(
+            "delete {} chunk {}".format(comp_type, i),
+            comp_chunk,
+            {
+                "package": package,
+                "targetComponent": [Path(c).stem for c in comp_chunk],
+                "componentType": comp_type,
+            },
+        )
+        for comp_type, i, comp_chunk in typed_chunks(
+            components, component_type, CHUNK_SIZE
+        )
+    ]
+
+
+def build_params(
+    user: str,
+    procedure: Optional[str] = None,
+    language: Optional[str] = None,
+    db2Precompile: Optional[bool] = None,
+    useHistory: Optional[bool] = None,
+    params: Optional[Dict[str, str]] = None,
+) -> Params:
+    """Options of a build, the same for each of its jobs"""
+    data: Params = {**jobcard(user, "build")}
+    if params is not None:
+        data.update(params)
+    if procedure is not None:
+        data["buildProc"] = procedure
+    if language is not None:
+        data["language"] = language
+    if db2Precompile is not None:
+        data["useDb2PreCompileOption"] = to_yes_no(db2Precompile)
+    if useHistory is not None:
+        data["useHistory"] = to_yes_no(useHistory)
+    return data
+
+
+def build_chunks(
+    package: str,
+    components: Iterable[str],
+    options: Params,
+    chunk_size: Optional[int] = None,
+) -> List[Chunk]:
+    """One build job per type, or per `chunk_size` components of a type"""
+    return [
+        Chunk(
+            "build {} chunk {}".format(comp_type, i),
+            comp_chunk,
+            {
+                "package": package,
+                "componentType": comp_type,
+                "component": [Path(c).stem for c in comp_chunk],
+                **options,
+            },
+        )
+        for comp_type, i, comp_chunk in typed_chunks(
+            components, upper_extension, chunk_size
+        )
+    ]
+
+
+def scratch_chunks(package: str, components: Iterable[str]) -> List[Chunk]:
+    """component/scratch takes one component per request"""
+    return [
+        Chunk(
+            "scratch {} {}".format(upper_extension(comp), Path(comp).stem),
+            [comp],
+            {
+                "package": package,
+                "componentType": upper_extension(comp),
+                "oldComponent": Path(comp).stem,
+            },
+        )
+        for comp in components
+    ]
+
+
+def package_job_params(user: str, action: str, package: str) -> Params:
+    """Audit or freeze of a package"""
+    return {"package": package, **jobcard(user, action)}
+
+
+def promotion_params(
+    user: str,
+    action: str,
+    package: str,
+    promSiteName: str,
+    promLevel: int,
+    promName: str,
+    overlay: Optional[bool] = None,
+) -> Params:
+    """Promote or demote of a package"""
+    data: Params = {
+        "package": package,
+        "promotionSiteName": promSiteName,
+        "promotionLevel": promLevel,
+        "promotionName": promName,
+    }
+    if overlay is not None:
+        data["overlayTargetComponents"] = to_yes_no(overlay)
+    data.update(jobcard_s(user, action))
+    return data
+
+
+def revert_params(
+    user: str, package: str, revertReason: Optional[str] = None
+) -> Params:
+    data: Params = {"package": package}
+    if revertReason is not None:
+        data["revertReason01"] = revertReason
+    data.update(jobcard(user, "revert"))
+    return data
+
+
+def search_params(
+    applName: str, packageTitle: str, workChangeRequest: Optional[str] = None
+) -> Params:
+    data: Params = {"package": applName + "*", "packageTitle": packageTitle}
+    if workChangeRequest is not None:
+        data["workChangeRequest"] = workChangeRequest
+    return data
+
+
+def select_package(
+    result: Optional[ZmfResult], packageTitle: str
+) -> Optional[str]:
+    """Youngest package of a search with exactly the title"""
+    for pkg in sorted(
+        result or [],
+        key=lambda p: int_or_zero(p.get("packageId")),
+        reverse=True,
+    ):
+        # search matches title as substring, ensure full title matches
+        if pkg.get("packageTitle") == packageTitle:
+            return str_or_none(pkg.get("package"))
+    return None
+
+
+def search_terms(
+    applName: Optional[str] = None,
+    packageTitle: Optional[str] = None,
+    workChangeRequest: Optional[str] = None,
+    params: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Application, title and change request to search a package by"""
+    if params is None:
+        return applName, packageTitle, workChangeRequest
+    return (
+        params.get("applName", applName),
+        params.get("packageTitle", packageTitle),
+        params.get("workChangeRequest", workChangeRequest),
+    )
+
+
+def create_params(
+    applName: Optional[str] = None,
+    packageTitle: Optional[str] = None,
+    workChangeRequest: Optional[str] = None,
+    params: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    data = params.copy() if params is not None else {}
+    if applName is not None:
+        data["applName"] = applName
+    if packageTitle is not None:
+        data["packageTitle"] = packageTitle
+    if workChangeRequest is not None:
+        data["workChangeRequest"] = workChangeRequest
+    return data
+
+
+def delete_package_params(package: str) -> Params:
+    return {
+        "package": package,
+        "processingOption": PROCESSING_OPTION["delete"],
+    }
+
+
+def browse_params(
+    package: str, component: str, componentType: str
+) -> Dict[str, str]:
+    return {
+        "package": package,
+        "component": component,
+        "componentType": componentType,
+    }
+
+
+def component_params(
+    package: str,
+    componentType: Optional[str] = None,
+    component: Optional[str] = None,
+    targetComponent: Optional[str] = None,
+    filterActive: Optional[bool] = None,
+    filterIncomplete: Optional[bool] = None,
+    filterInactive: Optional[bool] = None,
+) -> Params:
+    """Query of the components of a package"""
+    data: Params = {"package": package}
+    if componentType is not None:
+        data["componentType"] = componentType
+    if component is not None:
+        data["component"] = component
+    if targetComponent is not None:
+        data["targetComponent"] = targetComponent
+    if filterActive is not None:
+        data["filterActiveStatus"] = to_yes_no(filterActive)
+    if filterIncomplete is not None:
+        data["filterIncompleteStatus"] = to_yes_no(filterIncomplete)
+    if filterInactive is not None:
+        data["filterInactiveStatus"] = to_yes_no(filterInactive)
+    return data
+
+
+def load_component_params(
+    package: str,
+    sourceType: Optional[str] = None,
+    sourceComponent: Optional[str] = None,
+    targetType: Optional[str] = None,
+    targetComponent: Optional[str] = None,
+) -> Params:
+    """Query of the load components of a package"""
+    data: Params = {"package": package}
+    if sourceType is not None:
+        data["componentType"] = sourceType
+    if sourceComponent is not None:
+        data["component"] = sourceComponent
+    if targetType is not None:
+        data["targetComponentType"] = targetType
+    if targetComponent is not None:
+        data["targetComponent"] = targetComponent
+    return data
+
+
+def package_list_params(
+    package: str,
+    componentType: Optional[str] = None,
+    component: Optional[str] = None,
+    targetComponent: Optional[str] = None,
+) -> Params:
+    """Query of the package list of a package"""
+    data: Params = {"package": package}
+    if componentType is not None:
+        data["sourceComponentType"] = componentType
+    if component is not None:
+        data["sourceComponent"] = component
+    if targetComponent is not None:
+        data["targetComponent"] = targetComponent
+    return data
+
+
+def typed_chunks(
+    components: Iterable[str],
+    key: Callable[[str], str],
+    size: Optional[int] = None,
+) -> Iterator[Tuple[str, int, List[str]]]:
+    """Type, index and components of chunks of `size` of each type"""
+    for comp_type, group in groupby(sorted(components, key=key), key):
+        comps = list(group)
+        for i, comp_chunk in enumerate(chunks(comps, size or len(comps))):
+            yield comp_type, i, comp_chunk
+
+
+def chunks(it: Iterable[T], n: int) -> Iterator[List[T]]:
+    # Credits to https://stackoverflow.com/a/22045226/5498201
+    iterator = iter(it)
+    return iter(lambda: list(islice(iterator, n)), [])
+
+
+def extension(file: str) -> str:
+    return Path(file).suffix.lstrip(".")
+
+
+def upper_extension(file: str) -> str:
+    return extension(file).upper()
+
+
+def jobcard(user: str, action: str = "@") -> Dict[str, str]:
+    return {
+        "jobCard01": "//" + user + action[:1].upper() + " JOB 0,'CHANGEMAN',",
+        "jobCard02": "//         CLASS=A,MSGCLASS=A,",
+        "jobCard03": "//         NOTIFY=&SYSUID",
+        "jobCard04": "//*",
+    }
+
+
+def jobcard_s(user: str, action: str = "@") -> Dict[str, str]:
+    return {
+        "jobCards01": "//" + user + action[:1].upper() + " JOB 0,'CHANGEMAN',",
+        "jobCards02": "//         CLASS=A,MSGCLASS=A,",
+        "jobCards03": "//         NOTIFY=&SYSUID",
+        "jobCards04": "//*",
+    }
+
+
+def int_or_zero(a: Union[int, str, None]) -> int:
+    if isinstance(a, int):
+        return a
+    elif isinstance(a, str) and a.isdigit():
+        return int(a)
+    else:
+        return 0
+
+
+def str_or_none(a: Union[int, str, None]) -> Optional[str]:
+    if a is None:
+        return None
+    else:
+        return str(a)
+
+
+def to_yes_no(x: bool) -> str:
+    if x is True:
+        return "Y"
+    else:
+        return "N"
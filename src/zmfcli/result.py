@@ -0,0 +1,198 @@
+"""Compact container for large results, records are stored by column"""
+
+import sys
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+    overload,
+)
+
+from .constants import COMP_STATUS, ZmfRecord, ZmfResult
+
+# value of a key missing in a record
+_MISSING: Any = object()
+
+Column = List[Any]
+
+
+class ColumnarResult(Sequence[ZmfRecord]):
+    """Records of a result, stored as one list per key
+
+    Each key is kept once instead of once per record, equal values share
+    one object. Records are rebuilt as dicts while iterating, so it can
+    replace a ZmfResult where records are only read, e.g.
+        ColumnarResult(zmf.get_components(package, stream=True))
+    """
+
+    __slots__ = ("columns", "size")
+
+    def __init__(self, records: Iterable[ZmfRecord] = ()) -> None:
+        self.columns: Dict[str, Column] = {}
+        self.size = 0
+        pools: Dict[str, Dict[Any, Any]] = {}
+        for record in records:
+            for key, value in record.items():
+                column = self.columns.get(key)
+                if column is None:
+                    key = sys.intern(key)
+                    column = self.columns[key] = [_MISSING] * self.size
+                    pools[key] = {}
+                try:
+                    value = pools[key].setdefault(value, value)
+                except TypeError:
+                    # unhashable, e.g. a nested list
+                    pass
+                column.append(value)
+            self.size += 1
+            for column in self.columns.values():
+                if len(column) < self.size:
+                    column.append(_MISSING)
+
+    @classmethod
+    def _select(
+        cls, columns: Dict[str, Column], rows: Iterable[int]
+    ) -> "ColumnarResult":
+        result = cls()
+        rows = list(rows)
+        result.size = len(rows)
+        for key, column in columns.items():
+            result.columns[key] = [column[i] for i in rows]
+        return result
+
+    def __len__(self) -> int:
+        return self.size
+
+    @overload
+    def __getitem__(self, index: int) -> ZmfRecord: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "ColumnarResult": ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[ZmfRecord, "ColumnarResult"]:
+        if isinstance(index, slice):
+            return self._select(self.columns, range(self.size)[index])
+        i = range(self.size)[index]
+        return {
+            key: column[i]
+            for key, column in self.columns.items()
+            if column[i] is not _MISSING
+        }
+
+    def __iter__(self) -> Iterator[ZmfRecord]:
+        items = list(self.columns.items())
+        for i in range(self.size):
+            yield {
+                key: column[i]
+                for key, column in items
+                if column[i] is not _MISSING
+            }
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (ColumnarResult, list)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other)
+            )
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return "ColumnarResult({} records, keys {})".format(
+            self.size, list(self.columns)
+        )
+
+    def keys(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, key: str) -> List[Any]:
+        """Values of a key, None where a record does not have it"""
+        values = self.columns.get(key)
+        if values is None:
+            return [None] * self.size
+        return [None if v is _MISSING else v for v in values]
+
+    def filter(
+        self,
+        predicate: Optional[Callable[[ZmfRecord], bool]] = None,
+        **criteria: Any,
+    ) -> "ColumnarResult":
+        """Records with the given values, e.g.
+            filter(componentType="SRB", componentName=["APP1", "APP2"])
+        Lists, tuples and sets match any of their values. Criteria are
+        checked on the columns, a `predicate` on each remaining record.
+        """
+        rows: Iterable[int] = range(self.size)
+        for key, wanted in criteria.items():
+            values = self.columns.get(key, [_MISSING] * self.size)
+            if isinstance(wanted, (list, tuple, set, frozenset)):
+                choices = set(wanted)
+                rows = [i for i in rows if values[i] in choices]
+            else:
+                rows = [i for i in rows if values[i] == wanted]
+        if predicate is not None:
+            rows = [i for i in rows if predicate(self[i])]
+        return self._select(self.columns, rows)
+
+    def with_status(self, *statuses: str) -> "ColumnarResult":
+        """Records with one of the statuses, names of COMP_STATUS or codes"""
+        codes = status_codes(statuses)
+        values = self.columns.get("componentStatus", [])
+        matching = {v for v in set(values) if to_status_code(v) in codes}
+        return self._select(
+            self.columns, [i for i, v in enumerate(values) if v in matching]
+        )
+
+    def group_by(
+        self, key: str, convert: Optional[Callable[[Any], Hashable]] = None
+    ) -> Dict[Any, "ColumnarResult"]:
+        """Records by their value of `key`, optionally converted, e.g.
+        group_by("componentStatus", to_status_code)"""
+        rows: Dict[Any, List[int]] = {}
+        for i, value in enumerate(self.column(key)):
+            group = convert(value) if convert is not None else value
+            rows.setdefault(group, []).append(i)
+        return {
+            group: self._select(self.columns, indices)
+            for group, indices in rows.items()
+        }
+
+    def count_by(
+        self, key: str, convert: Optional[Callable[[Any], Hashable]] = None
+    ) -> Dict[Any, int]:
+        counts: Dict[Any, int] = {}
+        for value in self.column(key):
+            group = convert(value) if convert is not None else value
+            counts[group] = counts.get(group, 0) + 1
+        return counts
+
+    def to_list(self) -> ZmfResult:
+        return list(self)
+
+
+def to_status_code(status: Any) -> str:
+    """Code of a componentStatus, e.g. 0 of '0 - Active'"""
+    return (
+        str(status if status is not None else "").partition(" - ")[0].strip()
+    )
+
+
+def status_code(record: ZmfRecord) -> str:
+    return to_status_code(record.get("componentStatus"))
+
+
+def status_codes(names: Union[str, Iterable[str], None]) -> Set[str]:
+    if names is None:
+        return set()
+    if isinstance(names, str):
+        names = [names]
+    return {COMP_STATUS.get(name, name) for name in names}
@@ -1,26 +1,83 @@
 import logging
+import random
 import sys
+import time
 
-from typing import Any, Callable, Dict, List, Optional, TypedDict, Union
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 from urllib.parse import urljoin
 
 from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
 
-EXIT_CODE_REQUEST_NOK = 2
-EXIT_CODE_ZMF_NOK = 3
-ZMF_STATUS_OK = "00"
-ZMF_STATUS_INFO = "04"
-ZMF_STATUS_FAILURE = "08"
+from .breaker import CircuitBreaker
+from .constants import (
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    EXIT_CODE_REQUEST_NOK,
+    EXIT_CODE_ZMF_NOK,
+    IDEMPOTENT_METHODS,
+    MUTATING_METHODS,
+    RETRY_STATUSES,
+    ZMF_STATUS_INFO,
+    ZMF_STATUS_OK,
+    ZmfRecord,
+    ZmfResponse,
+    ZmfResult,
+)
+from .deadline import RequestTimeout, cap_timeout, current_deadline
+from .hedge import HedgePolicy, hedged
+from .jsonstream import iter_array
+from .limiter import AdaptiveLimiter
+from .metrics import Metrics
 
-ZmfRequest = Dict[str, Union[str, List[str]]]
-ZmfResult = List[Dict[str, Union[str, int]]]
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
-class ZmfResponse(TypedDict, total=False):
-    returnCode: str
-    message: str
-    reasonCode: str
-    result: ZmfResult
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry transient failures with exponential backoff and full jitter
+
+    `attempts` includes the first request. Idempotent requests are retried
+    on connection errors, timeouts and `statuses`, PUT and DELETE only with
+    `retry_mutating`.
+    """
+
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    statuses: Tuple[int, ...] = RETRY_STATUSES
+    retry_mutating: bool = False
+
+    def allows(self, method: str, attempt: int) -> bool:
+        if attempt >= self.attempts:
+            return False
+        method = method.upper()
+        return method in IDEMPOTENT_METHODS or (
+            self.retry_mutating and method in MUTATING_METHODS
+        )
+
+    def delay(
+        self, attempt: int, retry_after: Optional[float] = None
+    ) -> float:
+        cap = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+
+NO_RETRY = RetryPolicy(attempts=1)
 
 
 # Credits to: https://stackoverflow.com/a/51026159
@@ -33,6 +90,8 @@ class LoggedSession(Session):
         super().__init__(*args, **kwargs)  # type: ignore
         self.prefix_url = prefix_url
         self.logger = logging.getLogger(__name__)
+        self.timeout: Optional[Tuple[Optional[float], Optional[float]]] = None
+        self.metrics = Metrics()
 
     def request(
         self, method: str, url: Union[str, bytes], *args: Any, **kwargs: Any
@@ -42,11 +101,43 @@ class LoggedSession(Session):
         req_url = urljoin(self.prefix_url, url)
         self.logger.info("%s %s", method, req_url)
         self.logger.info(kwargs.get("data"))
-        return super().request(method, req_url, *args, **kwargs)
+        if self.timeout is not None:
+            kwargs.setdefault("timeout", self.timeout)
+        endpoint = self.endpoint(req_url)
+        start = time.perf_counter()
+        try:
+            resp = super().request(method, req_url, *args, **kwargs)
+        except Exception:
+            self.metrics.observe(
+                method, endpoint, time.perf_counter() - start, None
+            )
+            raise
+        self.metrics.observe(
+            method,
+            endpoint,
+            time.perf_counter() - start,
+            resp.status_code,
+            body_size(resp.request.body),
+            response_size(resp, bool(kwargs.get("stream"))),
+        )
+        return resp
+
+    def endpoint(self, url: str) -> str:
+        """Path of an url relative to the prefix url, without query"""
+        if url.startswith(self.prefix_url):
+            url = url[len(self.prefix_url) :]
+        return url.partition("?")[0]
+
+    def record_return_code(self, resp: Response, payload: ZmfResponse) -> None:
+        self.metrics.return_code(
+            resp.request.method or "",
+            self.endpoint(resp.url),
+            str(payload.get("returnCode")),
+        )
 
 
 def unpack_result(
-    req: Callable[..., Response]
+    req: Callable[..., Response],
 ) -> Callable[..., Optional[ZmfResult]]:
     def wrapper(
         self: LoggedSession, *args: Any, **kwargs: Any
@@ -55,25 +146,235 @@ def unpack_result(
         exit_nok(resp, self.logger)
         exit_not_json(resp, self.logger)
         payload: ZmfResponse = resp.json()
-        self.logger.info(
-            {
-                k: payload.get(k)
-                for k in ["returnCode", "message", "reasonCode"]
-            }
-        )
-        if payload.get("returnCode") not in [ZMF_STATUS_OK, ZMF_STATUS_INFO]:
-            self.logger.error(payload.get("message"))
-            sys.exit(EXIT_CODE_ZMF_NOK)
-        return payload.get("result")
+        self.record_return_code(resp, payload)
+        return check_payload(payload, self.logger)
+
+    return wrapper
+
+
+def stream_result(
+    req: Callable[..., Response],
+) -> Callable[..., Iterator[ZmfRecord]]:
+    """Like `unpack_result`, but yield records while the body is read"""
+
+    def wrapper(
+        self: LoggedSession, *args: Any, **kwargs: Any
+    ) -> Iterator[ZmfRecord]:
+        resp = req(self, *args, stream=True, **kwargs)
+        exit_nok(resp, self.logger)
+        exit_not_json(resp, self.logger)
+        return iter_result(self, resp)
 
     return wrapper
 
 
+def iter_result(session: LoggedSession, resp: Response) -> Iterator[ZmfRecord]:
+    """Records of a streamed response
+
+    The returnCode is checked before the first record, if the server sends
+    it before the result, else after the last record.
+    """
+    members: Dict[str, Any] = {}
+    checked = False
+    try:
+        for record in iter_array(
+            resp.iter_content(STREAM_CHUNK_SIZE), members
+        ):
+            if not checked and "returnCode" in members:
+                check_streamed(session, resp, members)
+                checked = True
+            yield record
+    finally:
+        resp.close()
+    if not checked:
+        check_streamed(session, resp, members)
+
+
+def check_streamed(
+    session: LoggedSession, resp: Response, members: Dict[str, Any]
+) -> None:
+    payload = cast(ZmfResponse, members)
+    session.record_return_code(resp, payload)
+    check_payload(payload, session.logger)
+
+
+def check_payload(
+    payload: ZmfResponse, logger: logging.Logger
+) -> Optional[ZmfResult]:
+    logger.info(
+        {k: payload.get(k) for k in ["returnCode", "message", "reasonCode"]}
+    )
+    if payload.get("returnCode") not in [ZMF_STATUS_OK, ZMF_STATUS_INFO]:
+        logger.error(payload.get("message"))
+        sys.exit(EXIT_CODE_ZMF_NOK)
+    return payload.get("result")
+
+
 class ZmfSession(LoggedSession):
+    def __init__(
+        self,
+        prefix_url: str = "",
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        keep_alive: bool = True,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retry: RetryPolicy = NO_RETRY,
+        limiter: Optional[AdaptiveLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: Optional[HedgePolicy] = None,
+    ) -> None:
+        """Session with a tunable connection pool and retry policy
+
+        `pool_connections` is the number of pooled hosts, `pool_maxsize`
+        the number of kept alive connections per host. Without `keep_alive`
+        every request asks the server to close its connection. A `limiter`
+        shared by all threads bounds the concurrent requests, a `breaker`
+        fails requests fast while the server is down. `hedge` is the policy
+        of `result_hedged_get`.
+        """
+        super().__init__(prefix_url)
+        self.retry = retry
+        self.limiter = limiter
+        self.breaker = breaker
+        self.hedge = hedge
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+        if connect_timeout is not None or read_timeout is not None:
+            self.timeout = (connect_timeout, read_timeout)
+
+    # Ignore type issue, the keyword arguments are passed on unchanged
+    # instead of being repeated from the signature of Session.request
+    def request(  # type: ignore[override]
+        self, method: str, url: Union[str, bytes], *args: Any, **kwargs: Any
+    ) -> Response:
+        timeout = kwargs.pop("timeout", self.timeout)
+        attempt = 1
+        while True:
+            retry_after = None
+            self.exit_open_circuit()
+            try:
+                resp = self.send_limited(
+                    method,
+                    url,
+                    *args,
+                    timeout=self.attempt_timeout(timeout),
+                    **kwargs,
+                )
+            except (ConnectionError, Timeout) as e:
+                self.record_outcome(False)
+                self.exit_past_deadline()
+                if not self.retry.allows(method, attempt):
+                    raise
+                reason = repr(e)
+            else:
+                self.record_outcome(resp.status_code < 500)
+                if resp.status_code not in self.retry.statuses:
+                    return resp
+                if not self.retry.allows(method, attempt):
+                    return resp
+                reason = "{} {}".format(resp.status_code, resp.reason)
+                retry_after = to_seconds(resp.headers.get("retry-after"))
+                resp.close()
+            delay = self.retry.delay(attempt, retry_after)
+            self.exit_past_deadline(delay)
+            self.logger.warning(
+                "%s, retry %d/%d in %.1fs",
+                reason,
+                attempt,
+                self.retry.attempts - 1,
+                delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def attempt_timeout(self, timeout: RequestTimeout) -> RequestTimeout:
+        """Timeout of a request, capped by the deadline of the command"""
+        deadline = current_deadline()
+        if deadline is None:
+            return timeout
+        self.exit_past_deadline()
+        return cap_timeout(timeout, deadline.remaining())
+
+    def exit_past_deadline(self, needed: float = 0.0) -> None:
+        """Exit if less than `needed` seconds are left of the deadline"""
+        deadline = current_deadline()
+        if deadline is None or deadline.remaining() > needed:
+            return
+        self.logger.error("Deadline of %gs exceeded", deadline.budget)
+        sys.exit(EXIT_CODE_REQUEST_NOK)
+
+    def exit_open_circuit(self) -> None:
+        if self.breaker is None:
+            return
+        remaining = self.breaker.check()
+        if remaining > 0:
+            self.logger.error(
+                "ZMF unavailable after %d consecutive failures, "
+                "next attempt in %.0fs",
+                self.breaker.failures,
+                remaining,
+            )
+            sys.exit(EXIT_CODE_REQUEST_NOK)
+
+    def record_outcome(self, ok: bool) -> None:
+        if self.breaker is not None:
+            self.breaker.record(ok)
+
+    def send_limited(
+        self, method: str, url: Union[str, bytes], *args: Any, **kwargs: Any
+    ) -> Response:
+        """One attempt of a request, within the limit of the limiter
+
+        Streamed responses give back their slot once the headers are read.
+        """
+        if self.limiter is None:
+            return super().request(method, url, *args, **kwargs)
+        if isinstance(url, bytes):
+            url = url.decode("utf-8")
+        endpoint = self.endpoint(urljoin(self.prefix_url, url))
+        ticket = self.limiter.acquire()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+        except (ConnectionError, Timeout):
+            self.limiter.release(ticket, endpoint, None)
+            raise
+        except BaseException:
+            self.limiter.cancel(ticket)
+            raise
+        self.limiter.release(ticket, endpoint, resp.status_code)
+        return resp
+
     @unpack_result
     def result_get(self, *args: Any, **kwargs: Any) -> Response:
         return super().get(*args, **kwargs)
 
+    @unpack_result
+    def result_hedged_get(self, url: str, **kwargs: Any) -> Response:
+        """GET, sent once more if the response is late, see HedgePolicy
+
+        For read only requests, the first response wins.
+        """
+        if self.hedge is None:
+            return self.get(url, **kwargs)
+        delay = self.hedge.delay_for(
+            self.metrics, self.endpoint(urljoin(self.prefix_url, url))
+        )
+        if delay is None:
+            return self.get(url, **kwargs)
+        return hedged(
+            lambda: self.get(url, stream=True, **kwargs),
+            delay,
+            self.hedge,
+            Response.close,
+            self.logger,
+        )
+
     @unpack_result
     def result_post(self, *args: Any, **kwargs: Any) -> Response:
         return super().post(*args, **kwargs)
@@ -86,6 +387,34 @@ class ZmfSession(LoggedSession):
     def result_delete(self, *args: Any, **kwargs: Any) -> Response:
         return super().delete(*args, **kwargs)
 
+    @stream_result
+    def stream_get(self, *args: Any, **kwargs: Any) -> Response:
+        return super().get(*args, **kwargs)
+
+
+def body_size(body: Union[str, bytes, None]) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    return len(body)
+
+
+def response_size(resp: Response, stream: bool) -> int:
+    """Size of the body, streamed bodies only if the length is sent"""
+    length = resp.headers.get("content-length")
+    if length is not None and length.isdigit():
+        return int(length)
+    return 0 if stream else len(resp.content)
+
+
+def to_seconds(retry_after: Optional[str]) -> Optional[float]:
+    """Seconds of a Retry-After header, HTTP dates are not supported"""
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
 
 def exit_not_json(r: Response, logger: logging.Logger) -> None:
     t = r.headers.get("content-type", "")
@@ -0,0 +1,70 @@
+import os
+import threading
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Call(Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls with the same key into one
+
+    The first caller of a key runs the function, callers arriving while it
+    is running wait for it and get its result or its exception.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Call[T]] = {}
+
+    def do(self, key: str, func: Callable[[], T]) -> Optional[T]:
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self.calls[key] = Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[bool]:
+    """Exclusive lock on a file shared by processes, yields if it is held
+
+    Without fcntl (Windows) or a writable directory nothing is locked.
+    """
+    try:
+        import fcntl
+
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        f = open(path, "a")
+    except (ImportError, OSError):
+        yield False
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,38 @@
+import time
+
+from typing import Callable
+
+EXIT_CODE_WAIT_NOK = 4
+DEFAULT_WAIT_TIMEOUT = 1800.0
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_POLL_INTERVAL = 30.0
+
+
+def poll(
+    pending: Callable[[], int],
+    timeout: float = DEFAULT_WAIT_TIMEOUT,
+    interval: float = DEFAULT_POLL_INTERVAL,
+    max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+    factor: float = 2.0,
+) -> bool:
+    """Call `pending` until nothing is pending, False after the timeout
+
+    The interval between calls starts at `interval` and grows by `factor`
+    up to `max_interval` while nothing changes. Once fewer are pending it
+    starts over, as more are likely to follow soon.
+    """
+    deadline = time.monotonic() + timeout
+    delay = interval
+    last = None
+    while True:
+        count = pending()
+        if count == 0:
+            return True
+        if last is not None and count < last:
+            delay = interval
+        last = count
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_interval)
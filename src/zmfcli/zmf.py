@@ -1,65 +1,141 @@
+import atexit
+import hashlib
+import json
 import logging
 import os
 import sys
+import threading
+import time
 
-from itertools import groupby, islice
+from functools import partial, wraps
 from pathlib import Path
+from types import FunctionType
 from typing import (
+    Any,
+    Callable,
+    ContextManager,
     Dict,
     Iterable,
     Iterator,
     List,
     Optional,
+    Set,
+    Tuple,
+    Type,
     TypeVar,
     Union,
 )
 
-import fire  # type: ignore
-
-from .logrequests import debug_requests_on
-from .session import (
-    exit_nok,
-    ZmfRequest,
+from .batch import (
+    BATCH_FORMATS,
+    EXIT_CODE_BATCH_NOK,
+    read_commands,
+    run_batch,
+)
+from .breaker import (
+    DEFAULT_BREAKER_COOLDOWN,
+    DEFAULT_BREAKER_THRESHOLD,
+    CircuitBreaker,
+)
+from .cache import DEFAULT_CACHE_SIZE, ResponseCache, default_cache_dir
+from .constants import (
+    COMP_STATUS,
+    ZmfRecord,
     ZmfResult,
-    ZmfSession,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    RETRY_STATUSES,
+    EXIT_CODE_REQUEST_NOK,
     EXIT_CODE_ZMF_NOK,
 )
+from .deadline import command_deadline, current_deadline, to_duration
+from .hedge import DEFAULT_HEDGE_RATE, to_hedge
+from .index import DEFAULT_INDEX_TTL, PackageIndex, index_path
+from .limiter import AdaptiveLimiter
+from .params import (
+    Chunk,
+    browse_params,
+    build_chunks,
+    build_params,
+    checkin_chunks,
+    component_params,
+    create_params,
+    delete_chunks,
+    delete_package_params,
+    extension,
+    load_component_params,
+    package_job_params,
+    package_list_params,
+    promotion_params,
+    revert_params,
+    scratch_chunks,
+    search_params,
+    search_terms,
+    select_package,
+    str_or_none,
+    to_yes_no,
+)
+from .result import status_code, status_codes
+from .singleflight import SingleFlight, file_lock
+from .wait import (
+    DEFAULT_MAX_POLL_INTERVAL,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_WAIT_TIMEOUT,
+)
 
-COMP_STATUS = {
-    "Active": "0",
-    "Approved": "1",
-    "Checkout": "2",
-    "Demoted": "3",
-    "Frozen": "4",
-    "Inactive": "5",
-    "Incomplete": "6",
-    "Promoted": "7",
-    "Refrozen": "8",
-    "Rejected": "9",
-    "Remote promoted": "A",
-    "Submitted for approval": "B",
-    "Unfrozen": "C",
-}
-PROCESSING_OPTION = {"delete": 1, "undelete": 2}
+# fire, requests and the daemon are imported where needed, this keeps the
+# startup of the cli short, e.g. for --help or missing credentials
+
+# read endpoints whose results are cached with a cache_ttl
+CACHED_PATHS = (
+    "component",
+    "component_load",
+    "component_packagelist",
+    "package_search",
+)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+DEFAULT_BUILD_JOBS = 1
+# lock files of get_package, bounded however many packages are resolved
+LOCK_SLOTS = 64
 REQUEST_TYPE = {
     "full promotion history": 1,
     "current status per site": 2,
     "full, including lock records": 3,
 }
-SOURCE_LOCATION: Dict[str, Union[str, int]] = {
-    "development dataset": 1,
-    "package": 5,
-    "temp sequential dataset": 7,
-    "edit from package lib": "E",
-}
-SOURCE_STORAGE: Dict[str, Union[str, int]] = {
-    "pds": 6,
-    "sequential dataset": 8,
-    "pds/extended": 9,
-    "hfs": "H",
-}
 
 
+# type and name of a component
+ComponentKey = Tuple[str, str]
+# commands which run other commands, each with its own deadline
+WITHOUT_DEADLINE = ("batch", "daemon")
+
+C = TypeVar("C")
+
+
+def with_deadline(cls: Type[C]) -> Type[C]:
+    """Start the deadline of a command when it is called"""
+    for name, func in list(vars(cls).items()):
+        if (
+            name.startswith("_")
+            or name in WITHOUT_DEADLINE
+            or not isinstance(func, FunctionType)
+        ):
+            continue
+        setattr(cls, name, deadline_command(func))
+    return cls
+
+
+def deadline_command(func: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(func)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        with self._command_deadline():
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+@with_deadline
 class ChangemanZmf:
     """
     Command line interface for ZMF REST API
@@ -69,6 +145,7 @@ class ChangemanZmf:
         delete                DELETE component
         build                 PUT component/build
         scratch               PUT component/scratch
+        delta                 Scratch, checkin and build changes in git
         audit                 PUT package/audit
         promote               PUT package/promote
         demote                PUT package/demote
@@ -78,10 +155,15 @@ class ChangemanZmf:
         create_package        POST package
         delete_package        DELETE package
         get_package           Search or create if package does not exist
+        wait_for              Wait until components reach a status
         get_components        GET component
         get_load_components   GET component/load
         get_package_list      GET component/packagelist
         browse_component      GET component/browse
+        download_package      Download components of a package
+        get_metrics           Request metrics per endpoint
+        batch                 Run many commands on one session
+        daemon                Serve zmf invocations from a warm process
 
     Get help for commands with
         zmf [command] --help
@@ -93,6 +175,30 @@ class ChangemanZmf:
         password: Optional[str] = None,
         url: Optional[str] = None,
         verbose: bool = False,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        keep_alive: Optional[bool] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        retry_statuses: Union[int, str, Iterable[int], None] = None,
+        retry_mutating: Optional[bool] = None,
+        cache_ttl: Optional[float] = None,
+        cache_dir: Optional[str] = None,
+        cache_size: Optional[int] = None,
+        build_jobs: Optional[int] = None,
+        package_index: Optional[bool] = None,
+        index_ttl: Optional[float] = None,
+        metrics_file: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        breaker_threshold: Optional[int] = None,
+        breaker_cooldown: Optional[float] = None,
+        breaker_file: Optional[str] = None,
+        deadline: Optional[Union[str, float]] = None,
+        hedge: Optional[Union[str, float]] = None,
+        hedge_rate: Optional[float] = None,
     ) -> None:
         self.url: str = url if url else os.environ["ZMF_REST_URL"]
         self.__user: str = user if user else os.environ["ZMF_REST_USER"]
@@ -101,115 +207,489 @@ class ChangemanZmf:
         )
         logging.basicConfig()
         self.logger: logging.Logger = logging.getLogger(__name__)
-        self.__session: ZmfSession = ZmfSession(self.url)
+        from .session import RetryPolicy, ZmfSession
+
+        maxsize = from_env(
+            pool_maxsize, "ZMF_REST_POOL_MAXSIZE", int, DEFAULT_POOL_MAXSIZE
+        )
+        self.__session = ZmfSession(
+            self.url,
+            pool_connections=from_env(
+                pool_connections,
+                "ZMF_REST_POOL_CONNECTIONS",
+                int,
+                DEFAULT_POOL_CONNECTIONS,
+            ),
+            pool_maxsize=maxsize,
+            keep_alive=from_env(
+                keep_alive, "ZMF_REST_KEEPALIVE", to_bool, True
+            ),
+            connect_timeout=from_env(
+                connect_timeout, "ZMF_REST_CONNECT_TIMEOUT", float, None
+            ),
+            read_timeout=from_env(
+                read_timeout, "ZMF_REST_READ_TIMEOUT", float, None
+            ),
+            retry=RetryPolicy(
+                attempts=1
+                + from_env(retries, "ZMF_REST_RETRIES", int, DEFAULT_RETRIES),
+                backoff=from_env(
+                    backoff, "ZMF_REST_BACKOFF", float, DEFAULT_BACKOFF
+                ),
+                statuses=tuple(
+                    from_env(
+                        (
+                            None
+                            if retry_statuses is None
+                            else to_ints(retry_statuses)
+                        ),
+                        "ZMF_REST_RETRY_STATUSES",
+                        to_ints,
+                        list(RETRY_STATUSES),
+                    )
+                ),
+                retry_mutating=from_env(
+                    retry_mutating, "ZMF_REST_RETRY_MUTATING", to_bool, False
+                ),
+            ),
+            limiter=AdaptiveLimiter(
+                from_env(
+                    max_concurrency, "ZMF_REST_MAX_CONCURRENCY", int, maxsize
+                ),
+                rate=from_env(rate_limit, "ZMF_REST_RATE_LIMIT", float, None),
+            ),
+        )
+        hedge_after = from_env(
+            None if hedge is None else str(hedge), "ZMF_REST_HEDGE", str, ""
+        )
+        if hedge_after:
+            self.__session.hedge = to_hedge(
+                hedge_after,
+                from_env(
+                    hedge_rate,
+                    "ZMF_REST_HEDGE_RATE",
+                    float,
+                    DEFAULT_HEDGE_RATE,
+                ),
+            )
+        threshold = from_env(
+            breaker_threshold,
+            "ZMF_REST_BREAKER_THRESHOLD",
+            int,
+            DEFAULT_BREAKER_THRESHOLD,
+        )
+        if threshold > 0:
+            self.__session.breaker = CircuitBreaker(
+                threshold,
+                from_env(
+                    breaker_cooldown,
+                    "ZMF_REST_BREAKER_COOLDOWN",
+                    float,
+                    DEFAULT_BREAKER_COOLDOWN,
+                ),
+                from_env(breaker_file, "ZMF_REST_BREAKER_FILE", str, None),
+            )
         self.__session.auth = (self.__user, self.__password)
+        self.__build_jobs = max(
+            1, from_env(build_jobs, "ZMF_BUILD_JOBS", int, DEFAULT_BUILD_JOBS)
+        )
+        # shared by all builds of this instance, e.g. in batch or daemon
+        self.__build_slots = threading.BoundedSemaphore(self.__build_jobs)
+        cache_root = from_env(
+            cache_dir, "ZMF_CACHE_DIR", str, default_cache_dir()
+        )
+        self.__cache: Optional[ResponseCache] = None
+        ttl = from_env(cache_ttl, "ZMF_CACHE_TTL", float, 0.0)
+        if ttl > 0:
+            self.__cache = ResponseCache(
+                self.url + " " + self.__user,
+                ttl,
+                os.path.join(cache_root, "responses"),
+                from_env(
+                    cache_size, "ZMF_CACHE_SIZE", int, DEFAULT_CACHE_SIZE
+                ),
+            )
+        self.__lock_dir = os.path.join(cache_root, "locks")
+        self.__checkin_dir = os.path.join(cache_root, "checkin")
+        self.__flights: SingleFlight[Optional[str]] = SingleFlight()
+        self.__index: Optional[PackageIndex] = None
+        if from_env(package_index, "ZMF_PACKAGE_INDEX", to_bool, False):
+            self.__index = PackageIndex(
+                index_path(cache_root, self.url),
+                from_env(
+                    index_ttl,
+                    "ZMF_PACKAGE_INDEX_TTL",
+                    float,
+                    DEFAULT_INDEX_TTL,
+                ),
+            )
+        self.__deadline = from_env(
+            None if deadline is None else to_duration(deadline),
+            "ZMF_DEADLINE",
+            to_duration,
+            0.0,
+        )
+        metrics_path = from_env(metrics_file, "ZMF_METRICS_FILE", str, None)
+        if metrics_path:
+            atexit.register(self.__session.metrics.write, metrics_path)
         if verbose:
             logging.getLogger().setLevel(logging.DEBUG)
+            from .logrequests import debug_requests_on
+
             debug_requests_on()
         else:
             logging.getLogger().setLevel(logging.INFO)
 
+    def _command_deadline(self) -> ContextManager[None]:
+        return command_deadline(self.__deadline)
+
     def _get(
         self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
     ) -> Optional[ZmfResult]:
-        return self.__session.result_get(
-            to_path(path_name), data=prepare_bools(params)
+        data = prepare_bools(params)
+        cache = self.__cache if path_name in CACHED_PATHS else None
+        if cache is not None:
+            hit, result = cache.get(path_name, data)
+            if hit:
+                self.logger.info("GET %s from cache", to_path(path_name))
+                return result
+        return self._get_fresh(path_name, **params)
+
+    def _get_fresh(
+        self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Optional[ZmfResult]:
+        """GET bypassing the response cache, its result is cached"""
+        data = prepare_bools(params)
+        cache = self.__cache if path_name in CACHED_PATHS else None
+        result = self.__session.result_hedged_get(
+            to_path(path_name), data=data
         )
+        if cache is not None:
+            cache.put(path_name, data, result)
+        return result
+
+    def _get_stream(
+        self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Iterator[ZmfRecord]:
+        """Records of a GET request, decoded while the response is read"""
+        data = prepare_bools(params)
+        cache = self.__cache if path_name in CACHED_PATHS else None
+        if cache is not None:
+            hit, result = cache.get(path_name, data)
+            if hit:
+                self.logger.info("GET %s from cache", to_path(path_name))
+                return iter(result or [])
+        return self.__session.stream_get(to_path(path_name), data=data)
 
     def _post(
         self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
     ) -> Optional[ZmfResult]:
-        return self.__session.result_post(
-            to_path(path_name), data=prepare_bools(params)
-        )
+        result = None
+        try:
+            result = self.__session.result_post(
+                to_path(path_name), data=prepare_bools(params)
+            )
+            return result
+        finally:
+            self._invalidate(params, result)
 
     def _put(
         self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
     ) -> Optional[ZmfResult]:
-        return self.__session.result_put(
-            to_path(path_name), data=prepare_bools(params)
-        )
+        try:
+            return self.__session.result_put(
+                to_path(path_name), data=prepare_bools(params)
+            )
+        finally:
+            self._invalidate(params)
 
     def _delete(
         self, path_name: str, **params: Union[int, str, bool, Iterable[str]]
     ) -> Optional[ZmfResult]:
-        return self.__session.result_delete(
-            to_path(path_name), data=prepare_bools(params)
-        )
+        try:
+            return self.__session.result_delete(
+                to_path(path_name), data=prepare_bools(params)
+            )
+        finally:
+            self._invalidate(params)
+
+    def _invalidate(
+        self,
+        params: Dict[str, Union[int, str, bool, Iterable[str]]],
+        result: Optional[ZmfResult] = None,
+    ) -> None:
+        """Drop cached results of packages changed by a request
+
+        Also after failed requests, they may have changed the package
+        partially.
+        """
+        if self.__cache is None:
+            return
+        packages = [params.get("package")]
+        packages.extend(r.get("package") for r in result or [])
+        for package in packages:
+            if isinstance(package, str):
+                self.__cache.invalidate(package)
 
     def checkin(
-        self, package: str, pds: str, components: Iterable[str]
+        self,
+        package: str,
+        pds: str,
+        components: Optional[Iterable[str]] = None,
+        parallel: int = 1,
+        incremental: bool = False,
+        verify: bool = False,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
     ) -> None:
-        """Checkin components to Changeman from a partitioned dataset (PDS)"""
-        for group_type, comp_group in groupby(
-            sorted(components, key=extension), extension
-        ):
-            for comp_chunk in chunks(comp_group, 64):
-                self._put(
-                    "component_checkin",
-                    package=package,
-                    chkInSourceLocation=SOURCE_LOCATION["development dataset"],
-                    sourceStorageMeans=SOURCE_STORAGE["pds"],
-                    componentType=group_type.upper(),
-                    sourceLib=pds + "." + group_type.upper(),
-                    targetComponent=[Path(c).stem for c in comp_chunk],
-                )
+        """Checkin components to Changeman from a partitioned dataset (PDS)
+
+        Components are checked in by type in chunks of 64, with up to
+        `parallel` chunks in flight at the same time.
 
-    def delete(self, package: str, component: str, componentType: str) -> None:
-        self._delete(
-            "component",
-            package=package,
-            targetComponent=component,
-            componentType=componentType,
+        With `incremental` hash, size and mtime of the local files are
+        recorded per package, and only new or changed files are checked in,
+        with `verify` also those missing in the package on the server.
+
+        Files added or changed in git since a revision or in a range of
+        revisions, e.g. `main..HEAD`, are checked in with `since`/`range`.
+        """
+        from .download import (
+            fingerprint,
+            is_unchanged,
+            load_manifest,
+            save_manifest,
+        )
+
+        manifest_path = os.path.join(
+            self.__checkin_dir, short_hash(self.url + " " + package) + ".json"
         )
+        manifest = load_manifest(manifest_path) if incremental else {}
+        components = self._select(components, since, range)
+        if incremental:
+            on_server = None
+            if verify:
+                on_server = self._component_keys(package)
+            changed = [
+                c
+                for c in components
+                if not (
+                    manifest.get(os.path.normpath(c), {}).get("pds") == pds
+                    and is_unchanged(c, manifest.get(os.path.normpath(c)))
+                    and (
+                        on_server is None
+                        or (extension(c).upper(), Path(c).stem) in on_server
+                    )
+                )
+            ]
+            self.logger.info(
+                "%d of %d components unchanged",
+                len(components) - len(changed),
+                len(components),
+            )
+            components = changed
+        lock = threading.Lock()
+
+        def checkin_chunk(chunk: Chunk) -> None:
+            if not incremental:
+                self._put("component_checkin", **chunk.params)
+                return
+            # taken before, a file changed meanwhile is checked in again
+            fingerprints = {
+                os.path.normpath(c): fingerprint(c) for c in chunk.components
+            }
+            self._put("component_checkin", **chunk.params)
+            with lock:
+                for key, fp in fingerprints.items():
+                    if fp is not None:
+                        manifest[key] = {**fp, "pds": pds}
+
+        tasks = [
+            (chunk.label, partial(checkin_chunk, chunk))
+            for chunk in checkin_chunks(package, pds, components)
+        ]
+        try:
+            run_parallel(tasks, parallel, self.logger)
+        finally:
+            if incremental:
+                try:
+                    os.makedirs(self.__checkin_dir, mode=0o700, exist_ok=True)
+                    save_manifest(manifest_path, manifest)
+                except OSError as e:
+                    self.logger.warning("Checkin manifest not saved: %s", e)
+
+    def _component_keys(self, package: str) -> Set[Tuple[str, str]]:
+        """Type and name of the components in a package on the server"""
+        try:
+            records = self._get("component", package=package)
+        except SystemExit as e:
+            if e.code != EXIT_CODE_ZMF_NOK:
+                sys.exit(e.code)
+            records = None
+        return {
+            (str(r.get("componentType", "")).upper(), str(r.get("component")))
+            for r in records or []
+        }
+
+    def delete(
+        self,
+        package: str,
+        component: Union[str, Iterable[str]],
+        componentType: Optional[str] = None,
+        parallel: int = 1,
+    ) -> None:
+        """Delete components from a package
+
+        Components are names of type `componentType`, or paths typed by
+        their extension. They are deleted by type in chunks of 64, with up
+        to `parallel` chunks in flight at the same time.
+        """
+        components = [component] if isinstance(component, str) else component
+        tasks = [
+            (chunk.label, partial(self._delete, "component", **chunk.params))
+            for chunk in delete_chunks(package, components, componentType)
+        ]
+        run_parallel(tasks, parallel, self.logger)
 
     def build(
         self,
         package: str,
-        components: Iterable[str],
+        components: Optional[Iterable[str]] = None,
         procedure: Optional[str] = None,
         language: Optional[str] = None,
         db2Precompile: Optional[bool] = None,
         useHistory: Optional[bool] = None,
         params: Optional[Dict[str, str]] = None,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        wait: bool = False,
+        wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+    ) -> Optional[Dict[str, str]]:
+        """Build source like components
+
+        With `since`/`range` also files added or changed in git.
+
+        One build job is submitted per type, or per `chunk_size` components
+        of a type. Jobs of different types are submitted concurrently, at
+        most `build_jobs` (ZMF_BUILD_JOBS) at the same time.
+
+        With `wait` returns once the components are rebuilt and active,
+        see `wait_for`.
+        """
+        components = self._select(components, since, range)
+        options = build_params(
+            self.__user, procedure, language, db2Precompile, useHistory, params
+        )
+        tasks = [
+            (chunk.label, partial(self._submit_build, **chunk.params))
+            for chunk in build_chunks(package, components, options, chunk_size)
+        ]
+        before = self._component_versions(package) if wait else None
+        run_parallel(tasks, self.__build_jobs, self.logger)
+        if not wait:
+            return None
+        return self._wait(
+            package,
+            components,
+            status="Active",
+            failed="Incomplete",
+            before=before,
+            timeout=wait_timeout,
+        )
+
+    def _submit_build(
+        self, **params: Union[int, str, bool, Iterable[str]]
+    ) -> Optional[ZmfResult]:
+        """Submit a build job, holding one of the build job slots"""
+        with self.__build_slots:
+            return self._put("component_build", **params)
+
+    def scratch(
+        self,
+        package: str,
+        components: Optional[Iterable[str]] = None,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+        parallel: int = 1,
     ) -> None:
-        """Build source like components"""
-        jobcard_dict = jobcard(self.__user, "build")
-        data: ZmfRequest = {}
-        if params is not None:
-            data.update(params)
-        if procedure is not None:
-            data["buildProc"] = procedure
-        if language is not None:
-            data["language"] = language
-        if db2Precompile is not None:
-            data["useDb2PreCompileOption"] = to_yes_no(db2Precompile)
-        if useHistory is not None:
-            data["useHistory"] = to_yes_no(useHistory)
-        for t, comp_group in groupby(
-            sorted(components, key=extension), extension
-        ):
-            self._put(
-                "component_build",
-                package=package,
-                componentType=t.upper(),
-                component=[Path(c).stem for c in comp_group],
-                **jobcard_dict,
-                **data,
-            )
+        """Scratch components, with `since`/`range` files deleted in git
 
-    def scratch(self, package: str, components: Iterable[str]) -> None:
-        for comp in components:
-            self._put(
-                "component_scratch",
-                package=package,
-                componentType=extension(comp).upper(),
-                oldComponent=Path(comp).stem,
+        component/scratch takes one component per request, up to `parallel`
+        requests are in flight at the same time.
+        """
+        selected = self._select(components, since, range, deleted=True)
+        tasks = [
+            (
+                chunk.label,
+                partial(self._put, "component_scratch", **chunk.params),
             )
+            for chunk in scratch_chunks(package, selected)
+        ]
+        run_parallel(tasks, parallel, self.logger)
+
+    def delta(
+        self,
+        package: str,
+        pds: str,
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+        build: Union[bool, str] = True,
+        parallel: int = 1,
+    ) -> Dict[str, List[str]]:
+        """Apply the changes in git between two revisions to a package
+
+        Files deleted in git are scratched, added or changed files are
+        checked in and, unless `build` is false, built.
+        """
+        if isinstance(build, str):
+            # fire passes e.g. --build false as a string
+            build = to_bool(build)
+        changed, deleted = self._git_changes(since, range)
+        if deleted:
+            self.scratch(package, deleted, parallel=parallel)
+        if changed:
+            self.checkin(package, pds, changed, parallel=parallel)
+            if build:
+                self.build(package, changed)
+        return {"changed": changed, "deleted": deleted}
+
+    def _select(
+        self,
+        components: Optional[Iterable[str]],
+        since: Optional[str] = None,
+        range: Optional[str] = None,
+        deleted: bool = False,
+    ) -> List[str]:
+        """Given components and those changed, or deleted, in git"""
+        selected = list(components or [])
+        if since is not None or range is not None:
+            changed, removed = self._git_changes(since, range)
+            selected.extend(removed if deleted else changed)
+        return selected
+
+    def _git_changes(
+        self, since: Optional[str] = None, range: Optional[str] = None
+    ) -> Tuple[List[str], List[str]]:
+        from .gitdiff import EXIT_CODE_GIT_NOK, GitError, git_changes
+
+        try:
+            changed, deleted = git_changes(since, range)
+        except GitError as e:
+            self.logger.error(e)
+            sys.exit(EXIT_CODE_GIT_NOK)
+        self.logger.info(
+            "%d changed and %d deleted files in git",
+            len(changed),
+            len(deleted),
+        )
+        return changed, deleted
 
     def audit(self, package: str) -> None:
-        jobcard_dict = jobcard(self.__user, "audit")
-        self._put("package_audit", package=package, **jobcard_dict)
+        self._put(
+            "package_audit",
+            **package_job_params(self.__user, "audit", package),
+        )
 
     def promote(
         self,
@@ -218,21 +698,25 @@ class ChangemanZmf:
         promLevel: int,
         promName: str,
         overlay: Optional[bool] = None,
-    ) -> None:
-        """Promote a package"""
-        data = {}
-        if overlay is not None:
-            data["overlayTargetComponents"] = to_yes_no(overlay)
-        jobcard_dict = jobcard_s(self.__user, "promote")
+        wait: bool = False,
+        wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+    ) -> Optional[Dict[str, str]]:
+        """Promote a package, with `wait` until its components are promoted"""
         self._put(
             "package_promote",
-            package=package,
-            promotionSiteName=promSiteName,
-            promotionLevel=promLevel,
-            promotionName=promName,
-            **data,
-            **jobcard_dict,
+            **promotion_params(
+                self.__user,
+                "promote",
+                package,
+                promSiteName,
+                promLevel,
+                promName,
+                overlay,
+            ),
         )
+        if not wait:
+            return None
+        return self._wait(package, status="Promoted", timeout=wait_timeout)
 
     def demote(
         self,
@@ -240,28 +724,184 @@ class ChangemanZmf:
         promSiteName: str,
         promLevel: int,
         promName: str,
-    ) -> None:
-        """Demote a package"""
-        jobcard_dict = jobcard_s(self.__user, "demote")
+        wait: bool = False,
+        wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+    ) -> Optional[Dict[str, str]]:
+        """Demote a package, with `wait` until its components are demoted"""
         self._put(
             "package_demote",
-            package=package,
-            promotionSiteName=promSiteName,
-            promotionLevel=promLevel,
-            promotionName=promName,
-            **jobcard_dict,
+            **promotion_params(
+                self.__user,
+                "demote",
+                package,
+                promSiteName,
+                promLevel,
+                promName,
+            ),
+        )
+        if not wait:
+            return None
+        return self._wait(package, status="Demoted", timeout=wait_timeout)
+
+    def freeze(
+        self,
+        package: str,
+        wait: bool = False,
+        wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+    ) -> Optional[Dict[str, str]]:
+        """Freeze a package, with `wait` until its components are frozen"""
+        self._put(
+            "package_freeze",
+            **package_job_params(self.__user, "freeze", package),
         )
+        if not wait:
+            return None
+        return self._wait(package, status="Frozen", timeout=wait_timeout)
+
+    def wait_for(
+        self,
+        package: str,
+        components: Optional[Iterable[str]] = None,
+        status: Union[str, Iterable[str]] = "Active",
+        failed: Union[str, Iterable[str], None] = None,
+        timeout: float = DEFAULT_WAIT_TIMEOUT,
+        interval: float = DEFAULT_POLL_INTERVAL,
+        max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+    ) -> Dict[str, str]:
+        """Wait until components of a package reach a status
+
+        `components` are names or paths typed by their extension, if not
+        given all components of the package which are not inactive.
+        `status` and `failed` are names of component statuses, e.g.
+        "Active", or lists of them. The component list of the package is
+        polled, first every `interval` seconds, slower up to every
+        `max_interval` seconds while nothing changes.
 
-    def freeze(self, package: str) -> None:
-        jobcard_dict = jobcard(self.__user, "freeze")
-        self._put("package_freeze", package=package, **jobcard_dict)
+        Returns the status per component. Exits with 3 once a component is
+        in a `failed` status, and with 4 after `timeout` seconds.
+        """
+        return self._wait(
+            package,
+            components,
+            status,
+            failed,
+            timeout=timeout,
+            interval=interval,
+            max_interval=max_interval,
+        )
+
+    def _wait(
+        self,
+        package: str,
+        components: Optional[Iterable[str]] = None,
+        status: Union[str, Iterable[str]] = "Active",
+        failed: Union[str, Iterable[str], None] = None,
+        before: Optional[Dict[ComponentKey, Tuple[Any, ...]]] = None,
+        timeout: float = DEFAULT_WAIT_TIMEOUT,
+        interval: float = DEFAULT_POLL_INTERVAL,
+        max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+    ) -> Dict[str, str]:
+        """Like `wait_for`, components listed in `before` also need to
+        have changed their version since"""
+        from .download import VERSION_FIELDS
+        from .wait import EXIT_CODE_WAIT_NOK, poll
+
+        targets = status_codes(status)
+        failures = status_codes(failed)
+        wanted = (
+            None
+            if components is None
+            else [component_key(c) for c in components]
+        )
+        statuses: Dict[str, str] = {}
+        waiting: List[str] = []
+        failing: List[str] = []
+
+        def pending() -> int:
+            result = self._poll_components(package)
+            if not result:
+                # a failed or empty poll never completes the wait
+                waiting[:] = ["components of " + package]
+                return 1
+            records = {record_key(r): r for r in result}
+            keys = [
+                key
+                for key, r in records.items()
+                if status_code(r) != COMP_STATUS["Inactive"]
+            ]
+            if wanted is not None:
+                keys = [find_key(key, records) for key in wanted]
+            statuses.clear()
+            waiting.clear()
+            for key in keys:
+                name = key[1] + "." + key[0].lower()
+                record = records.get(key)
+                if record is None or (
+                    before is not None
+                    and before.get(key)
+                    == tuple(record.get(f) for f in VERSION_FIELDS)
+                ):
+                    waiting.append(name)
+                    continue
+                statuses[name] = str(record.get("componentStatus"))
+                code = status_code(record)
+                if code in failures and name not in failing:
+                    failing.append(name)
+                elif code not in targets:
+                    waiting.append(name)
+            return 0 if failing else len(waiting)
+
+        deadline = current_deadline()
+        by_deadline = deadline is not None and deadline.remaining() < timeout
+        if deadline is not None and by_deadline:
+            # no longer than the deadline of the command
+            timeout = max(0.0, deadline.remaining())
+        done = poll(pending, timeout, interval, max_interval)
+        for name in failing:
+            self.logger.error("%s is %s", name, statuses[name])
+        if failing:
+            sys.exit(EXIT_CODE_ZMF_NOK)
+        if not done and deadline is not None and by_deadline:
+            self.logger.error(
+                "Deadline of %gs exceeded waiting for %s",
+                deadline.budget,
+                ", ".join(waiting),
+            )
+            sys.exit(EXIT_CODE_REQUEST_NOK)
+        if not done:
+            self.logger.error(
+                "Timeout after %ss waiting for %s", timeout, ", ".join(waiting)
+            )
+            sys.exit(EXIT_CODE_WAIT_NOK)
+        return statuses
+
+    def _poll_components(self, package: str) -> Optional[ZmfResult]:
+        """Components of a package, bypassing the response cache, None if
+        ZMF returned an error"""
+        try:
+            return self.__session.result_get(
+                "component", data={"package": package}
+            )
+        except SystemExit as e:
+            if e.code != EXIT_CODE_ZMF_NOK:
+                raise
+            return None
+
+    def _component_versions(
+        self, package: str
+    ) -> Dict[ComponentKey, Tuple[Any, ...]]:
+        from .download import VERSION_FIELDS
+
+        return {
+            record_key(r): tuple(r.get(f) for f in VERSION_FIELDS)
+            for r in self._poll_components(package) or []
+        }
 
     def revert(self, package: str, revertReason: Optional[str] = None) -> None:
-        data = {}
-        if revertReason is not None:
-            data["revertReason01"] = revertReason
-        jobcard_dict = jobcard(self.__user, "revert")
-        self._put("package_revert", package=package, **data, **jobcard_dict)
+        self._put(
+            "package_revert",
+            **revert_params(self.__user, package, revertReason),
+        )
 
     def search_package(
         self,
@@ -269,28 +909,24 @@ class ChangemanZmf:
         packageTitle: str,
         workChangeRequest: Optional[str] = None,
     ) -> Optional[str]:
-        data = {}
-        if workChangeRequest is not None:
-            data["workChangeRequest"] = workChangeRequest
-        result = self._get(
+        return self._search_package(applName, packageTitle, workChangeRequest)
+
+    def _search_package(
+        self,
+        applName: str,
+        packageTitle: str,
+        workChangeRequest: Optional[str] = None,
+        fresh: bool = False,
+    ) -> Optional[str]:
+        """Like `search_package`, with `fresh` not from the response cache"""
+        get = self._get_fresh if fresh else self._get
+        result = get(
             "package_search",
-            package=applName + "*",
-            packageTitle=packageTitle,
-            **data,
+            **search_params(applName, packageTitle, workChangeRequest),
         )
-        pkg_id = None
-        # in case multiple packages have been found take the youngest
-        if result:
-            for pkg in sorted(
-                result,
-                key=lambda p: int_or_zero(p.get("packageId")),
-                reverse=True,
-            ):
-                # search matches title as substring, ensure full title matches
-                if pkg.get("packageTitle") == packageTitle:
-                    pkg_id = pkg.get("package")
-                    break
-        return str_or_none(pkg_id)
+        if self.__index is not None:
+            self.__index.add(applName, result, workChangeRequest)
+        return select_package(result, packageTitle)
 
     def create_package(
         self,
@@ -299,26 +935,22 @@ class ChangemanZmf:
         workChangeRequest: Optional[str] = None,
         params: Optional[Dict[str, str]] = None,
     ) -> Optional[str]:
-        if params is not None:
-            data = params.copy()
-        else:
-            data = {}
-        if applName is not None:
-            data["applName"] = applName
-        if packageTitle is not None:
-            data["packageTitle"] = packageTitle
-        if workChangeRequest is not None:
-            data["workChangeRequest"] = workChangeRequest
+        data = create_params(applName, packageTitle, workChangeRequest, params)
         result = self._post("package", **data)
         self.logger.info(result)
+        if self.__index is not None and result and "applName" in data:
+            title = data.get("packageTitle", "")
+            self.__index.add(
+                data["applName"],
+                [{"packageTitle": title, **r} for r in result],
+                data.get("workChangeRequest"),
+            )
         return str_or_none(result[0].get("package")) if result else None
 
     def delete_package(self, package: str) -> None:
-        self._delete(
-            "package",
-            package=package,
-            processingOption=PROCESSING_OPTION["delete"],
-        )
+        self._delete("package", **delete_package_params(package))
+        if self.__index is not None:
+            self.__index.remove(package)
 
     def get_package(
         self,
@@ -327,26 +959,50 @@ class ChangemanZmf:
         workChangeRequest: Optional[str] = None,
         params: Optional[Dict[str, str]] = None,
     ) -> Optional[str]:
-        pkg_id = None
-        if params is not None:
-            pkg_id = params.get("package")
-        if not pkg_id:
-            if params is None:
-                search_app = applName
-                search_title = packageTitle
-                search_request = workChangeRequest
-            else:
-                search_app = params.get("applName", applName)
-                search_title = params.get("packageTitle", packageTitle)
-                search_request = params.get(
-                    "workChangeRequest", workChangeRequest
+        """Search a package by title, create it if it does not exist
+
+        Concurrent calls for the same package, by threads or processes,
+        share one search and create at most one package. Processes lock
+        one of LOCK_SLOTS files in the cache, keys may share a slot.
+        """
+        if params is not None and params.get("package"):
+            return params["package"]
+        key = json.dumps(
+            [self.url, applName, packageTitle, workChangeRequest, params],
+            sort_keys=True,
+        )
+        slot = int(short_hash(key), 16) % LOCK_SLOTS
+        lock_path = os.path.join(self.__lock_dir, "{:02d}.lock".format(slot))
+
+        def resolve() -> Optional[str]:
+            with file_lock(lock_path):
+                return self._resolve_package(
+                    applName, packageTitle, workChangeRequest, params
                 )
-            if search_app is not None and search_title is not None:
+
+        return self.__flights.do(key, resolve)
+
+    def _resolve_package(
+        self,
+        applName: Optional[str] = None,
+        packageTitle: Optional[str] = None,
+        workChangeRequest: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        pkg_id = None
+        search_app, search_title, search_request = search_terms(
+            applName, packageTitle, workChangeRequest, params
+        )
+        if search_app is not None and search_title is not None:
+            pkg_id = self._lookup_package(
+                search_app, search_title, search_request
+            )
+            if not pkg_id:
                 try:
-                    pkg_id = self.search_package(
-                        applName=search_app,
-                        packageTitle=search_title,
-                        workChangeRequest=search_request,
+                    # a cached search may predate a create by another
+                    # process holding the lock before
+                    pkg_id = self._search_package(
+                        search_app, search_title, search_request, fresh=True
                     )
                 except SystemExit as e:
                     if e.code != EXIT_CODE_ZMF_NOK:
@@ -360,6 +1016,45 @@ class ChangemanZmf:
             )
         return pkg_id
 
+    def _lookup_package(
+        self,
+        applName: str,
+        packageTitle: str,
+        workChangeRequest: Optional[str] = None,
+    ) -> Optional[str]:
+        """Package from the local index, None if unknown or gone
+
+        Entries older than the index ttl are verified with a search for
+        exactly this package, instead of all packages of the application.
+        """
+        if self.__index is None:
+            return None
+        entry = self.__index.lookup(applName, packageTitle, workChangeRequest)
+        if entry is None:
+            return None
+        if self.__index.is_fresh(entry):
+            self.logger.info("Package %s from index", entry["package"])
+            return entry["package"]
+        try:
+            result = self._get(
+                "package_search",
+                package=entry["package"],
+                packageTitle=packageTitle,
+            )
+        except SystemExit as e:
+            if e.code != EXIT_CODE_ZMF_NOK:
+                sys.exit(e.code)
+            result = None
+        if any(
+            pkg.get("package") == entry["package"]
+            and pkg.get("packageTitle") == packageTitle
+            for pkg in result or []
+        ):
+            self.__index.verify(entry)
+            return entry["package"]
+        self.__index.remove(entry["package"])
+        return None
+
     def get_components(
         self,
         package: str,
@@ -369,21 +1064,24 @@ class ChangemanZmf:
         filterActive: Optional[bool] = None,
         filterIncomplete: Optional[bool] = None,
         filterInactive: Optional[bool] = None,
-    ) -> Optional[ZmfResult]:
-        data = {}
-        if componentType is not None:
-            data["componentType"] = componentType
-        if component is not None:
-            data["component"] = component
-        if targetComponent is not None:
-            data["targetComponent"] = targetComponent
-        if filterActive is not None:
-            data["filterActiveStatus"] = to_yes_no(filterActive)
-        if filterIncomplete is not None:
-            data["filterIncompleteStatus"] = to_yes_no(filterIncomplete)
-        if filterInactive is not None:
-            data["filterInactiveStatus"] = to_yes_no(filterInactive)
-        return self._get("component", package=package, **data)
+        stream: bool = False,
+        output: Optional[str] = None,
+    ) -> Union[Optional[ZmfResult], Iterator[ZmfRecord]]:
+        data = component_params(
+            package,
+            componentType,
+            component,
+            targetComponent,
+            filterActive,
+            filterIncomplete,
+            filterInactive,
+        )
+        if output is not None:
+            self._output(output, "component", **data)
+            return None
+        if stream:
+            return self._get_stream("component", **data)
+        return self._get("component", **data)
 
     def get_load_components(
         self,
@@ -392,17 +1090,18 @@ class ChangemanZmf:
         sourceComponent: Optional[str] = None,
         targetType: Optional[str] = None,
         targetComponent: Optional[str] = None,
-    ) -> Optional[ZmfResult]:
-        data = {}
-        if sourceType is not None:
-            data["componentType"] = sourceType
-        if sourceComponent is not None:
-            data["component"] = sourceComponent
-        if targetType is not None:
-            data["targetComponentType"] = targetType
-        if targetComponent is not None:
-            data["targetComponent"] = targetComponent
-        return self._get("component_load", package=package, **data)
+        stream: bool = False,
+        output: Optional[str] = None,
+    ) -> Union[Optional[ZmfResult], Iterator[ZmfRecord]]:
+        data = load_component_params(
+            package, sourceType, sourceComponent, targetType, targetComponent
+        )
+        if output is not None:
+            self._output(output, "component_load", **data)
+            return None
+        if stream:
+            return self._get_stream("component_load", **data)
+        return self._get("component_load", **data)
 
     def get_package_list(
         self,
@@ -410,26 +1109,61 @@ class ChangemanZmf:
         componentType: Optional[str] = None,
         component: Optional[str] = None,
         targetComponent: Optional[str] = None,
-    ) -> Optional[ZmfResult]:
-        data = {}
-        if componentType is not None:
-            data["sourceComponentType"] = componentType
-        if component is not None:
-            data["sourceComponent"] = component
-        if targetComponent is not None:
-            data["targetComponent"] = targetComponent
-        return self._get("component_packagelist", package=package, **data)
+        stream: bool = False,
+        output: Optional[str] = None,
+    ) -> Union[Optional[ZmfResult], Iterator[ZmfRecord]]:
+        data = package_list_params(
+            package, componentType, component, targetComponent
+        )
+        if output is not None:
+            self._output(output, "component_packagelist", **data)
+            return None
+        if stream:
+            return self._get_stream("component_packagelist", **data)
+        return self._get("component_packagelist", **data)
+
+    def _output(
+        self,
+        output: str,
+        path_name: str,
+        **params: Union[int, str, bool, Iterable[str]],
+    ) -> None:
+        """Write records of a GET request to stdout while they are read"""
+        from .output import EXIT_CODE_OUTPUT_NOK, OUTPUT_FORMATS, write_records
+
+        if output not in OUTPUT_FORMATS:
+            self.logger.error(
+                "Unknown output '{}', expected one of {}".format(
+                    output, ", ".join(OUTPUT_FORMATS)
+                )
+            )
+            sys.exit(EXIT_CODE_OUTPUT_NOK)
+        count = write_records(
+            self._get_stream(path_name, **params), output, sys.stdout
+        )
+        self.logger.info("%d records written", count)
 
     def browse_component(
-        self, package: str, component: str, componentType: str
-    ) -> Optional[str]:
-        result = None
-        data = {
-            "package": package,
-            "component": component,
-            "componentType": componentType,
-        }
-        resp = self.__session.get("component/browse", data=data)
+        self,
+        package: str,
+        component: str,
+        componentType: str,
+        dest: Optional[str] = None,
+    ) -> Union[str, Dict[str, Any], None]:
+        """Browse a component, the attachment is returned or saved to `dest`
+
+        `dest` is a file, or a directory for a file named after the
+        content-disposition of the attachment. It is written in chunks while
+        received, with the charset sent by the server.
+        """
+        result: Union[str, Dict[str, Any], None] = None
+        resp = self.__session.get(
+            "component/browse",
+            data=browse_params(package, component, componentType),
+            stream=dest is not None,
+        )
+        from .session import exit_nok
+
         exit_nok(resp, logger=self.logger)
         self.logger.info(
             {
@@ -444,7 +1178,10 @@ class ChangemanZmf:
         elif content_type.startswith("text/plain") and content_disp.startswith(
             "attachment"
         ):
-            result = resp.text
+            if dest is None:
+                result = resp.text
+            else:
+                result = self._save_attachment(resp, dest, component)
         else:
             self.logger.error(
                 "Unexpected content-type '{}'".format(content_type)
@@ -452,13 +1189,222 @@ class ChangemanZmf:
             sys.exit(EXIT_CODE_ZMF_NOK)
         return result
 
+    def _save_attachment(
+        self, resp: Any, dest: str, default_name: str
+    ) -> Dict[str, Any]:
+        from .download import DOWNLOAD_CHUNK_SIZE, attachment_name, save_chunks
+
+        path = dest
+        if os.path.isdir(dest):
+            name = attachment_name(resp.headers.get("content-disposition", ""))
+            path = os.path.join(dest, name or default_name)
+        start = time.perf_counter()
+        size, sha256 = save_chunks(
+            resp.iter_content(DOWNLOAD_CHUNK_SIZE), path
+        )
+        seconds = time.perf_counter() - start
+        rate = size / seconds if seconds > 0 else float(size)
+        self.logger.info(
+            "Saved %s, %d bytes in %.3fs, %.1f KiB/s",
+            path,
+            size,
+            seconds,
+            rate / 1024,
+        )
+        return {
+            "path": path,
+            "bytes": size,
+            "seconds": round(seconds, 3),
+            "bytesPerSecond": int(rate),
+            "sha256": sha256,
+        }
+
+    def download_package(
+        self,
+        package: str,
+        dest: str = ".",
+        componentType: Optional[str] = None,
+        parallel: int = 8,
+        force: bool = False,
+    ) -> Dict[str, int]:
+        """Download the components of a package into dest/TYPE/name.type
+
+        Up to `parallel` components are downloaded at the same time. A
+        manifest in `dest` records version and hash of every downloaded
+        file, components which did not change on the server and whose local
+        file still matches are skipped, unless `force` is set.
+        """
+        from .download import (
+            MANIFEST_NAME,
+            VERSION_FIELDS,
+            ManifestEntry,
+            is_unchanged,
+            load_manifest,
+            save_manifest,
+        )
+
+        os.makedirs(dest, exist_ok=True)
+        manifest_path = os.path.join(dest, MANIFEST_NAME)
+        manifest = load_manifest(manifest_path)
+        records = self.get_components(package, componentType=componentType)
+        tasks = []
+        skipped = 0
+        lock = threading.Lock()
+        totals = {"downloaded": 0, "bytes": 0}
+
+        def download(
+            name: str, comp_type: str, rel_path: str, version: ManifestEntry
+        ) -> None:
+            stats = self.browse_component(
+                package, name, comp_type, dest=os.path.join(dest, rel_path)
+            )
+            if not isinstance(stats, dict):
+                return
+            st = os.stat(stats["path"])
+            with lock:
+                manifest[rel_path] = {
+                    **version,
+                    "sha256": stats["sha256"],
+                    "size": st.st_size,
+                    "mtime": st.st_mtime_ns,
+                }
+                totals["downloaded"] += 1
+                totals["bytes"] += stats["bytes"]
+
+        for record in records or []:
+            name = str(record.get("component", ""))
+            comp_type = str(record.get("componentType", ""))
+            if not name or not comp_type:
+                continue
+            rel_path = os.path.join(
+                comp_type.upper(), name + "." + comp_type.lower()
+            )
+            version = {f: record.get(f) for f in VERSION_FIELDS}
+            entry = manifest.get(rel_path)
+            if (
+                not force
+                and entry is not None
+                and all(entry.get(f) == v for f, v in version.items())
+                and is_unchanged(os.path.join(dest, rel_path), entry)
+            ):
+                skipped += 1
+                continue
+            tasks.append(
+                (
+                    "download " + rel_path,
+                    partial(download, name, comp_type, rel_path, version),
+                )
+            )
+        try:
+            run_parallel(tasks, parallel, self.logger)
+        finally:
+            save_manifest(manifest_path, manifest)
+        self.logger.info(
+            "%d downloaded, %d skipped", totals["downloaded"], skipped
+        )
+        return {**totals, "skipped": skipped}
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Request metrics per endpoint of this session
+
+        Count, errors, latency percentiles in seconds, bytes sent and
+        received, HTTP statuses and ZMF return codes per method and
+        endpoint. Mostly useful in a batch or daemon, or written at exit to
+        `metrics_file`, Prometheus text format unless it ends in .json.
+        """
+        return self.__session.metrics.snapshot()
+
+    def batch(
+        self,
+        script: str = "-",
+        keep_going: bool = False,
+        format: Optional[str] = None,
+    ) -> None:
+        """Run commands from a script file or stdin on one session
+
+        The script has one JSON command per line, or is a YAML list for
+        .yml/.yaml files or with `format` yaml, e.g.
+            {"cmd": "build", "args": {"package": "APP 000001", ...}}
+        Args are keyword arguments, or positional ones if given as a list.
+        A JSON result line is written to stdout for each command. The batch
+        stops at the first failed command unless `keep_going` is set.
+        """
+        if format is not None and format not in BATCH_FORMATS:
+            self.logger.error(
+                "Unknown format '{}', expected one of {}".format(
+                    format, ", ".join(BATCH_FORMATS)
+                )
+            )
+            sys.exit(EXIT_CODE_BATCH_NOK)
+        if script == "-":
+            exit_code = run_batch(
+                self,
+                read_commands(sys.stdin, format=format),
+                sys.stdout,
+                self.logger,
+                keep_going,
+            )
+        else:
+            with open(script, encoding="utf-8") as stream:
+                exit_code = run_batch(
+                    self,
+                    read_commands(stream, script, format),
+                    sys.stdout,
+                    self.logger,
+                    keep_going,
+                )
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    def daemon(
+        self, action: str = "start", path: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Serve zmf invocations from a warm process on a unix socket
+
+        Actions:
+            start    serve until stopped
+            status   health and request statistics of the running daemon
+            stop     stop the running daemon
+
+        While a daemon is listening on the socket, `zmf` forwards commands
+        to it, if url, user and working directory match. The socket is
+        $ZMF_DAEMON_SOCKET or zmfcli-<uid>/daemon.sock in $XDG_RUNTIME_DIR
+        or the temp directory, it must be private to the user.
+        """
+        from .daemon import (
+            request as daemon_request,
+            serve,
+            socket_path,
+            EXIT_CODE_DAEMON_NOK,
+        )
+
+        if action == "start":
+            try:
+                serve(self, self.url, self.__user, path)
+            except RuntimeError as e:
+                self.logger.error(e)
+                sys.exit(EXIT_CODE_DAEMON_NOK)
+            return None
+        if action not in ["status", "stop"]:
+            self.logger.error("Unknown action '{}'".format(action))
+            sys.exit(EXIT_CODE_DAEMON_NOK)
+        response = daemon_request(
+            {"op": "stats" if action == "status" else action}, path
+        )
+        if response is None:
+            self.logger.error(
+                "No daemon listening on {}".format(path or socket_path())
+            )
+            sys.exit(EXIT_CODE_DAEMON_NOK)
+        return response
+
 
 def to_path(name: str) -> str:
     return name.replace("__", "-").replace("_", "/")
 
 
 def prepare_bools(
-    params: Dict[str, Union[str, int, bool, Iterable[str]]]
+    params: Dict[str, Union[str, int, bool, Iterable[str]]],
 ) -> Dict[str, Union[str, int, Iterable[str]]]:
     return {
         key: to_yes_no(value) if type(value) is bool else value
@@ -467,34 +1413,85 @@ def prepare_bools(
 
 
 T = TypeVar("T")
+V = TypeVar("V")
 
 
-def chunks(it: Iterable[T], n: int) -> Iterator[List[T]]:
-    # Credits to https://stackoverflow.com/a/22045226/5498201
-    iterator = iter(it)
-    return iter(lambda: list(islice(iterator, n)), [])
+def run_parallel(
+    tasks: Iterable[Tuple[str, Callable[[], T]]],
+    parallel: int,
+    logger: logging.Logger,
+) -> List[Optional[T]]:
+    """Run labelled tasks on a bounded thread pool
 
+    Every task runs to completion and each failure is logged with its label.
+    Afterwards the exception of the first failed task, in submission order,
+    is raised again, so the exit code does not depend on scheduling.
+    """
+    results: List[Optional[T]] = []
+    if parallel <= 1:
+        for label, task in tasks:
+            try:
+                results.append(task())
+            except BaseException as e:
+                log_failure(label, e, logger)
+                raise
+        return results
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
 
-def extension(file: str) -> str:
-    return Path(file).suffix.lstrip(".")
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        # each task in a copy of the context, e.g. with the deadline
+        futures = [
+            (label, executor.submit(copy_context().run, task))
+            for label, task in tasks
+        ]
+    failures: List[BaseException] = []
+    for label, future in futures:
+        exc = future.exception()
+        if exc is None:
+            results.append(future.result())
+            continue
+        log_failure(label, exc, logger)
+        failures.append(exc)
+        results.append(None)
+    if failures:
+        logger.error("%d of %d failed", len(failures), len(futures))
+        raise failures[0]
+    return results
 
 
-def jobcard(user: str, action: str = "@") -> Dict[str, str]:
-    return {
-        "jobCard01": "//" + user + action[:1].upper() + " JOB 0,'CHANGEMAN',",
-        "jobCard02": "//         CLASS=A,MSGCLASS=A,",
-        "jobCard03": "//         NOTIFY=&SYSUID",
-        "jobCard04": "//*",
-    }
+def log_failure(
+    label: str, exc: BaseException, logger: logging.Logger
+) -> None:
+    if isinstance(exc, SystemExit):
+        logger.error("%s failed with exit code %s", label, exc.code)
+    else:
+        logger.error("%s failed: %r", label, exc)
 
 
-def jobcard_s(user: str, action: str = "@") -> Dict[str, str]:
-    return {
-        "jobCards01": "//" + user + action[:1].upper() + " JOB 0,'CHANGEMAN',",
-        "jobCards02": "//         CLASS=A,MSGCLASS=A,",
-        "jobCards03": "//         NOTIFY=&SYSUID",
-        "jobCards04": "//*",
-    }
+def component_key(component: str) -> ComponentKey:
+    """Type and name of a component path, the type may be empty"""
+    return extension(component).upper(), Path(component).stem
+
+
+def record_key(record: ZmfRecord) -> ComponentKey:
+    return (
+        str(record.get("componentType", "")).upper(),
+        str(record.get("component", "")),
+    )
+
+
+def find_key(
+    key: ComponentKey, records: Dict[ComponentKey, ZmfRecord]
+) -> ComponentKey:
+    """Key of the record for a component given without type"""
+    if key[0]:
+        return key
+    return next((k for k in records if k[1] == key[1]), key)
+
+
+def short_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
 
 
 def removeprefix(self: str, prefix: str) -> str:
@@ -504,28 +1501,35 @@ def removeprefix(self: str, prefix: str) -> str:
         return self[:]
 
 
-def int_or_zero(a: Union[int, str, None]) -> int:
-    if isinstance(a, int):
-        return a
-    elif isinstance(a, str) and a.isdigit():
-        return int(a)
-    else:
-        return 0
+def to_bool(x: str) -> bool:
+    return x.strip().lower() not in ["", "0", "n", "no", "false", "off"]
 
 
-def str_or_none(a: Union[int, str, None]) -> Optional[str]:
-    if a is None:
-        return None
-    else:
-        return str(a)
+def to_ints(x: Union[int, str, Iterable[Union[int, str]]]) -> List[int]:
+    """Ints of a comma separated string, a single int or an iterable"""
+    if isinstance(x, int):
+        return [x]
+    if isinstance(x, str):
+        x = x.split(",")
+    return [int(i) for i in x if str(i).strip()]
 
 
-def to_yes_no(x: bool) -> str:
-    if x is True:
-        return "Y"
-    else:
-        return "N"
+def from_env(
+    value: Optional[V], name: str, convert: Callable[[str], V], default: V
+) -> V:
+    """Take value if given, else the environment variable or the default"""
+    if value is not None:
+        return value
+    env_value = os.environ.get(name)
+    return convert(env_value) if env_value is not None else default
 
 
 def main() -> None:
+    from .daemon import forward
+
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    import fire  # type: ignore
+
     fire.Fire(ChangemanZmf)
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import inspect
+import os
+import pytest
+
+from urllib.parse import parse_qsl
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+from multidict import MultiDict  # noqa: E402
+
+from zmfcli.asynczmf import AsyncChangemanZmf, ZmfError  # noqa: E402
+from zmfcli.download import DOWNLOAD_CHUNK_SIZE  # noqa: E402
+from zmfcli.zmf import ChangemanZmf  # noqa: E402
+from zmfcli.session import (  # noqa: E402
+    EXIT_CODE_REQUEST_NOK,
+    EXIT_CODE_ZMF_NOK,
+)
+
+from test_zmf import (  # noqa: E402
+    COMPONENTS,
+    ZMF_RESP_CREATE_000009,
+    ZMF_RESP_ERR_NO_INFO,
+    ZMF_RESP_SEARCH_000007,
+    ZMF_RESP_XXXX_OK,
+)
+
+
+def run_with_server(routes, test):
+    calls = []
+    in_flight = {"now": 0, "max": 0}
+
+    def handler(route_resp):
+        async def handle(request):
+            # GET requests carry form data as well, request.post() skips it
+            data = MultiDict(parse_qsl(await request.text()))
+            calls.append((request.method, request.path, data))
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            if isinstance(route_resp, int):
+                return web.Response(status=route_resp)
+            resp = route_resp(data)
+            if isinstance(resp, web.Response):
+                return resp
+            return web.json_response(resp)
+
+        return handle
+
+    async def main():
+        app = web.Application()
+        for method, path, route_resp in routes:
+            app.router.add_route(
+                method, "/zmfrest/" + path, handler(route_resp)
+            )
+        async with TestServer(app) as server:
+            url = str(server.make_url("/zmfrest/"))
+            async with AsyncChangemanZmf(
+                user="U000000", password="Pa$$w0rd", url=url, limit=2
+            ) as zmf:
+                return await test(zmf)
+
+    result = asyncio.run(main())
+    return result, calls, in_flight["max"]
+
+
+def test_checkin():
+    components = ["src/PGM{:03d}.cpy".format(i) for i in range(200)]
+    _, calls, max_in_flight = run_with_server(
+        [("PUT", "component/checkin", lambda _: ZMF_RESP_XXXX_OK)],
+        lambda zmf: zmf.checkin("APP 000000", "U000000.LIB", components),
+    )
+    assert len(calls) == 4
+    assert len(calls[0][2].getall("targetComponent")) == 64
+    assert max_in_flight == 2
+
+
+def test_build_failure():
+    with pytest.raises(ZmfError) as excinfo:
+        run_with_server(
+            [("PUT", "component/build", lambda _: ZMF_RESP_ERR_NO_INFO)],
+            lambda zmf: zmf.build("APP 000000", COMPONENTS),
+        )
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+
+
+def test_audit_bad_request():
+    with pytest.raises(ZmfError) as excinfo:
+        run_with_server(
+            [("PUT", "package/audit", 400)],
+            lambda zmf: zmf.audit("APP 000000"),
+        )
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+
+
+def test_get_package():
+    def search(data):
+        if data["packageTitle"] == "fancy package title":
+            return ZMF_RESP_SEARCH_000007
+        return ZMF_RESP_ERR_NO_INFO
+
+    async def test(zmf):
+        return await asyncio.gather(
+            zmf.get_package("APP", "fancy package title"),
+            zmf.get_package("APP", "new package title"),
+        )
+
+    result, calls, _ = run_with_server(
+        [
+            ("GET", "package/search", search),
+            ("POST", "package", lambda _: ZMF_RESP_CREATE_000009),
+        ],
+        test,
+    )
+    assert result == ["APP 000007", "APP 000009"]
+    assert [c[0] for c in calls].count("POST") == 1
+
+
+def test_delete():
+    _, calls, _ = run_with_server(
+        [("DELETE", "component", lambda _: ZMF_RESP_XXXX_OK)],
+        lambda zmf: zmf.delete("APP 000000", ["APPB0001", "APPB0002"], "SRB"),
+    )
+    assert len(calls) == 1
+    assert calls[0][2].getall("targetComponent") == ["APPB0001", "APPB0002"]
+    assert calls[0][2]["componentType"] == "SRB"
+
+
+def test_build_chunk_size():
+    _, calls, _ = run_with_server(
+        [("PUT", "component/build", lambda _: ZMF_RESP_XXXX_OK)],
+        lambda zmf: zmf.build("APP 000000", COMPONENTS, chunk_size=1),
+    )
+    assert len(calls) == len(COMPONENTS)
+
+
+def test_browse_component_dest(tmp_path):
+    def browse(_):
+        return web.Response(
+            text="       IDENTIFICATION DIVISION.\n",
+            content_type="text/plain",
+            headers={
+                "content-disposition": "attachment; filename=APPB0001.srb"
+            },
+        )
+
+    result, _, _ = run_with_server(
+        [("GET", "component/browse", browse)],
+        lambda zmf: zmf.browse_component(
+            "APP 000000", "APPB0001", "SRB", dest=str(tmp_path)
+        ),
+    )
+    assert result["path"] == str(tmp_path / "APPB0001.srb")
+    assert (tmp_path / "APPB0001.srb").read_text().startswith("       IDENT")
+
+
+def test_browse_component_dest_chunks(tmp_path):
+    body = "       DISPLAY 'X'.\n" * (DOWNLOAD_CHUNK_SIZE // 10)
+
+    def browse(_):
+        return web.Response(
+            text=body,
+            content_type="text/plain",
+            headers={"content-disposition": "attachment"},
+        )
+
+    result, _, _ = run_with_server(
+        [("GET", "component/browse", browse)],
+        lambda zmf: zmf.browse_component(
+            "APP 000000",
+            "APPB0001",
+            "SRB",
+            dest=str(tmp_path / "src" / "APPB0001.srb"),
+        ),
+    )
+    assert result == {
+        "path": str(tmp_path / "src" / "APPB0001.srb"),
+        "bytes": len(body),
+        "sha256": hashlib.sha256(body.encode()).hexdigest(),
+    }
+    assert os.listdir(tmp_path / "src") == ["APPB0001.srb"]
+
+
+# options of ChangemanZmf about threads, waiting or local state
+SYNC_ONLY_OPTIONS = {
+    "parallel",
+    "incremental",
+    "verify",
+    "wait",
+    "wait_timeout",
+    "stream",
+    "output",
+}
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        name
+        for name, _ in inspect.getmembers(
+            AsyncChangemanZmf, inspect.iscoroutinefunction
+        )
+        if not name.startswith("_") and hasattr(ChangemanZmf, name)
+    ],
+)
+def test_same_options(name):
+    def options(func):
+        return set(inspect.signature(func).parameters) - {"self"}
+
+    sync_options = options(getattr(ChangemanZmf, name)) - SYNC_ONLY_OPTIONS
+    assert sync_options <= options(getattr(AsyncChangemanZmf, name))
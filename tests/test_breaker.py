@@ -0,0 +1,70 @@
+from zmfcli.breaker import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_open_after_threshold():
+    clock = Clock()
+    breaker = CircuitBreaker(3, 30, clock=clock)
+    for _ in range(2):
+        breaker.record(False)
+    breaker.record(True)
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.check() == 0
+    breaker.record(False)
+    assert breaker.failures == 3
+    assert breaker.check() == 30
+    clock.now += 10
+    assert breaker.check() == 20
+
+
+def test_half_open():
+    clock = Clock()
+    breaker = CircuitBreaker(1, 30, clock=clock)
+    breaker.record(False)
+    clock.now += 30
+    # one probe, the others wait for its outcome
+    assert breaker.check() == 0
+    assert breaker.check() == 30
+    breaker.record(False)
+    assert breaker.check() == 30
+    clock.now += 30
+    assert breaker.check() == 0
+    # probe without outcome
+    clock.now += 30
+    assert breaker.check() == 0
+    breaker.record(True)
+    assert breaker.check() == 0
+    assert breaker.check() == 0
+    assert breaker.failures == 0
+
+
+def test_shared_state(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "breaker.json")
+    first = CircuitBreaker(2, 30, path=path, clock=clock)
+    second = CircuitBreaker(2, 30, path=path, clock=clock)
+    first.record(False)
+    second.record(False)
+    assert first.check() == 30
+    clock.now += 30
+    assert second.check() == 0
+    assert first.check() == 30
+    second.record(True)
+    assert first.check() == 0
+
+
+def test_unwritable_state(tmp_path):
+    path = tmp_path / "breaker.json"
+    path.mkdir()
+    breaker = CircuitBreaker(1, 30, path=str(path))
+    breaker.record(False)
+    assert breaker.check() > 0
+    assert breaker.path is None
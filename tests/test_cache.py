@@ -0,0 +1,105 @@
+import pytest
+
+from zmfcli.cache import ResponseCache, normalize
+
+RESULT = [{"component": "APPB0001", "componentType": "SRB"}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("zmfcli.cache.time.time", lambda: now[0])
+    return now
+
+
+def test_normalize():
+    assert normalize({"a": 1, "b": ["y", "x"], "c": "Y"}) == {
+        "a": "1",
+        "b": ["x", "y"],
+        "c": "Y",
+    }
+
+
+def test_get_put(tmp_path, clock):
+    cache = ResponseCache("ns", 10, str(tmp_path))
+    params = {"package": "APP 000001", "componentType": "SRB"}
+    assert cache.get("component", params) == (False, None)
+    cache.put("component", params, RESULT)
+    assert cache.get("component", dict(reversed(params.items()))) == (
+        True,
+        RESULT,
+    )
+    cache.put("component", {"package": "APP 000002"}, None)
+    assert cache.get("component", {"package": "APP 000002"}) == (True, None)
+    assert ResponseCache("other", 10, str(tmp_path)).get(
+        "component", params
+    ) == (False, None)
+    clock[0] += 10
+    assert cache.get("component", params) == (False, None)
+
+
+def test_disk(tmp_path, clock):
+    ResponseCache("ns", 10, str(tmp_path)).put(
+        "component", {"package": "APP 000001"}, RESULT
+    )
+    cache = ResponseCache("ns", 10, str(tmp_path))
+    assert cache.get("component", {"package": "APP 000001"}) == (True, RESULT)
+
+
+@pytest.mark.parametrize("directory", [False, True])
+def test_lru(tmp_path, clock, directory):
+    def new_cache():
+        return ResponseCache(
+            "ns", 10, str(tmp_path) if directory else None, max_entries=2
+        )
+
+    cache = new_cache()
+    for i in range(3):
+        clock[0] += 1
+        cache.put("component", {"package": str(i)}, RESULT)
+        if i == 1:
+            clock[0] += 1
+            # with a new instance the read from disk updates the last use
+            cache = new_cache() if directory else cache
+            assert cache.get("component", {"package": "0"})[0]
+    cache = new_cache() if directory else cache
+    assert [
+        cache.get("component", {"package": str(i)})[0] for i in range(3)
+    ] == [True, False, True]
+
+
+def test_invalidate(tmp_path, clock):
+    cache = ResponseCache("ns", 10, str(tmp_path))
+    cache.put("component", {"package": "APP 000001"}, RESULT)
+    cache.put("component", {"package": "APP 000002"}, RESULT)
+    cache.put("package_search", {"package": "APP*"}, RESULT)
+    cache.put("package_search", {"package": "OTH*"}, RESULT)
+    cache.invalidate("APP 000001")
+    for c in [cache, ResponseCache("ns", 10, str(tmp_path))]:
+        assert [
+            c.get(endpoint, {"package": package})[0]
+            for endpoint, package in [
+                ("component", "APP 000001"),
+                ("component", "APP 000002"),
+                ("package_search", "APP*"),
+                ("package_search", "OTH*"),
+            ]
+        ] == [False, True, False, True]
+
+
+def test_unusable_directory(tmp_path, clock, caplog):
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    cache = ResponseCache("ns", 10, str(not_a_dir / "cache"))
+    assert cache.directory is None
+    assert "memory only" in caplog.text
+    cache.put("component", {"package": "APP 000001"}, RESULT)
+    assert cache.get("component", {"package": "APP 000001"}) == (True, RESULT)
+
+
+def test_failed_write(tmp_path, clock):
+    cache = ResponseCache("ns", 10, str(tmp_path / "cache"))
+    (tmp_path / "cache").rmdir()
+    cache.put("component", {"package": "APP 000001"}, RESULT)
+    assert cache.directory is None
+    assert cache.get("component", {"package": "APP 000001"}) == (True, RESULT)
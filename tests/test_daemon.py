@@ -0,0 +1,120 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from zmfcli.daemon import (
+    ContextCapture,
+    ZmfDaemon,
+    constructor_flag,
+    forward,
+    request,
+)
+from zmfcli.zmf import ChangemanZmf, run_parallel
+
+
+class FakeZmf:
+    def __init__(self, verbose=False, cache_ttl=None):
+        self.verbose = verbose
+
+    def hello(self, name):
+        print("log line", file=sys.stderr)
+        return "hello " + name
+
+    def fail(self):
+        sys.exit(3)
+
+
+@pytest.fixture
+def daemon(monkeypatch):
+    if not hasattr(os, "getuid"):
+        pytest.skip("unix sockets not available")
+    # unix socket paths are limited to ~100 characters, avoid tmp_path
+    path = os.path.join(tempfile.mkdtemp(), "zmf.sock")
+    monkeypatch.setenv("ZMF_REST_URL", "http://zmf/")
+    monkeypatch.setenv("ZMF_REST_USER", "U000000")
+    server = ZmfDaemon(path, FakeZmf(), "http://zmf/", "U000000")
+    monkeypatch.setattr(sys, "stdout", server.stdout)
+    monkeypatch.setattr(sys, "stderr", server.stderr)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+    os.unlink(path)
+
+
+def test_forward(daemon, capfd):
+    assert forward(["hello", "zmf"], daemon) == 0
+    assert forward(["fail"], daemon) == 3
+    assert forward(["unknown"], daemon) == 2
+    out, err = capfd.readouterr()
+    assert out == "hello zmf\n"
+    assert "log line" in err
+    stats = request({"op": "stats"}, daemon)
+    assert stats["requests"] == 3
+    assert stats["failed"] == 2
+    assert stats["commands"] == {"hello": 1, "fail": 1, "unknown": 1}
+
+
+def test_fallback(daemon, monkeypatch, tmp_path):
+    assert forward(["--verbose", "hello", "zmf"], daemon) is None
+    assert forward(["batch", "-"], daemon) is None
+    monkeypatch.setenv("ZMF_REST_USER", "U999999")
+    assert forward(["hello", "zmf"], daemon) is None
+    monkeypatch.setenv("ZMF_REST_USER", "U000000")
+    monkeypatch.chdir(tmp_path)
+    assert forward(["hello", "zmf"], daemon) is None
+    assert request({"op": "stats"}, daemon)["fallbacks"] == 2
+
+
+def test_no_daemon(tmp_path):
+    assert forward(["hello", "zmf"], str(tmp_path / "zmf.sock")) is None
+
+
+def test_socket_private(daemon):
+    assert os.stat(daemon).st_mode & 0o077 == 0
+
+
+def test_untrusted_socket(daemon, caplog):
+    os.chmod(daemon, 0o666)
+    assert forward(["hello", "zmf"], daemon) is None
+    assert request({"op": "stats"}, daemon) is None
+    assert "not private" in caplog.text
+
+
+def test_constructor_flags(daemon):
+    assert forward(["hello", "zmf", "--verbose"], daemon) is None
+    assert forward(["hello", "zmf", "--cache-ttl=60"], daemon) is None
+    assert request({"op": "stats"}, daemon)["requests"] == 0
+
+
+@pytest.mark.parametrize(
+    "argv, flag",
+    [
+        (["audit", "APP 000001", "--deadline=5s"], "--deadline=5s"),
+        (["audit", "APP 000001", "--noverbose"], "--noverbose"),
+        (["audit", "--package", "APP 000001"], None),
+        (["audit", "APP 000001", "--", "--verbose"], None),
+    ],
+)
+def test_constructor_flag(argv, flag):
+    assert constructor_flag(argv, ChangemanZmf) == flag
+
+
+def test_capture_parallel():
+    stream = io.StringIO()
+    capture = ContextCapture(stream)
+
+    def task():
+        print("task line", file=capture)
+
+    capture.start()
+    run_parallel([("task 1", task), ("task 2", task)], 2, None)
+    assert capture.stop() == "task line\ntask line\n"
+    task()
+    assert stream.getvalue() == "task line\n"
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from zmfcli.deadline import (
+    command_deadline,
+    cap_timeout,
+    current_deadline,
+    remaining,
+    to_duration,
+)
+
+
+@pytest.mark.parametrize(
+    "x, expected",
+    [(300, 300), ("300", 300), ("300s", 300), ("5m", 300), ("1h", 3600)]
+    + [("500ms", 0.5), (" 1.5 s ", 1.5), ("0", 0)],
+)
+def test_to_duration(x, expected):
+    assert to_duration(x) == expected
+
+
+@pytest.mark.parametrize("x", ["", "s", "-1s", "5d", "1 2"])
+def test_to_duration_invalid(x):
+    with pytest.raises(ValueError):
+        to_duration(x)
+
+
+@pytest.mark.parametrize(
+    "timeout, expected",
+    [
+        (None, (10, 10)),
+        (5, (5, 5)),
+        (30, (10, 10)),
+        ((None, 30), (10, 10)),
+        ((3, 5), (3, 5)),
+    ],
+)
+def test_cap_timeout(timeout, expected):
+    assert cap_timeout(timeout, 10) == expected
+
+
+def test_command_deadline():
+    with command_deadline(None):
+        assert current_deadline() is None
+        assert remaining() is None
+    with command_deadline(0):
+        assert remaining() is None
+    with command_deadline(0.01):
+        time.sleep(0.02)
+        assert remaining() < 0
+    with command_deadline(60):
+        outer = current_deadline()
+        assert outer.budget == 60
+        assert 59 < remaining() <= 60
+        # a command run by a command
+        with command_deadline(10):
+            assert current_deadline() is outer
+    assert current_deadline() is None
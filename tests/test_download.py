@@ -0,0 +1,39 @@
+import hashlib
+
+import pytest
+
+from zmfcli.download import attachment_name, save_chunks
+
+
+@pytest.mark.parametrize(
+    "header, name",
+    [
+        ("attachment;filename=RICK", "RICK"),
+        ('attachment; filename="APPB0001.srb"', "APPB0001.srb"),
+        ("attachment; filename*=UTF-8''r%C3%A9sum%C3%A9.txt", "résumé.txt"),
+        ('attachment; filename="../../etc/passwd"', "passwd"),
+        ('attachment; filename=".."', None),
+        ("attachment", None),
+    ],
+)
+def test_attachment_name(header, name):
+    assert attachment_name(header) == name
+
+
+def test_save_chunks(tmp_path):
+    path = tmp_path / "SRB" / "APPB0001.srb"
+    chunks = [b"line 1\n", b"line 2\n"]
+    assert save_chunks(chunks, str(path)) == (
+        14,
+        hashlib.sha256(b"".join(chunks)).hexdigest(),
+    )
+    assert path.read_bytes() == b"line 1\nline 2\n"
+
+    def broken():
+        yield b"partial"
+        raise OSError("connection lost")
+
+    with pytest.raises(OSError):
+        save_chunks(broken(), str(path))
+    assert path.read_bytes() == b"line 1\nline 2\n"
+    assert [p.name for p in path.parent.iterdir()] == ["APPB0001.srb"]
@@ -0,0 +1,74 @@
+import shutil
+import subprocess
+
+import pytest
+
+from zmfcli.gitdiff import GitError, git_changes, is_source, revision_range
+
+
+def git(repo, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=zmf", "-c", "user.email=zmf@example.com"]
+        + list(args),
+        cwd=repo,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    git(tmp_path, "init", "-q")
+    for path in [
+        "src/SRB/APPB0001.srb",
+        "src/SRB/APPB0002.srb",
+        "src/CPY/APPI0001.cpy",
+        "README.md",
+    ]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "initial")
+    git(tmp_path, "tag", "v1")
+    (tmp_path / "src/SRB/APPB0001.srb").write_text("changed")
+    (tmp_path / "src/SRE/APPE0001.sre").parent.mkdir()
+    (tmp_path / "src/SRE/APPE0001.sre").write_text("new")
+    (tmp_path / "README.md").write_text("changed")
+    git(tmp_path, "mv", "src/CPY/APPI0001.cpy", "src/CPY/APPI0002.cpy")
+    git(tmp_path, "rm", "-q", "src/SRB/APPB0002.srb")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "change")
+    return tmp_path
+
+
+def test_git_changes(repo):
+    changed, deleted = git_changes(since="v1", cwd=str(repo))
+    assert changed == [
+        "src/CPY/APPI0002.cpy",
+        "src/SRB/APPB0001.srb",
+        "src/SRE/APPE0001.sre",
+    ]
+    assert deleted == ["src/CPY/APPI0001.cpy", "src/SRB/APPB0002.srb"]
+    assert git_changes(range="HEAD..HEAD", cwd=str(repo)) == ([], [])
+    # relative to the working directory
+    changed, deleted = git_changes(range="v1..HEAD", cwd=str(repo / "src"))
+    assert changed[0] == "CPY/APPI0002.cpy"
+    with pytest.raises(GitError):
+        git_changes(since="unknown", cwd=str(repo))
+
+
+def test_revision_range():
+    assert revision_range(since="main") == "main..HEAD"
+    assert revision_range(range="a...b") == "a...b"
+    with pytest.raises(GitError):
+        revision_range()
+    with pytest.raises(GitError):
+        revision_range("a", "b..c")
+
+
+def test_is_source():
+    assert is_source("src/SRB/APPB0001.srb")
+    assert not is_source("src/SRB/APPB0001")
+    assert not is_source("docs/README.md")
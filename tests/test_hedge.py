@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from zmfcli.hedge import HedgePolicy, hedged, to_hedge
+from zmfcli.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+def test_to_hedge():
+    assert to_hedge("p99").percentile == 99
+    assert to_hedge("p99").delay is None
+    assert to_hedge("250ms", 0.1).delay == 0.25
+    assert to_hedge("250ms", 0.1).rate == 0.1
+
+
+def test_delay_for():
+    metrics = Metrics()
+    policy = HedgePolicy()
+    for _ in range(19):
+        metrics.observe("GET", "component", 0.2, 200)
+    assert policy.delay_for(metrics, "component") is None
+    metrics.observe("GET", "component", 0.2, 200)
+    assert 0.1 < policy.delay_for(metrics, "component") <= 0.25
+    assert HedgePolicy(delay=1).delay_for(metrics, "package") == 1
+
+
+def test_budget():
+    policy = HedgePolicy(rate=0.25)
+    assert policy.allow()
+    assert not policy.allow()
+    for _ in range(3):
+        policy.delay_for(Metrics(), "component")
+        assert not policy.allow()
+    policy.delay_for(Metrics(), "component")
+    assert policy.allow()
+
+
+def attempts(*delays):
+    """Attempts sleeping the given seconds, each returning its number"""
+    started = []
+    lock = threading.Lock()
+
+    def attempt():
+        with lock:
+            n = len(started)
+            started.append(n)
+        time.sleep(delays[n])
+        return n
+
+    return attempt, started
+
+
+def test_hedged_first_wins():
+    attempt, started = attempts(0.5, 0)
+    closed = []
+    start = time.monotonic()
+    assert hedged(attempt, 0.05, HedgePolicy(), closed.append, logger) == 1
+    assert time.monotonic() - start < 0.4
+    time.sleep(0.6)
+    assert closed == [0]
+    assert started == [0, 1]
+
+
+def test_hedged_fast():
+    attempt, started = attempts(0, 0)
+    assert hedged(attempt, 0.5, HedgePolicy(), print, logger) == 0
+    assert started == [0]
+
+
+def test_hedged_no_budget():
+    attempt, started = attempts(0.2, 0)
+    policy = HedgePolicy(tokens=0, rate=0)
+    assert hedged(attempt, 0.05, policy, print, logger) == 0
+    assert started == [0]
+
+
+def test_hedged_errors():
+    def fail():
+        raise ValueError("stalled")
+
+    def slow():
+        time.sleep(0.1)
+        return "ok"
+
+    calls = iter([slow, fail])
+    result = hedged(lambda: next(calls)(), 0.01, HedgePolicy(), print, logger)
+    assert result == "ok"
+    with pytest.raises(ValueError):
+        hedged(fail, 0.01, HedgePolicy(), print, logger)
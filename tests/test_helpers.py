@@ -1,19 +1,27 @@
 # https://www.nerdwallet.com/blog/engineering/5-pytest-best-practices/
 # https://docs.pytest.org/en/stable/capture.html
 
+import logging
 import pytest
 
-from zmfcli.zmf import (
-    to_path,
-    prepare_bools,
+from zmfcli.deadline import command_deadline, current_deadline
+from zmfcli.params import (
     chunks,
     extension,
     int_or_zero,
     jobcard,
     jobcard_s,
-    removeprefix,
     str_or_none,
 )
+from zmfcli.zmf import (
+    to_path,
+    prepare_bools,
+    from_env,
+    removeprefix,
+    run_parallel,
+    to_bool,
+    to_ints,
+)
 
 
 def test_to_path():
@@ -47,6 +55,45 @@ def test_chunks(it, n, expected):
     assert all(x0 == x1 for x0, x1 in zip(chunks(it, n), expected))
 
 
+@pytest.mark.parametrize("parallel", [1, 4])
+def test_run_parallel(parallel):
+    tasks = [(str(i), lambda i=i: i * i) for i in range(10)]
+    logger = logging.getLogger(__name__)
+    assert run_parallel(tasks, parallel, logger) == [i * i for i in range(10)]
+
+
+def test_run_parallel_first_failure(caplog):
+    def fail(code):
+        raise SystemExit(code)
+
+    tasks = [
+        ("ok", lambda: None),
+        ("first", lambda: fail(3)),
+        ("second", lambda: fail(2)),
+    ]
+    with pytest.raises(SystemExit) as excinfo:
+        run_parallel(tasks, 3, logging.getLogger(__name__))
+    assert excinfo.value.code == 3
+    assert "first failed with exit code 3" in caplog.text
+    assert "second failed with exit code 2" in caplog.text
+    assert "2 of 3 failed" in caplog.text
+
+    caplog.clear()
+    with pytest.raises(SystemExit) as excinfo:
+        run_parallel(tasks, 1, logging.getLogger(__name__))
+    assert excinfo.value.code == 3
+    assert "first failed with exit code 3" in caplog.text
+    assert "second" not in caplog.text
+
+
+def test_run_parallel_deadline():
+    tasks = [(str(i), current_deadline) for i in range(4)]
+    with command_deadline(60):
+        deadlines = run_parallel(tasks, 4, logging.getLogger(__name__))
+    assert deadlines[0].budget == 60
+    assert deadlines == [deadlines[0]] * 4
+
+
 @pytest.mark.parametrize(
     "path, expected",
     [
@@ -177,3 +224,29 @@ def test_int_or_zero(x, expected):
 )
 def test_str_or_none(x, expected):
     assert str_or_none(x) == expected
+
+
+@pytest.mark.parametrize(
+    "x, expected",
+    [("1", True), ("yes", True), ("0", False), ("No", False), ("", False)],
+)
+def test_to_bool(x, expected):
+    assert to_bool(x) == expected
+
+
+@pytest.mark.parametrize(
+    "x, expected",
+    [(503, [503]), ("502, 503", [502, 503]), ((502, "503"), [502, 503])]
+    + [("", [])],
+)
+def test_to_ints(x, expected):
+    assert to_ints(x) == expected
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv("ZMF_TEST_VALUE", raising=False)
+    assert from_env(None, "ZMF_TEST_VALUE", int, 10) == 10
+    assert from_env(5, "ZMF_TEST_VALUE", int, 10) == 5
+    monkeypatch.setenv("ZMF_TEST_VALUE", "20")
+    assert from_env(None, "ZMF_TEST_VALUE", int, 10) == 20
+    assert from_env(5, "ZMF_TEST_VALUE", int, 10) == 5
@@ -0,0 +1,60 @@
+import pytest
+
+from zmfcli.index import PackageIndex, index_path
+
+SEARCH = [
+    {"package": "APP 000006", "packageId": 6, "packageTitle": "title"},
+    {"package": "APP 000007", "packageId": "7", "packageTitle": "title"},
+    {"package": "APP 000008", "packageId": 8, "packageTitle": "title 2"},
+]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("zmfcli.index.time.time", lambda: now[0])
+    return now
+
+
+def test_lookup(tmp_path, clock):
+    path = index_path(str(tmp_path), "http://zmf/")
+    index = PackageIndex(path, ttl=60)
+    assert index.lookup("APP", "title") is None
+    index.add("APP", SEARCH)
+    entry = index.lookup("APP", "title")
+    assert entry["package"] == "APP 000007"
+    assert index.is_fresh(entry)
+    assert index.lookup("APP", "title", "WCR1") is None
+    assert index.lookup("APX", "title") is None
+    index.add("APP", SEARCH[:1], "WCR1")
+    assert index.lookup("APP", "title", "WCR1")["package"] == "APP 000006"
+    # a search without work request keeps the known one
+    index.add("APP", SEARCH[:1])
+    assert index.lookup("APP", "title", "WCR1")["package"] == "APP 000006"
+    clock[0] += 60
+    assert not index.is_fresh(entry)
+    index.verify(entry)
+    assert index.is_fresh(index.lookup("APP", "title"))
+    # shared through the file
+    index.remove("APP 000007")
+    other = PackageIndex(path, ttl=60)
+    assert other.lookup("APP", "title")["package"] == "APP 000006"
+    assert index_path(str(tmp_path), "http://other/") != path
+
+
+def test_unusable_directory(tmp_path, clock, caplog):
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    index = PackageIndex(index_path(str(not_a_dir), "http://zmf/"))
+    assert "Package index disabled" in caplog.text
+    index.add("APP", SEARCH)
+    assert index.lookup("APP", "title") is None
+
+
+def test_failed_save(tmp_path, clock):
+    path = index_path(str(tmp_path), "http://zmf/")
+    index = PackageIndex(path)
+    (tmp_path / "packages").rmdir()
+    index.add("APP", SEARCH)
+    assert not index.enabled
+    assert index.lookup("APP", "title") is None
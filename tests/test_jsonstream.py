@@ -0,0 +1,79 @@
+import json
+import tracemalloc
+
+import pytest
+
+from zmfcli.jsonstream import iter_array
+
+PAYLOAD = {
+    "returnCode": "00",
+    "message": "CMN8700I - LIST service completed — ok",
+    "result": [
+        {"component": "APPB0001", "componentType": "SRB", "size": 10},
+        {"component": "APPB0002", "componentType": "SRB", "size": 123456},
+    ],
+    "reasonCode": "8700",
+}
+
+
+def split(data, n):
+    return [data[i : i + n] for i in range(0, len(data), n)]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 7, 1000])
+def test_iter_array(n):
+    members = {}
+    data = json.dumps(PAYLOAD, ensure_ascii=False, indent=1).encode()
+    records = list(iter_array(split(data, n), members))
+    assert records == PAYLOAD["result"]
+    assert members == {
+        "returnCode": "00",
+        "message": PAYLOAD["message"],
+        "reasonCode": "8700",
+    }
+
+
+def test_iter_array_numbers():
+    data = b'{"result": [1, 22, 333], "n": 4444}'
+    members = {}
+    assert list(iter_array(split(data, 1), members)) == [1, 22, 333]
+    assert members == {"n": 4444}
+
+
+def test_iter_array_empty():
+    members = {}
+    assert (
+        list(iter_array([b'{"result": [], "returnCode": "04"}'], members))
+        == []
+    )
+    assert members == {"returnCode": "04"}
+    assert list(iter_array([b"{}"], members)) == []
+    assert list(iter_array([b'{"result": null}'], members)) == []
+    assert members["result"] is None
+
+
+def test_iter_array_invalid():
+    with pytest.raises(ValueError):
+        list(iter_array([b'{"result": [{"a": 1}'], {}))
+    with pytest.raises(ValueError):
+        list(iter_array([b"[]"], {}))
+
+
+def test_iter_array_memory():
+    record = json.dumps({"component": "APPB0001", "componentType": "SRB"})
+
+    def chunks():
+        yield b'{"returnCode": "00", "result": ['
+        for i in range(20000):
+            yield (("," if i else "") + record).encode()
+        yield b"]}"
+
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in iter_array(chunks(), {}))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 20000
+    # the body is about 1 MB
+    assert peak < 100 * 1024
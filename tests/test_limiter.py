@@ -0,0 +1,96 @@
+import threading
+
+from zmfcli.limiter import AdaptiveLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_increase_when_saturated():
+    clock = Clock()
+    limiter = AdaptiveLimiter(8, initial_limit=2, clock=clock)
+    for _ in range(10):
+        tickets = [limiter.acquire() for _ in range(int(limiter.limit))]
+        clock.now += 0.1
+        for ticket in tickets:
+            limiter.release(ticket, "component", 200)
+    assert 4 < limiter.limit < 6
+    # not all slots in use
+    limit = limiter.limit
+    ticket = limiter.acquire()
+    clock.now += 0.1
+    limiter.release(ticket, "component", 200)
+    assert limiter.limit == limit
+    assert limiter.inflight == 0
+
+
+def test_decrease_on_overload():
+    clock = Clock()
+    limiter = AdaptiveLimiter(8, initial_limit=8, clock=clock)
+    tickets = [limiter.acquire() for _ in range(4)]
+    clock.now += 1
+    limiter.release(tickets[0], "component", 503)
+    assert limiter.limit == 4
+    # sent before the cut
+    limiter.release(tickets[1], "component", None)
+    assert limiter.limit == 4
+    limiter.release(tickets[2], "component", 500)
+    limiter.cancel(tickets[3])
+    assert limiter.limit == 4
+    clock.now += 1
+    ticket = limiter.acquire()
+    limiter.release(ticket, "component", 429)
+    assert limiter.limit == 2
+    for _ in range(3):
+        ticket = limiter.acquire()
+        clock.now += 1
+        limiter.release(ticket, "component", None)
+    assert limiter.limit == 1
+    assert limiter.inflight == 0
+
+
+def test_decrease_on_latency():
+    clock = Clock()
+    limiter = AdaptiveLimiter(8, initial_limit=8, clock=clock)
+    for latency in (0.2, 0.3, 1.0):
+        ticket = limiter.acquire()
+        clock.now += latency
+        limiter.release(ticket, "component", 200)
+    assert limiter.limit == 7.2
+    # slow endpoints have their own baseline
+    ticket = limiter.acquire()
+    clock.now += 5
+    limiter.release(ticket, "component/build", 200)
+    assert limiter.limit == 7.2
+
+
+def test_block_at_limit():
+    limiter = AdaptiveLimiter(2, initial_limit=1)
+    ticket = limiter.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.cancel(ticket)
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_token_bucket():
+    clock = Clock()
+    bucket = TokenBucket(2, burst=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    clock.now += 1
+    assert bucket.reserve() == 0.5
+    clock.now += 10
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.5]
@@ -0,0 +1,71 @@
+import json
+
+from zmfcli.metrics import Metrics
+
+
+def test_percentile():
+    metrics = Metrics()
+    for _ in range(90):
+        metrics.observe("get", "component", 0.02, 200)
+    for _ in range(10):
+        metrics.observe("get", "component", 3.0, 200)
+    stats = metrics.snapshot()["GET component"]
+    assert stats["count"] == 100
+    assert 0.01 < stats["p50"] <= 0.025
+    assert 2.5 < stats["p95"] <= 5.0
+    assert stats["p95"] <= stats["p99"] <= 5.0
+    assert stats["meanSeconds"] == 0.318
+    assert Metrics().snapshot() == {}
+
+
+def test_prometheus():
+    metrics = Metrics()
+    metrics.observe("PUT", "component/build", 0.2, 200, 10, 100)
+    metrics.observe("PUT", "component/build", 0.1, None)
+    metrics.return_code("PUT", "component/build", "00")
+    text = metrics.to_prometheus()
+    labels = 'method="PUT",endpoint="component/build"'
+    assert 'zmf_requests_total{%s,status="200"} 1' % labels in text
+    assert 'zmf_requests_total{%s,status="error"} 1' % labels in text
+    assert 'zmf_request_duration_seconds_bucket{%s,le="0.1"} 1' % labels in (
+        text
+    )
+    assert (
+        'zmf_request_duration_seconds_bucket{%s,le="+Inf"} 2' % labels in text
+    )
+    assert "zmf_request_duration_seconds_count{%s} 2" % labels in text
+    assert "zmf_request_bytes_total{%s} 10" % labels in text
+    assert "zmf_response_bytes_total{%s} 100" % labels in text
+    assert 'zmf_return_codes_total{%s,code="00"} 1' % labels in text
+
+
+def test_prometheus_families():
+    metrics = Metrics()
+    metrics.observe("GET", "component", 0.1, 200)
+    metrics.observe("PUT", "component/build", 0.2, 200)
+    metrics.return_code("PUT", "component/build", "00")
+    family = None
+    seen = []
+    for line in metrics.to_prometheus().splitlines():
+        if line.startswith("# TYPE "):
+            family = line.split()[2]
+            assert family not in seen
+            seen.append(family)
+        else:
+            # all samples of a family follow its TYPE line
+            assert line.startswith(family)
+    assert len(seen) == 5
+
+
+def test_write(tmp_path):
+    metrics = Metrics()
+    metrics.observe("GET", "component", 0.5, 200)
+    metrics.write(str(tmp_path / "zmf.prom"))
+    metrics.write(str(tmp_path / "zmf.json"))
+    assert "zmf_requests_total" in (tmp_path / "zmf.prom").read_text()
+    summary = json.loads((tmp_path / "zmf.json").read_text())
+    assert summary["GET component"]["count"] == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "zmf.json",
+        "zmf.prom",
+    ]
@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+from zmfcli.output import to_json, write_records
+
+RECORDS = [
+    {"component": "APPB0001", "componentType": "SRB", "packageId": 1},
+    {"component": "APPB0002", "componentType": "SRB", "extra": "x"},
+]
+
+
+@pytest.mark.parametrize("dumps", [None, to_json])
+def test_ndjson(dumps):
+    out = io.StringIO()
+    assert write_records(iter(RECORDS), "ndjson", out, dumps) == 2
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == (
+        RECORDS
+    )
+
+
+def test_json():
+    out = io.StringIO()
+    assert write_records(iter(RECORDS), "json", out) == 2
+    assert json.loads(out.getvalue()) == RECORDS
+    out = io.StringIO()
+    assert write_records(iter([]), "json", out) == 0
+    assert json.loads(out.getvalue()) == []
+
+
+def test_csv():
+    out = io.StringIO()
+    assert write_records(iter(RECORDS), "csv", out) == 2
+    assert out.getvalue() == (
+        "component,componentType,packageId\n"
+        "APPB0001,SRB,1\n"
+        "APPB0002,SRB,\n"
+    )
+
+
+def test_unknown():
+    with pytest.raises(ValueError):
+        write_records(iter(RECORDS), "xml", io.StringIO())
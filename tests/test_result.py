@@ -0,0 +1,109 @@
+import tracemalloc
+
+from zmfcli.result import ColumnarResult, status_code, to_status_code
+
+RECORDS = [
+    {
+        "componentName": "APP00001",
+        "componentType": "SRB",
+        "componentStatus": "0 - Active",
+    },
+    {
+        "componentName": "APP00002",
+        "componentType": "SRB",
+        "componentStatus": "6 - Incomplete",
+    },
+    {"componentName": "APP00003", "componentType": "CPY"},
+    {
+        "componentName": "APP00004",
+        "componentType": "LST",
+        "componentStatus": "0 - Active",
+        "sourceLib": "APP.SRC",
+    },
+]
+
+
+def test_records():
+    result = ColumnarResult(iter(RECORDS))
+    assert len(result) == 4
+    assert result == RECORDS
+    assert list(result) == RECORDS
+    assert result[2] == RECORDS[2]
+    assert result[-1] == RECORDS[-1]
+    assert result[1:3] == RECORDS[1:3]
+    assert result.to_list() == RECORDS
+    assert result.keys() == [
+        "componentName",
+        "componentType",
+        "componentStatus",
+        "sourceLib",
+    ]
+    assert result.column("sourceLib") == [None, None, None, "APP.SRC"]
+    assert result.column("unknown") == [None] * 4
+    assert ColumnarResult() == []
+
+
+def test_shared_values():
+    result = ColumnarResult(
+        {"componentType": "".join(["S", "R", "B"])} for _ in range(3)
+    )
+    column = result.columns["componentType"]
+    assert column[0] is column[1] is column[2]
+
+
+def test_filter():
+    result = ColumnarResult(RECORDS)
+    assert result.filter(componentType="SRB") == RECORDS[:2]
+    assert result.filter(componentType=["CPY", "LST"]) == RECORDS[2:]
+    assert result.filter(
+        componentType="SRB", componentStatus="0 - Active"
+    ) == [RECORDS[0]]
+    assert result.filter(lambda r: r["componentName"].endswith("3")) == [
+        RECORDS[2]
+    ]
+    assert result.filter(unknown="x") == []
+
+
+def test_with_status():
+    result = ColumnarResult(RECORDS)
+    assert result.with_status("Active") == [RECORDS[0], RECORDS[3]]
+    assert result.with_status("Incomplete", "4") == [RECORDS[1]]
+
+
+def test_group_by():
+    result = ColumnarResult(RECORDS)
+    groups = result.group_by("componentType")
+    assert list(groups) == ["SRB", "CPY", "LST"]
+    assert groups["SRB"] == RECORDS[:2]
+    by_status = result.group_by("componentStatus", to_status_code)
+    assert by_status["0"] == [RECORDS[0], RECORDS[3]]
+    assert by_status[""] == [RECORDS[2]]
+    assert result.count_by("componentType") == {"SRB": 2, "CPY": 1, "LST": 1}
+
+
+def test_status_code():
+    assert status_code(RECORDS[1]) == "6"
+    assert status_code(RECORDS[2]) == ""
+
+
+def test_smaller_than_dicts():
+    def records():
+        for i in range(5000):
+            yield {
+                "componentName": "APP{:05}".format(i),
+                "componentType": "SRB",
+                "componentStatus": "0 - Active",
+                "setssi": i,
+            }
+
+    tracemalloc.start()
+    dicts = list(records())
+    size_dicts = tracemalloc.get_traced_memory()[0]
+    del dicts
+    tracemalloc.stop()
+    tracemalloc.start()
+    result = ColumnarResult(records())
+    size_columns = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(result) == 5000
+    assert size_columns < size_dicts / 2
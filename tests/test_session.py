@@ -0,0 +1,268 @@
+import json
+import time
+
+import pytest
+import responses
+
+from contextlib import ExitStack
+from requests.exceptions import ConnectionError
+
+from zmfcli.breaker import CircuitBreaker
+from zmfcli.deadline import command_deadline
+from zmfcli.hedge import HedgePolicy
+from zmfcli.limiter import AdaptiveLimiter
+from zmfcli.session import EXIT_CODE_REQUEST_NOK, RetryPolicy, ZmfSession
+
+from test_zmf import ZMF_REST_URL, ZMF_RESP_XXXX_OK
+
+
+def test_pool_options():
+    session = ZmfSession(ZMF_REST_URL, pool_connections=2, pool_maxsize=32)
+    adapter = session.get_adapter(ZMF_REST_URL)
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 32
+    assert session.headers["Connection"] == "keep-alive"
+    assert ZmfSession(keep_alive=False).headers["Connection"] == "close"
+
+
+@responses.activate
+def test_timeout():
+    responses.add(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_XXXX_OK
+    )
+    ZmfSession(ZMF_REST_URL).result_get("component")
+    ZmfSession(ZMF_REST_URL, read_timeout=30).result_get("component")
+    ZmfSession(ZMF_REST_URL, read_timeout=30).result_get(
+        "component", timeout=5
+    )
+    timeouts = [c.request.req_kwargs["timeout"] for c in responses.calls]
+    assert timeouts == [None, (None, 30), 5]
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr("zmfcli.session.time.sleep", delays.append)
+    return delays
+
+
+@responses.activate
+def test_retry_get(no_sleep):
+    url = ZMF_REST_URL + "component"
+    responses.add(responses.GET, url, status=503)
+    responses.add(responses.GET, url, body=ConnectionError("reset"))
+    responses.add(responses.GET, url, json=ZMF_RESP_XXXX_OK)
+    session = ZmfSession(ZMF_REST_URL, retry=RetryPolicy(attempts=3))
+    assert session.result_get("component") is None
+    assert len(responses.calls) == 3
+    assert len(no_sleep) == 2
+
+
+@responses.activate
+def test_retry_exhausted(no_sleep):
+    responses.add(responses.GET, ZMF_REST_URL + "component", status=503)
+    session = ZmfSession(ZMF_REST_URL, retry=RetryPolicy(attempts=3))
+    with pytest.raises(SystemExit) as excinfo:
+        session.result_get("component")
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retry_put(no_sleep):
+    url = ZMF_REST_URL + "component/build"
+    responses.add(responses.PUT, url, status=503)
+    responses.add(responses.PUT, url, status=503)
+    responses.add(responses.PUT, url, json=ZMF_RESP_XXXX_OK)
+    session = ZmfSession(ZMF_REST_URL, retry=RetryPolicy(attempts=3))
+    with pytest.raises(SystemExit):
+        session.result_put("component/build")
+    assert len(responses.calls) == 1
+    session.retry = RetryPolicy(attempts=3, retry_mutating=True)
+    assert session.result_put("component/build") is None
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retry_post(no_sleep):
+    responses.add(responses.POST, ZMF_REST_URL + "package", status=503)
+    session = ZmfSession(
+        ZMF_REST_URL, retry=RetryPolicy(attempts=3, retry_mutating=True)
+    )
+    with pytest.raises(SystemExit):
+        session.result_post("package")
+    assert len(responses.calls) == 1
+
+
+def test_retry_delay():
+    policy = RetryPolicy(backoff=1, max_backoff=5)
+    assert all(0 <= policy.delay(1) <= 1 for _ in range(100))
+    assert all(0 <= policy.delay(10) <= 5 for _ in range(100))
+    assert policy.delay(1, retry_after=3) == 3
+    assert policy.delay(1, retry_after=60) == 5
+
+
+@responses.activate
+def test_metrics(no_sleep):
+    url = ZMF_REST_URL + "component"
+    responses.add(responses.GET, url, status=503)
+    responses.add(responses.GET, url, json=ZMF_RESP_XXXX_OK)
+    responses.add(
+        responses.PUT, ZMF_REST_URL + "component/build", json=ZMF_RESP_XXXX_OK
+    )
+    session = ZmfSession(ZMF_REST_URL, retry=RetryPolicy(attempts=2))
+    session.result_get("component", data={"package": "APP 000001"})
+    session.result_put("component/build")
+    metrics = session.metrics.snapshot()
+    assert list(metrics) == ["GET component", "PUT component/build"]
+    get = metrics["GET component"]
+    assert get["count"] == 2
+    assert get["errors"] == 1
+    assert get["statuses"] == {"503": 1, "200": 1}
+    assert get["returnCodes"] == {"00": 1}
+    assert get["requestBytes"] == 2 * len("package=APP+000001")
+    assert get["responseBytes"] > 0
+    assert 0 <= get["p50"] <= get["p95"] <= get["p99"]
+    assert metrics["PUT component/build"]["returnCodes"] == {"00": 1}
+
+
+@responses.activate
+def test_metrics_stream():
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        json={**ZMF_RESP_XXXX_OK, "result": [{"component": "A"}]},
+    )
+    session = ZmfSession(ZMF_REST_URL)
+    assert list(session.stream_get("component")) == [{"component": "A"}]
+    metrics = session.metrics.snapshot()["GET component"]
+    assert metrics["count"] == 1
+    assert metrics["returnCodes"] == {"00": 1}
+
+
+@responses.activate
+def test_metrics_connection_error():
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        body=ConnectionError("reset"),
+    )
+    session = ZmfSession(ZMF_REST_URL, retry=RetryPolicy(attempts=1))
+    with pytest.raises(ConnectionError):
+        session.result_get("component")
+    metrics = session.metrics.snapshot()["GET component"]
+    assert metrics["statuses"] == {"error": 1}
+    assert metrics["errors"] == 1
+
+
+@responses.activate
+def test_limiter(no_sleep):
+    url = ZMF_REST_URL + "component"
+    responses.add(responses.GET, url, body=ConnectionError("reset"))
+    responses.add(responses.GET, url, status=503)
+    responses.add(responses.GET, url, json=ZMF_RESP_XXXX_OK)
+    limiter = AdaptiveLimiter(8, initial_limit=8)
+    session = ZmfSession(
+        ZMF_REST_URL, retry=RetryPolicy(attempts=3), limiter=limiter
+    )
+    assert session.result_get("component") is None
+    assert limiter.inflight == 0
+    assert 1 <= limiter.limit <= 4
+
+
+@responses.activate
+def test_breaker(no_sleep, caplog):
+    url = ZMF_REST_URL + "component"
+    responses.add(responses.GET, url, status=503)
+    session = ZmfSession(
+        ZMF_REST_URL,
+        retry=RetryPolicy(attempts=3),
+        breaker=CircuitBreaker(2, 30),
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        session.result_get("component")
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+    assert len(responses.calls) == 2
+    assert "after 2 consecutive failures" in caplog.text
+    with pytest.raises(SystemExit):
+        session.result_get("component")
+    assert len(responses.calls) == 2
+
+
+@pytest.fixture
+def deadline():
+    with ExitStack() as stack:
+        yield lambda budget: stack.enter_context(command_deadline(budget))
+
+
+@responses.activate
+def test_deadline_timeout(deadline):
+    responses.add(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_XXXX_OK
+    )
+    deadline(60)
+    ZmfSession(ZMF_REST_URL).result_get("component")
+    ZmfSession(ZMF_REST_URL, read_timeout=30).result_get("component")
+    ZmfSession(ZMF_REST_URL).result_get("component", timeout=(3, 90))
+    timeouts = [c.request.req_kwargs["timeout"] for c in responses.calls]
+    left = pytest.approx(60, abs=1)
+    assert timeouts == [(left, left), (left, 30), (3, left)]
+
+
+@responses.activate
+def test_deadline_exceeded(deadline, caplog):
+    responses.add(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_XXXX_OK
+    )
+    deadline(0.001)
+    time.sleep(0.01)
+    with pytest.raises(SystemExit) as excinfo:
+        ZmfSession(ZMF_REST_URL).result_get("component")
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+    assert "Deadline of 0.001s exceeded" in caplog.text
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_deadline_no_retry(deadline, no_sleep):
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        status=503,
+        headers={"Retry-After": "120"},
+    )
+    deadline(60)
+    session = ZmfSession(
+        ZMF_REST_URL, retry=RetryPolicy(attempts=3, max_backoff=300)
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        session.result_get("component")
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+    assert len(responses.calls) == 1
+    assert no_sleep == []
+
+
+@responses.activate
+def test_hedged_get():
+    calls = []
+
+    def component(request):
+        calls.append(request)
+        if len(calls) == 2:
+            time.sleep(0.5)
+        return 200, {}, json.dumps(ZMF_RESP_XXXX_OK)
+
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=component,
+        content_type="application/json",
+    )
+    session = ZmfSession(ZMF_REST_URL)
+    assert session.result_hedged_get("component") is None
+    session.hedge = HedgePolicy(delay=0.05)
+    start = time.monotonic()
+    assert session.result_hedged_get("component", data={"a": "b"}) is None
+    assert time.monotonic() - start < 0.4
+    assert len(calls) == 3
+    assert calls[1].body == calls[2].body == "a=b"
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from zmfcli.singleflight import SingleFlight, file_lock
+
+
+def test_single_flight():
+    flights = SingleFlight()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "APP 000001"
+
+    threads = [
+        threading.Thread(target=lambda: results.append(flights.do("k", slow)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == ["APP 000001"] * 8
+    assert flights.do("k", lambda: "APP 000002") == "APP 000002"
+
+
+def test_single_flight_error():
+    flights = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise SystemExit(3)
+
+    def follow():
+        started.wait()
+        try:
+            flights.do("k", lambda: "unexpected")
+        except SystemExit as e:
+            errors.append(e.code)
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    with pytest.raises(SystemExit):
+        flights.do("k", fail)
+    follower.join()
+    assert errors == [3]
+
+
+def test_file_lock(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    path = str(tmp_path / "locks" / "pkg.lock")
+    with file_lock(path) as locked:
+        assert locked
+        with open(path) as f, pytest.raises(BlockingIOError):
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    with open(path) as f:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
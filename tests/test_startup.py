@@ -0,0 +1,70 @@
+# Import time checks for the cli startup path, `python -X importtime` writes
+# one line per module: "import time: <self us> | <cumulative us> | <name>"
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+REQUEST_MODULES = [
+    "aiohttp",
+    "requests",
+    "urllib3",
+    "zmfcli.logrequests",
+    "zmfcli.session",
+]
+HEAVY_MODULES = REQUEST_MODULES + ["fire", "http.client"]
+
+
+def import_times(code, env=None):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_zmf_is_light():
+    times = import_times("import zmfcli.zmf")
+    assert "zmfcli.zmf" in times
+    assert [m for m in HEAVY_MODULES if m in times] == []
+
+
+def test_import_zmf_time():
+    # compare with requests instead of an absolute budget, so the check
+    # does not depend on the speed of the machine
+    zmf = min(
+        import_times("import zmfcli.zmf")["zmfcli.zmf"] for _ in range(3)
+    )
+    requests = min(
+        import_times("import requests")["requests"] for _ in range(3)
+    )
+    assert zmf < requests
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["audit", "APP 000001"]])
+def test_cli_startup(argv):
+    # --help and missing credentials do not need requests
+    env = {k: v for k, v in os.environ.items() if not k.startswith("ZMF_")}
+    env["PAGER"] = "cat"
+    code = (
+        "import sys\n"
+        "from zmfcli.zmf import main\n"
+        "sys.argv = ['zmf'] + {!r}\n"
+        "try:\n"
+        "    main()\n"
+        "except BaseException:\n"
+        "    pass\n".format(argv)
+    )
+    times = import_times(code, env)
+    assert "fire" in times
+    assert [m for m in REQUEST_MODULES if m in times] == []
@@ -0,0 +1,35 @@
+import pytest
+
+from zmfcli.wait import poll
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("zmfcli.wait.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("zmfcli.wait.time.sleep", sleep)
+    return sleeps
+
+
+def test_poll(clock):
+    counts = iter([3, 3, 3, 2, 2, 0])
+    assert poll(lambda: next(counts), 100, interval=1, max_interval=3)
+    # grows while nothing changes, starts over after progress
+    assert clock == [1, 2, 3, 1, 2]
+
+
+def test_poll_timeout(clock):
+    assert not poll(lambda: 1, 10, interval=1, max_interval=4)
+    assert clock == [1, 2, 4, 3]
+    assert sum(clock) == 10
+
+
+def test_poll_done(clock):
+    assert poll(lambda: 0, 0)
+    assert clock == []
@@ -1,11 +1,21 @@
+import io
 import json
+import os
+import threading
+import time
+import fire
 import pytest
 import requests
 import responses
 
-from zmfcli.zmf import ChangemanZmf
-from zmfcli.session import EXIT_CODE_REQUEST_NOK, EXIT_CODE_ZMF_NOK
+from pathlib import Path
+from responses import matchers
+from urllib.parse import parse_qsl
 
+from zmfcli.batch import EXIT_CODE_BATCH_NOK
+from zmfcli.deadline import command_deadline, current_deadline
+from zmfcli.zmf import LOCK_SLOTS, ChangemanZmf
+from zmfcli.session import EXIT_CODE_REQUEST_NOK, EXIT_CODE_ZMF_NOK
 
 ZMF_REST_URL = "http://example.com:8080/zmfrest/"
 COMPONENTS = [
@@ -175,11 +185,12 @@ ZMF_RESP_SEARCH_000007 = {
 
 
 @pytest.fixture
-def zmfapi():
+def zmfapi(tmp_path):
     return ChangemanZmf(
         user="U000000",
         password="Pa$$w0rd",
         url=ZMF_REST_URL,
+        cache_dir=str(tmp_path / "cache"),
     )
 
 
@@ -220,6 +231,43 @@ def test_checkin_chunks(zmfapi, caplog):
     )
 
 
+@responses.activate
+def test_checkin_parallel(zmfapi, caplog):
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        json=ZMF_RESP_XXXX_OK,
+    )
+    components = ["src/PGM{:03d}.cpy".format(i) for i in range(130)]
+    components += ["src/PGM{:03d}.srb".format(i) for i in range(10)]
+    assert (
+        zmfapi.checkin("APP 000000", "U000000.LIB", components, parallel=4)
+        is None
+    )
+    assert len(responses.calls) == 4
+    responses.reset()
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        json=ZMF_RESP_ERR_NO_INFO,
+        match=[
+            matchers.urlencoded_params_matcher(
+                {"componentType": "SRB"}, strict_match=False
+            ),
+        ],
+    )
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        json=ZMF_RESP_XXXX_OK,
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.checkin("APP 000000", "U000000.LIB", components, parallel=4)
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+    assert len(responses.calls) == 4
+    assert "checkin SRB chunk 0 failed with exit code 3" in caplog.text
+
+
 @responses.activate
 def test_delete(zmfapi):
     responses.add(
@@ -230,6 +278,36 @@ def test_delete(zmfapi):
     assert zmfapi.delete("APP 000000", "APPE0001", "SRE") is None
 
 
+@responses.activate
+def test_delete_many(zmfapi):
+    responses.add(
+        responses.DELETE,
+        ZMF_REST_URL + "component",
+        json=ZMF_RESP_DELETE_OK,
+    )
+    assert zmfapi.delete("APP 000000", COMPONENTS, parallel=3) is None
+    bodies = sorted(parse_qsl(c.request.body) for c in responses.calls)
+    assert bodies == [
+        [
+            ("package", "APP 000000"),
+            ("targetComponent", "APPB0001"),
+            ("targetComponent", "APPB0002"),
+            ("componentType", "SRB"),
+        ],
+        [
+            ("package", "APP 000000"),
+            ("targetComponent", "APPE0001"),
+            ("targetComponent", "APPE0002"),
+            ("componentType", "SRE"),
+        ],
+        [
+            ("package", "APP 000000"),
+            ("targetComponent", "APPI0001"),
+            ("componentType", "CPY"),
+        ],
+    ]
+
+
 @responses.activate
 def test_build(zmfapi, caplog):
     responses.add(
@@ -276,6 +354,28 @@ def test_scratch(zmfapi):
     assert zmfapi.scratch("APP 000000", COMPONENTS) is None
 
 
+@responses.activate
+def test_scratch_parallel(zmfapi, caplog):
+    def scratch(request):
+        params = dict(parse_qsl(request.body))
+        if params["oldComponent"] == "APPB0002":
+            return 200, {}, json.dumps(ZMF_RESP_ERR_NO_INFO)
+        return 200, {}, json.dumps(ZMF_RESP_XXXX_OK)
+
+    responses.add_callback(
+        responses.PUT,
+        ZMF_REST_URL + "component/scratch",
+        callback=scratch,
+        content_type="application/json",
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.scratch("APP 000000", COMPONENTS, parallel=4)
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+    assert len(responses.calls) == len(COMPONENTS)
+    assert "scratch SRB APPB0002 failed with exit code 3" in caplog.text
+    assert "1 of 5 failed" in caplog.text
+
+
 @responses.activate
 def test_audit(zmfapi):
     responses.add(
@@ -545,6 +645,24 @@ def test_get_load_components(zmfapi):
     )
 
 
+@responses.activate
+def test_get_package_lock_slots(zmfapi, tmp_path):
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "package/search",
+        json=ZMF_RESP_ERR_NO_INFO,
+    )
+    responses.add(
+        responses.POST,
+        ZMF_REST_URL + "package",
+        json=ZMF_RESP_CREATE_000009,
+    )
+    for i in range(200):
+        zmfapi.get_package("APP", "title {}".format(i))
+    locks = os.listdir(tmp_path / "cache" / "locks")
+    assert 0 < len(locks) <= LOCK_SLOTS
+
+
 @responses.activate
 def test_get_package_list(zmfapi):
     responses.add(
@@ -617,3 +735,850 @@ def test_browse_component(zmfapi):
         == ZMF_RESP_BROWSE_RICK
     )
     assert zmfapi.browse_component("APP 000001", "NOTEXIST", "LST") is None
+
+
+@responses.activate
+def test_browse_component_dest(zmfapi, tmp_path):
+    body = ZMF_RESP_BROWSE_RICK.encode("iso-8859-1")
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "component/browse",
+        body=body,
+        content_type="text/plain;charset=ISO-8859-1",
+        headers={"Content-Disposition": 'attachment;filename="../RICK.lst"'},
+    )
+    stats = zmfapi.browse_component(
+        "APP 000001", "RICK", "LST", dest=str(tmp_path)
+    )
+    assert stats["path"] == str(tmp_path / "RICK.lst")
+    assert stats["bytes"] == len(body)
+    assert (tmp_path / "RICK.lst").read_bytes() == body
+    dest = tmp_path / "listings" / "rick.txt"
+    zmfapi.browse_component("APP 000001", "RICK", "LST", dest=str(dest))
+    assert dest.read_bytes() == body
+    assert sorted(p.name for p in dest.parent.iterdir()) == ["rick.txt"]
+
+    responses.replace(
+        responses.GET,
+        ZMF_REST_URL + "component/browse",
+        json=ZMF_RESP_BROWSE_INFO,
+    )
+    assert (
+        zmfapi.browse_component(
+            "APP 000001", "NOTEXIST", "LST", dest=str(tmp_path / "x")
+        )
+        is None
+    )
+    assert not (tmp_path / "x").exists()
+
+
+@responses.activate
+def test_batch(zmfapi, tmp_path, capsys):
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "package/audit",
+        json=ZMF_RESP_AUDIT_OK,
+    )
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        json=ZMF_RESP_COMP_OK,
+    )
+    script = tmp_path / "script.jsonl"
+    script.write_text(
+        "\n".join(
+            [
+                '{"cmd": "audit", "args": {"package": "APP 000001"}}',
+                "# comment",
+                '{"id": 2, "cmd": "get-components", "args": ["APP 000001"]}',
+            ]
+        )
+    )
+    assert zmfapi.batch(str(script)) is None
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert records == [
+        {"cmd": "audit", "ok": True, "result": None},
+        {
+            "cmd": "get-components",
+            "id": 2,
+            "ok": True,
+            "result": ZMF_RESP_COMP_OK["result"],
+        },
+    ]
+
+
+@responses.activate
+def test_batch_failure(zmfapi, tmp_path, capsys):
+    pytest.importorskip("yaml")
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "package/freeze",
+        json=ZMF_RESP_FREEZE_ERR,
+    )
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "package/audit",
+        json=ZMF_RESP_AUDIT_OK,
+    )
+    script = tmp_path / "script.yaml"
+    script.write_text(
+        "- cmd: freeze\n"
+        "  args: {package: APP 000001}\n"
+        "- cmd: unknown\n"
+        "- cmd: audit\n"
+        "  args: [APP 000001]\n"
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.batch(str(script))
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+    assert len(capsys.readouterr().out.splitlines()) == 1
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.batch(str(script), keep_going=True)
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+    records = [
+        json.loads(line)
+        for line in capsys.readouterr().out.split("\n")
+        if line
+    ]
+    assert [r["ok"] for r in records] == [False, False, True]
+    assert records[1]["exitCode"] == EXIT_CODE_BATCH_NOK
+
+
+@responses.activate
+def test_batch_stdin_yaml(zmfapi, monkeypatch, capsys):
+    pytest.importorskip("yaml")
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "package/audit",
+        json=ZMF_RESP_AUDIT_OK,
+    )
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO("- cmd: audit\n  args: [APP 000001]\n- cmd: daemon\n"),
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.batch("-", keep_going=True, format="yaml")
+    assert excinfo.value.code == EXIT_CODE_BATCH_NOK
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert [r["ok"] for r in records] == [True, False]
+    assert records[1]["error"] == "Unknown command 'daemon'"
+
+
+@responses.activate
+def test_batch_invalid_lines(zmfapi, monkeypatch, capsys):
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "package/audit",
+        json=ZMF_RESP_AUDIT_OK,
+    )
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO(
+            'not json\n["audit"]\n{"cmd": "audit", "args": ["APP 000001"]}\n'
+        ),
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.batch("-")
+    assert excinfo.value.code == EXIT_CODE_BATCH_NOK
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert len(records) == 1
+    assert records[0]["error"].startswith("Invalid JSON")
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO('not json\n["audit"]\n{"cmd": "audit"}\n'),
+    )
+    with pytest.raises(SystemExit):
+        zmfapi.batch("-", keep_going=True)
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert [r["ok"] for r in records] == [False, False, False]
+    assert records[1]["error"] == "Command is not an object: ['audit']"
+
+
+def test_batch_unknown_format(zmfapi):
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.batch("-", format="toml")
+    assert excinfo.value.code == EXIT_CODE_BATCH_NOK
+
+
+@responses.activate
+def test_get_package_fresh_search(tmp_path):
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_ttl=60,
+        cache_dir=str(tmp_path),
+    )
+    # another process creates the package after the first search
+    answers = [
+        {**ZMF_RESP_SEARCH_000007, "result": []},
+        ZMF_RESP_SEARCH_000007,
+    ]
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "package/search",
+        callback=lambda _: (200, {}, json.dumps(answers.pop(0))),
+        content_type="application/json",
+    )
+    assert zmfapi.search_package("APP", "fancy package title") is None
+    assert zmfapi.get_package("APP", "fancy package title") == "APP 000007"
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_cache(tmp_path):
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_ttl=60,
+        cache_dir=str(tmp_path),
+    )
+    responses.add(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_COMP_OK
+    )
+    responses.add(
+        responses.PUT, ZMF_REST_URL + "component/build", json=ZMF_RESP_BUILD_OK
+    )
+    for _ in range(2):
+        assert (
+            zmfapi.get_components("APP 000001") == ZMF_RESP_COMP_OK["result"]
+        )
+    assert len(responses.calls) == 1
+    zmfapi.get_components("APP 000002")
+    zmfapi.build("APP 000001", COMPONENTS)
+    zmfapi.get_components("APP 000001")
+    zmfapi.get_components("APP 000002")
+    assert [c.request.method for c in responses.calls] == [
+        "GET",
+        "GET",
+        "PUT",
+        "PUT",
+        "PUT",
+        "GET",
+    ]
+
+
+@responses.activate
+def test_package_index(tmp_path):
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_dir=str(tmp_path),
+        package_index=True,
+        index_ttl=0,
+    )
+    search_all = responses.add(
+        responses.GET,
+        ZMF_REST_URL + "package/search",
+        json=ZMF_RESP_SEARCH_000007,
+        match=[
+            responses.urlencoded_params_matcher(
+                {"package": "APP*", "packageTitle": "fancy package title"}
+            ),
+        ],
+    )
+    search_one = responses.add(
+        responses.GET,
+        ZMF_REST_URL + "package/search",
+        json={
+            **ZMF_RESP_SEARCH_000007,
+            "result": ZMF_RESP_SEARCH_000007["result"][1:2],
+        },
+        match=[
+            responses.urlencoded_params_matcher(
+                {
+                    "package": "APP 000007",
+                    "packageTitle": "fancy package title",
+                }
+            ),
+        ],
+    )
+    assert zmfapi.get_package(params=PKG_CONF_EXCL_ID) == "APP 000007"
+    assert zmfapi.get_package(params=PKG_CONF_EXCL_ID) == "APP 000007"
+    assert search_all.call_count == 1
+    assert search_one.call_count == 1
+
+    fresh = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_dir=str(tmp_path),
+        package_index=True,
+    )
+    assert fresh.get_package(params=PKG_CONF_EXCL_ID) == "APP 000007"
+    assert len(responses.calls) == 2
+
+    # a deleted package is dropped from the index
+    responses.add(
+        responses.DELETE, ZMF_REST_URL + "package", json=ZMF_RESP_XXXX_OK
+    )
+    responses.add(
+        responses.POST, ZMF_REST_URL + "package", json=ZMF_RESP_CREATE_000009
+    )
+    search_all = responses.replace(
+        responses.GET,
+        ZMF_REST_URL + "package/search",
+        json=ZMF_RESP_ERR_NO_INFO,
+        match=[
+            responses.urlencoded_params_matcher(
+                {"package": "APP*", "packageTitle": "fancy package title"}
+            ),
+        ],
+    )
+    zmfapi.delete_package("APP 000007")
+    zmfapi.delete_package("APP 000006")
+    assert zmfapi.get_package(params=PKG_CONF_EXCL_ID) == "APP 000009"
+    assert fresh.get_package(params=PKG_CONF_EXCL_ID) == "APP 000009"
+    assert search_all.call_count == 1
+
+
+@responses.activate
+def test_get_package_concurrent(tmp_path):
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_dir=str(tmp_path),
+    )
+
+    def search(request):
+        time.sleep(0.2)
+        return 200, {}, json.dumps(ZMF_RESP_ERR_NO_INFO)
+
+    responses.add_callback(
+        responses.GET, ZMF_REST_URL + "package/search", callback=search
+    )
+    responses.add(
+        responses.POST, ZMF_REST_URL + "package", json=ZMF_RESP_CREATE_000009
+    )
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                zmfapi.get_package(params=PKG_CONF_EXCL_ID)
+            )
+        )
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["APP 000009"] * 8
+    assert [c.request.method for c in responses.calls] == ["GET", "POST"]
+
+
+@responses.activate
+def test_get_components_stream(zmfapi):
+    responses.add(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_COMP_OK
+    )
+    records = zmfapi.get_components("APP 000001", stream=True)
+    assert not isinstance(records, list)
+    assert list(records) == ZMF_RESP_COMP_OK["result"]
+
+    responses.replace(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_ERR_NO_INFO
+    )
+    records = zmfapi.get_components("APP 000001", stream=True)
+    with pytest.raises(SystemExit) as excinfo:
+        list(records)
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+
+    responses.replace(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        status=requests.codes.bad_request,
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.get_components("APP 000001", stream=True)
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+
+
+@responses.activate
+def test_get_components_output(zmfapi, capsys):
+    responses.add(
+        responses.GET, ZMF_REST_URL + "component", json=ZMF_RESP_COMP_OK
+    )
+    assert zmfapi.get_components("APP 000001", output="ndjson") is None
+    out = capsys.readouterr().out
+    assert [json.loads(line) for line in out.splitlines()] == (
+        ZMF_RESP_COMP_OK["result"]
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.get_package_list("APP 000001", output="xml")
+    assert excinfo.value.code == 1
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_download_package(zmfapi, tmp_path):
+    components = [
+        {"component": "APPB0001", "componentType": "SRB", "setssi": "A"},
+        {"component": "APPI0001", "componentType": "CPY", "setssi": "B"},
+    ]
+
+    def browse(request):
+        params = dict(parse_qsl(request.body))
+        body = "source of " + params["component"]
+        return (
+            200,
+            {
+                "Content-Disposition": "attachment;filename="
+                + params["component"]
+            },
+            body,
+        )
+
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=lambda request: (
+            200,
+            {},
+            json.dumps({**ZMF_RESP_COMP_OK, "result": components}),
+        ),
+        content_type="application/json",
+    )
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component/browse",
+        callback=browse,
+        content_type="text/plain",
+    )
+    dest = tmp_path / "APP 000001"
+    result = zmfapi.download_package("APP 000001", str(dest), parallel=2)
+    assert result == {"downloaded": 2, "bytes": 36, "skipped": 0}
+    srb = dest / "SRB" / "APPB0001.srb"
+    assert srb.read_text() == "source of APPB0001"
+    assert (dest / "CPY" / "APPI0001.cpy").read_text() == "source of APPI0001"
+    assert (dest / ".zmf-manifest.json").exists()
+
+    result = zmfapi.download_package("APP 000001", str(dest))
+    assert result == {"downloaded": 0, "bytes": 0, "skipped": 2}
+
+    srb.write_text("changed locally")
+    components[1]["setssi"] = "C"
+    result = zmfapi.download_package("APP 000001", str(dest))
+    assert result == {"downloaded": 2, "bytes": 36, "skipped": 0}
+    assert srb.read_text() == "source of APPB0001"
+    result = zmfapi.download_package("APP 000001", str(dest), force=True)
+    assert result["downloaded"] == 2
+
+
+@responses.activate
+def test_checkin_unwritable_cache(tmp_path, monkeypatch, caplog):
+    cache = tmp_path / "cache"
+    cache.write_text("not a directory")
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_dir=str(cache),
+    )
+    checkin = responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        json=ZMF_RESP_XXXX_OK,
+    )
+    assert zmfapi.checkin("APP 000000", "U000000.LIB", COMPONENTS) is None
+    assert checkin.call_count == 3
+    assert "manifest" not in caplog.text
+    monkeypatch.chdir(tmp_path)
+    zmfapi.checkin("APP 000000", "U000000.LIB", COMPONENTS, incremental=True)
+    assert checkin.call_count == 6
+    assert "Checkin manifest not saved" in caplog.text
+
+
+@responses.activate
+def test_checkin_incremental_changed_meanwhile(zmfapi, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / COMPONENTS[0]
+    path.parent.mkdir(parents=True)
+    path.write_text("source")
+
+    def checkin(request):
+        # edited while the checkin runs
+        path.write_text("edited source")
+        return 200, {}, json.dumps(ZMF_RESP_XXXX_OK)
+
+    responses.add_callback(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        callback=checkin,
+        content_type="application/json",
+    )
+    for _ in range(2):
+        zmfapi.checkin(
+            "APP 000000", "U000000.LIB", COMPONENTS[:1], incremental=True
+        )
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_checkin_incremental(tmp_path, monkeypatch):
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_dir=str(tmp_path / "cache"),
+    )
+    monkeypatch.chdir(tmp_path)
+    for comp in COMPONENTS:
+        path = tmp_path / comp
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("source of " + path.stem)
+    checkin = responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        json=ZMF_RESP_XXXX_OK,
+    )
+
+    zmfapi.checkin("APP 000000", "U000000.LIB", COMPONENTS, incremental=True)
+    assert checkin.call_count == 3
+    zmfapi.checkin("APP 000000", "U000000.LIB", COMPONENTS, incremental=True)
+    assert checkin.call_count == 3
+    (tmp_path / COMPONENTS[1]).write_text("changed")
+    zmfapi.checkin("APP 000000", "U000000.LIB", COMPONENTS, incremental=True)
+    assert checkin.call_count == 4
+    # other source library
+    zmfapi.checkin("APP 000000", "U000000.LIB2", COMPONENTS, incremental=True)
+    assert checkin.call_count == 7
+    # other package
+    zmfapi.checkin("APP 000001", "U000000.LIB2", COMPONENTS, incremental=True)
+    assert checkin.call_count == 10
+
+    responses.add(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        json={
+            **ZMF_RESP_COMP_OK,
+            "result": [
+                {
+                    "component": Path(c).stem,
+                    "componentType": Path(c).parent.name,
+                }
+                for c in COMPONENTS[1:]
+            ],
+        },
+    )
+    zmfapi.checkin(
+        "APP 000001",
+        "U000000.LIB2",
+        COMPONENTS,
+        incremental=True,
+        verify=True,
+    )
+    assert checkin.call_count == 11
+    assert dict(parse_qsl(responses.calls[-1].request.body)) == {
+        "package": "APP 000001",
+        "chkInSourceLocation": "1",
+        "sourceStorageMeans": "6",
+        "componentType": "CPY",
+        "sourceLib": "U000000.LIB2.CPY",
+        "targetComponent": "APPI0001",
+    }
+
+
+@responses.activate
+def test_delta(zmfapi, monkeypatch):
+    monkeypatch.setattr(
+        "zmfcli.gitdiff.git_changes",
+        lambda since, range: (COMPONENTS[:2], ["src/SRB/APPB0009.srb"]),
+    )
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/scratch",
+        json=ZMF_RESP_XXXX_OK,
+    )
+    responses.add(
+        responses.PUT,
+        ZMF_REST_URL + "component/checkin",
+        json=ZMF_RESP_XXXX_OK,
+    )
+    responses.add(
+        responses.PUT, ZMF_REST_URL + "component/build", json=ZMF_RESP_BUILD_OK
+    )
+    assert zmfapi.delta("APP 000001", "U000000.LIB", since="main") == {
+        "changed": COMPONENTS[:2],
+        "deleted": ["src/SRB/APPB0009.srb"],
+    }
+    assert [c.request.url.rpartition("/")[2] for c in responses.calls] == [
+        "scratch",
+        "checkin",
+        "checkin",
+        "build",
+        "build",
+    ]
+    responses.calls.reset()
+    fire.Fire(
+        zmfapi,
+        command=["delta", "APP 000001", "U000000.LIB", "--since", "main"]
+        + ["--build", "false"],
+    )
+    assert "build" not in [
+        c.request.url.rpartition("/")[2] for c in responses.calls
+    ]
+
+
+@responses.activate
+def test_build_jobs():
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        build_jobs=2,
+    )
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+    submitted = []
+
+    def build(request):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        params = parse_qsl(request.body)
+        with lock:
+            active[0] -= 1
+            submitted.append(
+                [v for k, v in params if k in ("componentType", "component")]
+            )
+        return 200, {}, json.dumps(ZMF_RESP_BUILD_OK)
+
+    responses.add_callback(
+        responses.PUT,
+        ZMF_REST_URL + "component/build",
+        callback=build,
+        content_type="application/json",
+    )
+    components = COMPONENTS + ["src/SRB/APPB0003.srb"]
+    assert zmfapi.build("APP 000000", components, chunk_size=2) is None
+    assert sorted(submitted) == [
+        ["CPY", "APPI0001"],
+        ["SRB", "APPB0001", "APPB0002"],
+        ["SRB", "APPB0003"],
+        ["SRE", "APPE0001", "APPE0002"],
+    ]
+    assert peak[0] == 2
+
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr("zmfcli.wait.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("zmfcli.wait.time.sleep", sleep)
+    return now
+
+
+def component_polls(*states):
+    """Callback answering component lists, the last one repeatedly"""
+    polls = list(states)
+
+    def callback(request):
+        result = polls.pop(0) if len(polls) > 1 else polls[0]
+        return 200, {}, json.dumps({**ZMF_RESP_COMP_OK, "result": result})
+
+    return callback
+
+
+def comp(name, comp_type, status, setssi="A"):
+    return {
+        "component": name,
+        "componentType": comp_type,
+        "componentStatus": status,
+        "setssi": setssi,
+    }
+
+
+@responses.activate
+def test_wait_for(zmfapi, no_wait):
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=component_polls(
+            [
+                comp("APPB0001", "SRB", "6 - Incomplete"),
+                comp("APPE0001", "SRE", "6 - Incomplete"),
+                comp("APPX0001", "SRE", "5 - Inactive"),
+            ],
+            [
+                comp("APPB0001", "SRB", "0 - Active"),
+                comp("APPE0001", "SRE", "6 - Incomplete"),
+                comp("APPX0001", "SRE", "5 - Inactive"),
+            ],
+            [
+                comp("APPB0001", "SRB", "0 - Active"),
+                comp("APPE0001", "SRE", "0 - Active"),
+                comp("APPX0001", "SRE", "5 - Inactive"),
+            ],
+        ),
+        content_type="application/json",
+    )
+    assert zmfapi.wait_for("APP 000001") == {
+        "APPB0001.srb": "0 - Active",
+        "APPE0001.sre": "0 - Active",
+    }
+    assert len(responses.calls) == 3
+    assert zmfapi.wait_for(
+        "APP 000001", ["APPE0001", "src/SRB/APPB0001.srb"]
+    ) == {
+        "APPE0001.sre": "0 - Active",
+        "APPB0001.srb": "0 - Active",
+    }
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.wait_for(
+            "APP 000001", ["APPE0001"], status="Frozen", timeout=60
+        )
+    assert excinfo.value.code == 4
+    assert no_wait[0] >= 60
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.wait_for("APP 000001", ["APPE0001"], "Frozen", failed="Active")
+    assert excinfo.value.code == EXIT_CODE_ZMF_NOK
+
+
+@responses.activate
+def test_wait_for_failed_poll(zmfapi, no_wait, caplog):
+    answers = [ZMF_RESP_ERR_NO_INFO] * 3 + [
+        {
+            **ZMF_RESP_COMP_OK,
+            "result": [comp("APPB0001", "SRB", "7 - Promoted")],
+        }
+    ]
+
+    def component(request):
+        answer = answers.pop(0) if len(answers) > 1 else answers[0]
+        return 200, {}, json.dumps(answer)
+
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=component,
+        content_type="application/json",
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        zmfapi.wait_for("APP 000001", status="Promoted", timeout=1)
+    assert excinfo.value.code == 4
+    assert "waiting for components of APP 000001" in caplog.text
+    assert zmfapi.wait_for("APP 000001", status="Promoted") == {
+        "APPB0001.srb": "7 - Promoted"
+    }
+
+
+@responses.activate
+def test_wait_for_deadline(zmfapi, no_wait, caplog):
+    answer = component_polls([comp("APPB0001", "SRB", "6 - Incomplete")])
+
+    def slow_poll(request):
+        # the response arrives after the deadline
+        no_wait[0] += 31
+        return answer(request)
+
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=slow_poll,
+        content_type="application/json",
+    )
+    with command_deadline(30), pytest.raises(SystemExit) as excinfo:
+        zmfapi.wait_for("APP 000001", timeout=60)
+    assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+    assert "Deadline of 30s exceeded waiting for APPB0001.srb" in caplog.text
+
+
+@responses.activate
+def test_build_wait(zmfapi, no_wait):
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=component_polls(
+            # before the build
+            [comp("APPB0001", "SRB", "0 - Active")],
+            [comp("APPB0001", "SRB", "0 - Active")],
+            [comp("APPB0001", "SRB", "0 - Active", setssi="B")],
+        ),
+        content_type="application/json",
+    )
+    responses.add(
+        responses.PUT, ZMF_REST_URL + "component/build", json=ZMF_RESP_BUILD_OK
+    )
+    assert zmfapi.build("APP 000001", ["src/SRB/APPB0001.srb"], wait=True) == {
+        "APPB0001.srb": "0 - Active"
+    }
+    assert [c.request.method for c in responses.calls] == [
+        "GET",
+        "PUT",
+        "GET",
+        "GET",
+    ]
+
+
+@pytest.mark.parametrize(
+    "statuses, calls",
+    [("503", 2), ("502,503", 2), ("[502, 503]", 2)] + [("429", 1)],
+)
+@responses.activate
+def test_cli_retry_statuses(statuses, calls, monkeypatch, capsys):
+    monkeypatch.setattr("zmfcli.session.time.sleep", lambda s: None)
+    url = ZMF_REST_URL + "component"
+    responses.add(responses.GET, url, status=503)
+    responses.add(responses.GET, url, json=ZMF_RESP_COMP_OK)
+    argv = ["--user", "U000000", "--password", "Pa$$w0rd"]
+    argv += ["--url", ZMF_REST_URL, "--retries", "1"]
+    argv += ["--retry-statuses", statuses]
+    argv += ["get-components", "APP 000000"]
+    if calls == 1:
+        with pytest.raises(SystemExit) as excinfo:
+            fire.Fire(ChangemanZmf, command=argv)
+        assert excinfo.value.code == EXIT_CODE_REQUEST_NOK
+    else:
+        assert fire.Fire(ChangemanZmf, command=argv) is not None
+    assert len(responses.calls) == calls
+
+
+@responses.activate
+def test_deadline_per_command(tmp_path):
+    zmfapi = ChangemanZmf(
+        user="U000000",
+        password="Pa$$w0rd",
+        url=ZMF_REST_URL,
+        cache_dir=str(tmp_path),
+        deadline="50ms",
+    )
+    seen = []
+
+    def component(request):
+        seen.append(request.req_kwargs["timeout"])
+        return 200, {}, json.dumps(ZMF_RESP_COMP_OK)
+
+    responses.add_callback(
+        responses.GET,
+        ZMF_REST_URL + "component",
+        callback=component,
+        content_type="application/json",
+    )
+    time.sleep(0.1)
+    assert zmfapi.get_components("APP 000000") is not None
+    thread = threading.Thread(
+        target=lambda: zmfapi.get_components("APP 000000")
+    )
+    thread.start()
+    thread.join()
+    assert len(seen) == 2
+    assert all(0 < t[1] <= 0.05 for t in seen)
+    assert current_deadline() is None